@@ -0,0 +1,73 @@
+"""
+Import-time benchmark of the CLI, per mode.
+
+Each mode's imports run in fresh interpreters (nothing cached in sys.modules); the
+table shows the median import time and which heavy dependencies got loaded. With
+--max-ms, exits non-zero when a mode exceeds its budget, so it can guard against
+an eager import creeping back in.
+
+Run from the repository root:
+    python -m benchmarks.bench_import_time [--runs 7] [--max-ms 400]
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+# Modules each mode imports (see src/main.py)
+MODES: Dict[str, List[str]] = {
+    "cli startup": ["src.main"],
+    "rag_preparation": ["src.main", "src.services.fhir_to_summary", "src.utils.load_save"],
+    "batch": ["src.main", "src.services.batch_inference", "src.services.parallel_conversion",
+              "src.utils.llm_utils"],
+    "pre-defined / generate": ["src.main", "src.utils.bedrock_client", "src.services.generation",
+                               "src.services.text_to_json", "src.services.parallel_conversion"],
+    "pipeline": ["src.main", "src.utils.bedrock_client", "src.services.pipeline"],
+}
+
+# Dependencies that should only be loaded when actually used
+HEAVY_MODULES = ("boto3", "botocore", "requests", "fhir.resources", "aiohttp")
+
+_PROBE = """
+import sys, json, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+heavy = sorted({{m for m in sys.modules for h in {heavy!r} if m == h or m.startswith(h + ".")}} & set({heavy!r}))
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure(modules: List[str], runs: int) -> Tuple[float, List[str]]:
+    """Median import time (ms) of `modules` over `runs` fresh interpreters, and the heavy modules loaded."""
+    times, heavy = [], []
+    code = _PROBE.format(modules=modules, heavy=HEAVY_MODULES)
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        times.append(result["seconds"] * 1000)
+        heavy = result["heavy"]
+    return statistics.median(times), heavy
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7, help="Interpreters per mode")
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail if a mode imports slower than this")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'mode':<24} {'import (ms)':>12}  heavy modules loaded")
+    for mode, modules in MODES.items():
+        median_ms, heavy = measure(modules, args.runs)
+        over = args.max_ms is not None and median_ms > args.max_ms
+        failed |= over
+        print(f"{mode:<24} {median_ms:>12.1f}  {', '.join(heavy) or '-'}{'  << over budget' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Micro-benchmarks of `extract_json_block` against the previous regex implementation.
+
+Run from the repository root:
+    python -m benchmarks.bench_json_extract
+"""
+import re
+import json
+import logging
+import timeit
+from typing import Any, Callable, Dict
+
+from pydantic_core import from_json
+
+from src.utils.llm_utils import _CONTROL_CHARS_RE, extract_json_block
+
+logging.getLogger("src.utils.llm_utils").setLevel(logging.CRITICAL)
+
+
+# --- Previous implementation (regex scans + global literal rewrite) ---
+
+def _legacy_extract_json_value(raw: str) -> str:
+    m = re.search(r"\{.*\}", raw, re.S)
+    if m:
+        return m.group(0)
+    m = re.search(r"\[.*\]", raw, re.S)
+    if m:
+        return m.group(0)
+    m = re.search(r'\b(true|false|null)\b', raw, re.IGNORECASE)
+    if m:
+        return m.group(0)
+    m = re.search(r'\b\d+(?:\.\d+)?\b', raw)
+    if m:
+        return m.group(0)
+    m = re.search(r'"[^"]*"', raw)
+    if m:
+        return m.group(0)
+
+
+def _legacy_normalize_llm_json(text: str) -> str:
+    text = re.sub(r'\bNone\b', 'null', text)
+    text = re.sub(r'\bTrue\b', 'true', text)
+    text = re.sub(r'\bFalse\b', 'false', text)
+    return text
+
+
+def legacy_extract_json_block(raw: str) -> Any:
+    cleaned = raw.replace("```json", "").replace("```", "")
+    cleaned = _legacy_extract_json_value(cleaned)
+    cleaned = _CONTROL_CHARS_RE.sub("", cleaned)
+    return from_json(_legacy_normalize_llm_json(cleaned))
+
+
+# --- Inputs ---
+
+def _encounter(i: int) -> Dict[str, Any]:
+    return {
+        "date": f"2023-01-{i % 28 + 1:02d}",
+        "type": "outpatient",
+        "reason": "Follow-up visit {routine}",
+        "diagnoses": [{"name": "Type 2 diabetes mellitus", "status": "confirmed"}],
+        "vitals": [{"name": "Blood pressure", "value": "130/85", "unit": "mmHg"}],
+        "labs": [{"name": "HbA1c", "value": 7.2, "unit": "%", "interpretation": None}],
+        "notes": "None reported; patient True to plan",
+    }
+
+
+def _output(encounters: int) -> str:
+    body = json.dumps({
+        "patient": {"name": "Jane Doe", "gender": "female", "birth_date": "1970-05-01"},
+        "encounters": [_encounter(i) for i in range(encounters)],
+    }, indent=2).replace("null", "None")
+    return f"Here is the extracted data:\n```json\n{body}\n```\nLet me know if you need anything else."
+
+
+INPUTS = {
+    "small (1 encounter)": _output(1),
+    "large (200 encounters)": _output(200),
+    "trailing prose with braces": _output(20) + " {see notes} " * 200,
+    "unbalanced '{' run (4k)": "{" * 4000,
+}
+
+
+def bench(func: Callable[[str], Any], raw: str) -> float:
+    def run():
+        try:
+            func(raw)
+        except Exception:
+            pass
+    number, _ = timeit.Timer(run).autorange()
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return best / number * 1e6
+
+
+def main() -> None:
+    print(f"{'input':<30} {'size':>8} {'legacy (us)':>12} {'current (us)':>13} {'speedup':>8}")
+    for label, raw in INPUTS.items():
+        legacy = bench(legacy_extract_json_block, raw)
+        current = bench(extract_json_block, raw)
+        print(f"{label:<30} {len(raw):>8} {legacy:>12.1f} {current:>13.1f} {legacy / current:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
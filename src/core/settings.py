@@ -9,14 +9,51 @@ DEFAULT_TEMPERATURE = float(os.getenv("DEFAULT_TEMPERATURE", "0.3"))
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "3000"))
 BEDROCK_ROLE_ARN = os.getenv("BEDROCK_ROLE_ARN", "arn:aws:iam::338861521122:role/BedrockBatchExecutionRole-us-east-1")
 
+# Client pool and retries; the pool size is raised to the number of workers in main.py
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv("BEDROCK_MAX_POOL_CONNECTIONS", "10"))
+BEDROCK_MAX_ATTEMPTS = int(os.getenv("BEDROCK_MAX_ATTEMPTS", "5"))
+BEDROCK_READ_TIMEOUT = int(os.getenv("BEDROCK_READ_TIMEOUT", "300"))
+BEDROCK_THROTTLE_RETRIES = int(os.getenv("BEDROCK_THROTTLE_RETRIES", "6"))
+BEDROCK_BACKOFF_BASE = float(os.getenv("BEDROCK_BACKOFF_BASE", "2"))
+BEDROCK_BACKOFF_MAX = float(os.getenv("BEDROCK_BACKOFF_MAX", "60"))
+
+# LLM response cache: "off", "read-write" or "read-only" (replay without calling Bedrock)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "data/cache/llm")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(1024 ** 3)))
+
+# Batch inference (mode "batch"): S3 prefix for job input/output and polling
+BATCH_S3_URI = os.getenv("BATCH_S3_URI")
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "60"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", str(24 * 3600)))
+
 # ==== Prompt building ====
 PROMPT_TEMPERATURE = 0.3
 PROMPT_TOP_P = 0.7
 PROMPT_MAX_TOKENS = 3000
 
+# Continuation of answers cut off at maxTokens: extra requests per answer and their output budget
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", "2"))
+CONTINUATION_MAX_TOKENS = int(os.getenv("CONTINUATION_MAX_TOKENS", "1000"))
+
+# Bedrock prompt caching of the static prompt prefix (schema and instructions), on models that support it
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PROMPT_CACHE_MODELS = [m.strip() for m in os.getenv("PROMPT_CACHE_MODELS", "anthropic.claude,amazon.nova").split(",") if m.strip()]
+
+# Tool-use extraction: model ID fragments of models that accept a forced toolChoice
+TOOL_CHOICE_MODELS = [m.strip() for m in os.getenv("TOOL_CHOICE_MODELS", "anthropic.,mistral.mistral-large").split(",") if m.strip()]
+
+# Chunked extraction: output budget per segment and concurrent segment requests per case
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "1500"))
+CHUNK_MAX_WORKERS = int(os.getenv("CHUNK_MAX_WORKERS", "4"))
+
 GENERATION_PROMPT_TEMPERATURE = 0.9
 GENERATION_PROMPT_TOP_P = 0.9
 
+# Multi-case generation: output budget per requested case, capped per call
+GENERATION_CASE_MAX_TOKENS = int(os.getenv("GENERATION_CASE_MAX_TOKENS", "1000"))
+GENERATION_BATCH_MAX_TOKENS = int(os.getenv("GENERATION_BATCH_MAX_TOKENS", "8192"))
+
 # ==== AWS Settings ====
 AWS_KEY = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET = os.getenv('AWS_SECRET_ACCESS_KEY')
@@ -30,6 +67,36 @@ BIOPORTAL_API_KEY = os.getenv("BIOPORTAL_API_KEY")
 LOINC_PASSWORD = os.getenv("LOINC_PASSWORD")
 LOINC_USERNAME = os.getenv("LOINC_USER")
 
+# ==== Terminology lookup ====
+# Backends tried in order: "local" (memory-mapped release indexes), "remote" (NLM / BioPortal APIs)
+TERMINOLOGY_BACKENDS = [b.strip() for b in os.getenv("TERMINOLOGY_BACKENDS", "local,remote").split(",") if b.strip()]
+LOCAL_TERMINOLOGY_INDEXES = {
+    "loinc": os.getenv("LOINC_INDEX_PATH", "data/terminology/loinc.idx"),
+    "snomed": os.getenv("SNOMED_INDEX_PATH", "data/terminology/snomed.idx"),
+}
+# Worker pool used to resolve all terms of a case in one bulk step
+TERMINOLOGY_MAX_WORKERS = int(os.getenv("TERMINOLOGY_MAX_WORKERS", "8"))
+
+# Remote API client: async bulk resolution, timeouts, retries with jittered exponential backoff
+TERMINOLOGY_ASYNC = os.getenv("TERMINOLOGY_ASYNC", "true").lower() == "true"
+TERMINOLOGY_MAX_CONCURRENCY = int(os.getenv("TERMINOLOGY_MAX_CONCURRENCY", "16"))
+TERMINOLOGY_REQUEST_TIMEOUT = float(os.getenv("TERMINOLOGY_REQUEST_TIMEOUT", "10"))
+TERMINOLOGY_MAX_RETRIES = int(os.getenv("TERMINOLOGY_MAX_RETRIES", "5"))
+TERMINOLOGY_BACKOFF_BASE = float(os.getenv("TERMINOLOGY_BACKOFF_BASE", "0.5"))
+TERMINOLOGY_BACKOFF_MAX = float(os.getenv("TERMINOLOGY_BACKOFF_MAX", "30"))
+
+# ==== Terminology cache ====
+TERMINOLOGY_CACHE_ENABLED = os.getenv("TERMINOLOGY_CACHE_ENABLED", "true").lower() == "true"
+TERMINOLOGY_CACHE_PATH = os.getenv("TERMINOLOGY_CACHE_PATH", "data/cache/terminology.sqlite")
+TERMINOLOGY_CACHE_TTL = float(os.getenv("TERMINOLOGY_CACHE_TTL", str(30 * 24 * 3600)))
+TERMINOLOGY_CACHE_NEGATIVE_TTL = float(os.getenv("TERMINOLOGY_CACHE_NEGATIVE_TTL", str(24 * 3600)))
+TERMINOLOGY_CACHE_MAX_ENTRIES = int(os.getenv("TERMINOLOGY_CACHE_MAX_ENTRIES", "100000"))
+
+# ==== FHIR serialization ====
+# Bundles are serialized from plain dicts; a sample is also validated with fhir.resources
+FHIR_STRICT_VALIDATION = os.getenv("FHIR_STRICT_VALIDATION", "false").lower() == "true"
+FHIR_VALIDATION_SAMPLE_RATE = float(os.getenv("FHIR_VALIDATION_SAMPLE_RATE", "0.05"))
+
 # ==== Logging ====
 LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
\ No newline at end of file
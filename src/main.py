@@ -4,17 +4,21 @@ import yaml
 from pathlib import Path
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 
-import boto3
+import atexit
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from src.core import settings
-from src.services.generation import generate_case
-from src.services.text_to_json import process_patient_records
-from src.utils.load_save import save_generated_case, save_patient_summary
-from src.services.json_to_fhir import to_fhir_bundle
-from src.services.fhir_to_summary import process_fhir_bundle
+from datetime import datetime
+from src.utils.llm_cache import LLMCacheMiss, configure_llm_cache
 from src.utils.load_save import load_config
+from src.utils.manifest import MANIFEST_NAME, ConversionManifest, case_input_hash
+from src.utils.ndjson_writer import NDJSONWriterPool
 import logging
 
+# Mode-specific modules (boto3, fhir.resources, the LLM services, ...) are imported in
+# the mode that uses them, so that e.g. "rag_preparation" does not pay for Bedrock.
+
 logging.basicConfig(
     level=settings.LOG_LEVEL,
     format=settings.LOG_FORMAT,
@@ -22,64 +26,253 @@ logging.basicConfig(
 
 logger = logging.getLogger("fhir_agent")
 
+
+def process_case(case: dict, disease_dir: Path, client, extraction: str = "converse",
+                 pre_extraction: bool = False, ndjson: NDJSONWriterPool = None, on_written=None) -> Path:
+    """
+    Run the LLM extraction and FHIR conversion for a single case.
+
+    Args:
+        case (dict): Case entry with "id" and "text".
+        disease_dir (Path): Output directory of the case's disease.
+        client (boto3.client): Bedrock runtime client.
+        extraction (str): "converse", "stream" to resolve terms while the output is generated,
+            "chunked" to extract record segments in parallel, or "tool" for structured tool-use output.
+        pre_extraction (bool): Pre-extract vital signs and lab results with rules ("converse" only).
+        ndjson (NDJSONWriterPool): Append the resources to the disease's NDJSON export instead
+            of writing a bundle file.
+        on_written (Callable[[Path], None]): Called with the output path once it is on disk
+            (with `ndjson`, when the export flushes the case).
+    Returns:
+        Path: Path of the saved FHIR bundle (of the NDJSON export directory with `ndjson`).
+    """
+    from src.services.json_to_fhir import TermPrefetcher, to_fhir_bundle
+    from src.services.text_to_json import extract_patient_data
+
+    case_id = case["id"]
+    logger.info(f"Processing {disease_dir.name} - {case_id}")
+
+    # Run your LLM pipeline on the case text
+    prefetcher = TermPrefetcher() if extraction == "stream" else None
+    llm_output = extract_patient_data(case["text"], client, settings.MODEL_ID, logger, extraction=extraction,
+                                      pre_extraction=pre_extraction, on_fragment=prefetcher)
+
+    return to_fhir_bundle(llm_output, case_id, disease_dir, codes=prefetcher.result() if prefetcher else None,
+                          ndjson=ndjson.writer(disease_dir) if ndjson else None, on_written=on_written)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Converter Patient data to FHIR")
     parser.add_argument("--config", type=Path, default=Path("config.yaml"),
                         help="Path to YAML config file")
-
-    session = boto3.Session(
-        aws_access_key_id=settings.AWS_KEY,
-        aws_secret_access_key=settings.AWS_SECRET,
-        region_name=settings.AWS_REGION,
-    )
-    logger.info("AWS session initialized")
-
-    client = session.client("bedrock-runtime")
-    logger.info("Bedrock client created")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of cases processed concurrently (overrides `workers` in the config)")
 
     args = parser.parse_args()
 
     config = load_config(args.config)
+    workers = max(args.workers or config.get("workers", 1), 1)
+    # LLM_CACHE_MODE, when set, takes precedence over the config file
+    if "llm_cache" in config and "LLM_CACHE_MODE" not in os.environ:
+        configure_llm_cache(config["llm_cache"])
+
+    # NDJSON bulk output: resources are buffered and appended to <output_dir>/<disease>/<resourceType>.ndjson
+    ndjson_pool = None
+    if config.get("output_format", "bundle") == "ndjson":
+        ndjson_pool = NDJSONWriterPool(compress=config.get("ndjson_gzip", False))
+        atexit.register(ndjson_pool.close)
+        ndjson_pool.recover(Path(config["output_dir"]))
+
+    # Processes converting available LLM outputs to FHIR (0: one per CPU)
+    conversion_workers = config.get("conversion_workers", 1) or os.cpu_count()
 
     mode = config["mode"]
     logger.info(f"Mode: {mode}")
     if mode == 'rag_preparation':
+        from src.services.fhir_to_summary import summarize_output_dir
+        from src.utils.load_save import SummaryWriter
+
         fhir_base_dir = Path(config["output_dir"])
+        summary_workers = config.get("summary_workers", 1) or os.cpu_count()
+
+        # Bundles are streamed; files with concatenated bundles give one summary each
+        with SummaryWriter(fhir_base_dir) as writer:
+            for case_file, patient_info in summarize_output_dir(fhir_base_dir, workers=summary_workers):
+                writer.write(patient_info, case_file)
+
+    if mode == "batch":
+        from src.services.batch_inference import (BedrockBatchRunner, LocalBatchRunner, build_batch_records,
+                                                  run_batch, split_record_id)
+        from src.services.parallel_conversion import convert_cases
+        from src.utils.llm_utils import extract_json_block
 
-        for fhir_file in fhir_base_dir.rglob("*.json"):
+        batch_config = config.get("batch", {})
+        cases = load_config(Path(config["cases_file"]))
+        output_dir = Path(config["output_dir"])
+        work_dir = Path(batch_config.get("work_dir", "data/batch"))
+
+        if batch_config.get("runner", "bedrock") == "local":
+            runner = LocalBatchRunner(work_dir / "jobs")
+        else:
+            from src.utils.bedrock_client import create_aws_session
+            aws_session = create_aws_session()
+            runner = BedrockBatchRunner(
+                aws_session.client("bedrock"),
+                aws_session.client("s3"),
+                batch_config.get("s3_uri", settings.BATCH_S3_URI),
+                settings.MODEL_ID,
+            )
+
+        outputs = run_batch(
+            runner,
+            build_batch_records(cases, settings.MODEL_ID),
+            work_dir,
+            job_name=f"fhir-extraction-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            poll_interval=batch_config.get("poll_interval", settings.BATCH_POLL_INTERVAL),
+        )
 
-            patient_info = process_fhir_bundle(fhir_file, logger)
-            save_patient_summary(patient_info, fhir_file, fhir_base_dir)
+        items = []
+        for record_id, raw_text in outputs.items():
+            disease, case_id = split_record_id(record_id)
+            try:
+                items.append((disease, case_id, extract_json_block(raw_text)))
+            except ValueError:
+                logger.error(f"Skipping {disease} - {case_id}: unparsable batch output")
 
+        converted = convert_cases(items, output_dir, workers=conversion_workers, ndjson=ndjson_pool)
+        logger.info(f"Saved FHIR output of {len(converted)}/{len(items)} cases")
+
+    pipeline_config = config.get("pipeline", {})
     if mode in ["generate", "pre-defined"]:
+        from src.utils.bedrock_client import LazyClient, create_bedrock_client
+
+        # Pipeline mode: the generate and extract stages call Bedrock concurrently
+        pipeline_concurrency = pipeline_config.get("concurrency") or {}
+        bedrock_workers = max(workers, pipeline_concurrency.get("generate", 0) + pipeline_concurrency.get("extract", 0))
+        # Created on the first Bedrock call: never in LLM cache replay mode
+        client = LazyClient(lambda: create_bedrock_client(
+            max_pool_connections=max(bedrock_workers, settings.BEDROCK_MAX_POOL_CONNECTIONS)))
+
+    # Incremental conversion: cases whose input did not change since their last conversion are skipped
+    manifest = None
+    if mode in ["generate", "pre-defined"] and config.get("incremental", True):
+        manifest = ConversionManifest(Path(config["output_dir"]) / MANIFEST_NAME)
+
+    extraction = config.get("extraction", "converse")
+    pre_extraction = config.get("pre_extraction", False)
+    # Pre-extracted values are only passed to the single-call "converse" extraction
+    if pre_extraction and extraction != "converse":
+        logger.warning(f"pre_extraction has no effect with \"{extraction}\" extraction; ignoring it")
+        pre_extraction = False
 
+    if mode in ["generate", "pre-defined"] and pipeline_config.get("enabled", False):
+        from src.services.pipeline import CasePipeline, DEFAULT_QUEUE_SIZE, case_jobs, generation_jobs, run_pipeline
+
+        cases_file = Path(config["cases_file"])
+        jobs = case_jobs(load_config(cases_file) if cases_file.exists() else {})
         if mode == "generate":
-            for disease_entry in config["diseases"]:
-                disease = disease_entry["name"]
-                num_gen = disease_entry.get("num_generation", 1)
+            jobs += generation_jobs(config["diseases"], max(1, config.get("generation_batch_size", 1)))
 
-                for i in range(num_gen):
-                    logger.info(f"Generating case {i + 1} for {disease}...")
-                    case_text = generate_case(disease, client, settings.MODEL_ID, logger)
-                    if case_text:
-                        save_generated_case(disease, case_text, config["cases_file"])
+        pipeline = CasePipeline(
+            client,
+            settings.MODEL_ID,
+            Path(config["output_dir"]),
+            cases_file=config["cases_file"],
+            extraction=extraction,
+            pre_extraction=pre_extraction,
+            concurrency=pipeline_config.get("concurrency"),
+            queue_size=pipeline_config.get("queue_size", DEFAULT_QUEUE_SIZE),
+            manifest=manifest,
+            ndjson=ndjson_pool,
+        )
+        paths = run_pipeline(pipeline, jobs)
+        logger.info(f"Saved {len(paths)} FHIR bundles")
 
-        cases = load_config(Path(config["cases_file"]))
-        output_dir = Path(config["output_dir"])
-        # Process all diseases and cases
-        for disease, case_list in cases.items():
-            disease_dir = output_dir / disease
-            disease_dir.mkdir(parents=True, exist_ok=True)
+    elif mode in ["generate", "pre-defined"]:
+        from src.services.generation import generate_cases
+        from src.services.json_to_fhir import converter_fingerprint
+        from src.services.parallel_conversion import convert_cases
+        from src.services.text_to_json import extract_patient_data
+        from src.utils.load_save import save_generated_case
+
+        # Results are consumed in submission order, so saved cases and logs do not depend on scheduling
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            if mode == "generate":
+                batch_size = max(1, config.get("generation_batch_size", 1))
+                for disease_entry in config["diseases"]:
+                    disease = disease_entry["name"]
+                    num_gen = disease_entry.get("num_generation", 1)
+
+                    logger.info(f"Generating {num_gen} case(s) for {disease}...")
+                    generated = executor.map(
+                        lambda start: generate_cases(disease, min(batch_size, num_gen - start), client,
+                                                     settings.MODEL_ID, logger, variant=start),
+                        range(0, num_gen, batch_size)
+                    )
+                    for case_texts in generated:
+                        for case_text in case_texts:
+                            if case_text:
+                                save_generated_case(disease, case_text, config["cases_file"])
+
+            cases = load_config(Path(config["cases_file"]))
+            output_dir = Path(config["output_dir"])
+            # Process all diseases and cases
+            jobs = []
+            skipped = 0
+            for disease, case_list in cases.items():
+                disease_dir = output_dir / disease
+                disease_dir.mkdir(parents=True, exist_ok=True)
+
+                for case in case_list:
+                    case_key = f"{disease}/{case['id']}"
+                    input_hash = case_input_hash(case["text"], model=settings.MODEL_ID, extraction=extraction,
+                                                 pre_extraction=pre_extraction, converter=converter_fingerprint())
+                    if manifest is not None and manifest.is_current(case_key, input_hash):
+                        skipped += 1
+                        continue
+                    if conversion_workers > 1:
+                        # Extraction only; the FHIR conversion runs on a process pool below
+                        job = executor.submit(extract_patient_data, case["text"], client, settings.MODEL_ID, logger,
+                                              extraction=extraction, pre_extraction=pre_extraction)
+                    else:
+                        record = partial(manifest.record, case_key, input_hash) if manifest is not None else None
+                        job = executor.submit(process_case, case, disease_dir, client, extraction, pre_extraction,
+                                              ndjson_pool, record)
+                    jobs.append((case_key, input_hash, job))
+            if skipped:
+                logger.info(f"Skipped {skipped} unchanged case(s)")
 
-            for case in case_list:
-                case_id = case["id"]
-                case_text = case["text"]
+            if conversion_workers > 1:
+                items, input_hashes = [], {}
+                for case_key, input_hash, job in jobs:
+                    try:
+                        llm_output = job.result()
+                    except LLMCacheMiss as e:
+                        logger.warning(f"Skipping case in replay mode: {e}")
+                        continue
+                    except Exception as e:
+                        # Keep the other extractions: they are still converted and recorded
+                        logger.error(f"Extraction of {case_key} failed: {e}")
+                        continue
+                    disease, case_id = case_key.split("/", 1)
+                    items.append((disease, case_id, llm_output))
+                    input_hashes[case_key] = input_hash
 
-                logger.info(f"Processing {disease} - {case_id}")
+                def record_converted(case_key: str, filename: Path) -> None:
+                    manifest.record(case_key, input_hashes[case_key], filename)
 
-                # Run your LLM pipeline on the case text
-                llm_output = process_patient_records(case_text, client, settings.MODEL_ID, logger=logger)
+                convert_cases(items, output_dir, workers=conversion_workers, ndjson=ndjson_pool,
+                              on_written=record_converted if manifest is not None else None)
+                jobs = []
 
-                filename = to_fhir_bundle(llm_output, case_id, disease_dir)
+            for case_key, input_hash, job in jobs:
+                try:
+                    filename = job.result()
+                except LLMCacheMiss as e:
+                    logger.warning(f"Skipping case in replay mode: {e}")
+                    continue
+                except Exception as e:
+                    logger.error(f"Processing of {case_key} failed: {e}")
+                    continue
                 logger.info(f"FHIR bundle saved to {filename}")
 
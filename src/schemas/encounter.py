@@ -1,12 +1,31 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, List
 from src.schemas.medication import MedicationSchema
+from src.schemas.observation import LabObservation_schema, SymptomObservation_schema, VitalSignObservation_schema
 
 class EncounterSchema(BaseModel):
     reason: Optional[str] = None
 
+class EncounterObservation(BaseModel):
+    laboratory: List[LabObservation_schema] = Field(default_factory=list)
+    symptom: List[SymptomObservation_schema] = Field(default_factory=list)
+    vital_sign: List[VitalSignObservation_schema] = Field(default_factory=list)
+
+    # The LLM may return null instead of an empty list
+    @field_validator("laboratory", "symptom", "vital_sign", mode="before")
+    def none_to_empty(cls, v):
+        return [] if v is None else v
+
 class Encounter(BaseModel):
     encounter_date: Optional[str] = None
     reason: Optional[str] = None
-    observation: Optional[Dict] = None
-    medication: Optional[List[MedicationSchema]] = None
\ No newline at end of file
+    observation: EncounterObservation = Field(default_factory=EncounterObservation)
+    medication: List[MedicationSchema] = Field(default_factory=list)
+
+    @field_validator("observation", mode="before")
+    def none_to_observation(cls, v):
+        return EncounterObservation() if v is None else v
+
+    @field_validator("medication", mode="before")
+    def none_to_empty(cls, v):
+        return [] if v is None else v
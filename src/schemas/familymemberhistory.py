@@ -11,5 +11,5 @@ class FamilyMember(BaseModel):
     conditions: List[FamilyCondition] = Field(default_factory=list)
 
 class FamilyHistorySchema(BaseModel):
-    members: List[FamilyMember]
+    members: List[FamilyMember] = Field(default_factory=list)
     note: Optional[str] = None
\ No newline at end of file
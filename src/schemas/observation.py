@@ -6,6 +6,8 @@ from src.enums.observation_enum import Interpretation, Status
 class ObservationBase(BaseModel):
     interpretation: Optional[Interpretation] = None
     status: Optional[Status] = Field(default=Status.final)
+    # "rule" or "llm" when rule-based pre-extraction is used (see pre_extraction.reconcile)
+    provenance: Optional[str] = None
 
     # Normalize interpretation before validation
     @field_validator("interpretation", mode="before")
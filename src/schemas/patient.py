@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, field_validator
+from typing import Any, Dict, Optional, List
 from src.enums.patient_enum import Gender
 from src.schemas.encounter import Encounter
 from src.schemas.familymemberhistory import FamilyHistorySchema
@@ -19,7 +19,32 @@ class Patient_schema(BaseModel):
 
 
 class Patient(BaseModel):
+    # LLM output (OUTPUT_SCHEMA) names the patient_info object "patient"
+    model_config = ConfigDict(populate_by_name=True)
+
     id: Optional[str] = None
-    patient_info: Patient_schema
+    patient_info: Patient_schema = Field(alias="patient")
     encounters: List[Encounter] = Field(default_factory=list)
-    family_history: FamilyHistorySchema = Field(default_factory=FamilyHistorySchema)
\ No newline at end of file
+    family_history: FamilyHistorySchema = Field(default_factory=FamilyHistorySchema)
+
+    @field_validator("encounters", mode="before")
+    def none_to_empty(cls, v):
+        return [] if v is None else v
+
+    @field_validator("family_history", mode="before")
+    def none_to_family_history(cls, v):
+        return FamilyHistorySchema() if v is None else v
+
+
+# Validates a whole LLM output (OUTPUT_SCHEMA) in one pass
+PATIENT_ADAPTER = TypeAdapter(Patient)
+
+
+def validate_llm_output(llm_output: Dict[str, Any]) -> Patient:
+    """
+    Validate the LLM output into the Patient model tree.
+
+    Raises:
+        pydantic.ValidationError: If the output does not match OUTPUT_SCHEMA.
+    """
+    return PATIENT_ADAPTER.validate_python(llm_output)
@@ -0,0 +1,273 @@
+import json
+import time
+import shutil
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from src.core import settings
+from src.services.text_to_json import build_extraction_prompt
+
+logger = logging.getLogger(__name__)
+
+# Terminal Bedrock batch job states
+COMPLETED_STATES = frozenset({"Completed", "PartiallyCompleted"})
+FAILED_STATES = frozenset({"Failed", "Stopped", "Expired"})
+
+RECORD_ID_SEPARATOR = "::"
+
+LLAMA3_CHAT_TEMPLATE = (
+    "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n"
+    "{prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
+)
+
+
+def build_model_input(prompt: str, model: str) -> Dict[str, Any]:
+    """
+    Build the native (InvokeModel) request body used by Bedrock batch inference.
+
+    Batch jobs do not accept Converse requests, so the body depends on the model family.
+
+    Args:
+        prompt (str): User prompt.
+        model (str): Bedrock model ID.
+    Returns:
+        Dict[str, Any]: Model-specific request body.
+    Raises:
+        ValueError: If the model family is not supported.
+    """
+    if "meta.llama" in model:
+        return {
+            "prompt": LLAMA3_CHAT_TEMPLATE.format(prompt=prompt),
+            "max_gen_len": settings.PROMPT_MAX_TOKENS,
+            "temperature": settings.PROMPT_TEMPERATURE,
+        }
+    if "anthropic." in model:
+        return {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": settings.PROMPT_MAX_TOKENS,
+            "temperature": settings.PROMPT_TEMPERATURE,
+            "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+        }
+    raise ValueError(f"Batch inference is not supported for model {model}")
+
+
+def parse_model_output(model_output: Dict[str, Any]) -> str:
+    """
+    Extract the generated text from a native model response.
+    """
+    if "generation" in model_output:
+        return model_output["generation"]
+    if "content" in model_output:
+        return "".join(block.get("text", "") for block in model_output["content"])
+    raise ValueError(f"Unrecognized model output: {list(model_output)}")
+
+
+def build_batch_records(cases: Dict[str, List[dict]], model: str) -> List[Dict[str, Any]]:
+    """
+    Serialize the extraction requests of all cases into Bedrock batch records.
+
+    Args:
+        cases (Dict[str, List[dict]]): Cases per disease, as loaded from the cases file.
+        model (str): Bedrock model ID.
+    Returns:
+        List[Dict[str, Any]]: Records with "recordId" ("<disease>::<case id>") and "modelInput".
+    """
+    return [
+        {
+            "recordId": f"{disease}{RECORD_ID_SEPARATOR}{case['id']}",
+            "modelInput": build_model_input(build_extraction_prompt(case["text"]), model),
+        }
+        for disease, case_list in cases.items()
+        for case in case_list
+    ]
+
+
+def split_record_id(record_id: str) -> Tuple[str, str]:
+    """Return the (disease, case id) encoded in a record ID."""
+    disease, case_id = record_id.split(RECORD_ID_SEPARATOR, 1)
+    return disease, case_id
+
+
+class BatchRunner(Protocol):
+    """
+    Submit/poll layer of a batch job. Implementations only move JSONL files around,
+    so the Bedrock service can be replaced by a local stand-in.
+    """
+
+    def submit(self, input_file: Path, job_name: str) -> str:
+        """Submit the JSONL input file and return a job identifier."""
+        ...
+
+    def status(self, job_id: str) -> str:
+        """Return the job status using Bedrock state names."""
+        ...
+
+    def fetch_output(self, job_id: str, work_dir: Path) -> Path:
+        """Download the JSONL output of a finished job into `work_dir` and return its path."""
+        ...
+
+
+class BedrockBatchRunner:
+    """
+    Runs batch jobs through Bedrock model invocation jobs with S3 input/output.
+    """
+
+    def __init__(self, bedrock_client, s3_client, s3_uri: str, model: str,
+                 role_arn: str = settings.BEDROCK_ROLE_ARN):
+        self.bedrock = bedrock_client
+        self.s3 = s3_client
+        self.s3_uri = s3_uri.rstrip("/")
+        self.model = model
+        self.role_arn = role_arn
+        self._input_names: Dict[str, str] = {}
+
+    @staticmethod
+    def _split_uri(uri: str) -> Tuple[str, str]:
+        bucket, _, key = uri.removeprefix("s3://").partition("/")
+        return bucket, key
+
+    def submit(self, input_file: Path, job_name: str) -> str:
+        input_uri = f"{self.s3_uri}/input/{job_name}/{input_file.name}"
+        bucket, key = self._split_uri(input_uri)
+        self.s3.upload_file(str(input_file), bucket, key)
+
+        response = self.bedrock.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=self.model,
+            inputDataConfig={"s3InputDataConfig": {"s3Uri": input_uri, "s3InputFormat": "JSONL"}},
+            outputDataConfig={"s3OutputDataConfig": {"s3Uri": f"{self.s3_uri}/output/"}},
+        )
+        job_id = response["jobArn"]
+        self._input_names[job_id] = input_file.name
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        response = self.bedrock.get_model_invocation_job(jobIdentifier=job_id)
+        if response.get("message"):
+            logger.debug("Batch job %s: %s", job_id, response["message"])
+        return response["status"]
+
+    def fetch_output(self, job_id: str, work_dir: Path) -> Path:
+        # Bedrock writes <output uri>/<job id>/<input file name>.out
+        input_name = self._input_names[job_id]
+        output_uri = f"{self.s3_uri}/output/{job_id.split('/')[-1]}/{input_name}.out"
+        bucket, key = self._split_uri(output_uri)
+        local_file = work_dir / f"{input_name}.out"
+        self.s3.download_file(bucket, key, str(local_file))
+        return local_file
+
+
+class LocalBatchRunner:
+    """
+    File-based stand-in for Bedrock batch jobs.
+
+    The input file is copied to `<root>/<job name>/`. A job is complete once
+    `<input file name>.out` exists next to it; it can be written by an external
+    process, or immediately by `responder`, which maps a record's modelInput to a
+    native model output.
+    """
+
+    def __init__(self, root: Path,
+                 responder: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None):
+        self.root = Path(root)
+        self.responder = responder
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def _output_file(self, job_id: str) -> Path:
+        inputs = [p for p in self._job_dir(job_id).glob("*.jsonl")]
+        return inputs[0].with_name(inputs[0].name + ".out")
+
+    def submit(self, input_file: Path, job_name: str) -> str:
+        job_dir = self._job_dir(job_name)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        job_input = job_dir / input_file.name
+        shutil.copyfile(input_file, job_input)
+
+        if self.responder is not None:
+            with open(job_input, "r", encoding="utf-8") as src, \
+                    open(self._output_file(job_name), "w", encoding="utf-8") as dst:
+                for line in src:
+                    record = json.loads(line)
+                    record["modelOutput"] = self.responder(record["modelInput"])
+                    dst.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return job_name
+
+    def status(self, job_id: str) -> str:
+        return "Completed" if self._output_file(job_id).exists() else "InProgress"
+
+    def fetch_output(self, job_id: str, work_dir: Path) -> Path:
+        return self._output_file(job_id)
+
+
+def write_batch_input(records: Iterable[Dict[str, Any]], path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fh:
+        for record in records:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return path
+
+
+def read_batch_output(path: Path) -> Dict[str, str]:
+    """
+    Read a batch output file into generated texts keyed by record ID.
+    Records that failed inside the job are logged and skipped.
+    """
+    outputs = {}
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "error" in record or "modelOutput" not in record:
+                logger.error("Batch record %s failed: %s", record.get("recordId"), record.get("error"))
+                continue
+            outputs[record["recordId"]] = parse_model_output(record["modelOutput"]).strip()
+    return outputs
+
+
+def run_batch(
+        runner: BatchRunner,
+        records: List[Dict[str, Any]],
+        work_dir: Path,
+        job_name: str,
+        poll_interval: float = settings.BATCH_POLL_INTERVAL,
+        timeout: float = settings.BATCH_TIMEOUT
+) -> Dict[str, str]:
+    """
+    Submit a batch job, wait for it to finish and return the generated texts.
+
+    Args:
+        runner (BatchRunner): Submit/poll implementation.
+        records (List[Dict[str, Any]]): Records from `build_batch_records`.
+        work_dir (Path): Local directory for the input and output JSONL files.
+        job_name (str): Unique job name.
+        poll_interval (float): Seconds between status checks.
+        timeout (float): Maximum seconds to wait for the job.
+    Returns:
+        Dict[str, str]: Generated text keyed by record ID.
+    Raises:
+        RuntimeError: If the job fails or does not finish in time.
+    """
+    input_file = write_batch_input(records, Path(work_dir) / f"{job_name}.jsonl")
+    job_id = runner.submit(input_file, job_name)
+    logger.info("Submitted batch job %s with %d records", job_id, len(records))
+
+    deadline = time.monotonic() + timeout
+    while True:
+        status = runner.status(job_id)
+        if status in COMPLETED_STATES:
+            break
+        if status in FAILED_STATES:
+            raise RuntimeError(f"Batch job {job_id} ended with status {status}")
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Batch job {job_id} did not finish within {timeout} seconds")
+        logger.info("Batch job %s is %s", job_id, status)
+        time.sleep(poll_interval)
+
+    outputs = read_batch_output(runner.fetch_output(job_id, Path(work_dir)))
+    logger.info("Batch job %s returned %d/%d records", job_id, len(outputs), len(records))
+    return outputs
@@ -1,169 +1,349 @@
 import json
-from typing import Dict, List
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from src.utils.bundle_reader import iter_bundle_entries
 from src.utils.load_save import get_patient_str
+from src.utils.ndjson_writer import is_ndjson_export, ndjson_files, open_ndjson, resource_patient_id
 from src.schemas.patient import Patient_schema, Patient_Address, Patient
-from src.schemas.encounter import Encounter
+from src.schemas.encounter import Encounter, EncounterObservation
 from src.schemas.observation import LabObservation_schema, VitalSignObservation_schema, SymptomObservation_schema
 from src.schemas.medication import MedicationSchema
 from src.schemas.familymemberhistory import FamilyHistorySchema, FamilyCondition, FamilyMember
 
-def process_fhir_bundle(fhir:str, logger) -> dict:
+logger = logging.getLogger(__name__)
+
+# Resource types in the order of NDJSON bundles (patient, then encounters before their observations)
+RESOURCE_ORDER = ("Patient", "Encounter", "Observation", "MedicationStatement", "List")
+
+
+def process_fhir_bundle(fhir:str, logger, patient_id: Optional[str] = None) -> dict:
     """
     Process fhir bundle and convert into patient summary
 
     Args:
-        fhir (Path): Path for patient record in FHIR format
+        fhir (Path): Path for patient record in FHIR format: a bundle JSON file, or an
+            NDJSON bulk export directory (see `NDJSONBulkWriter`)
         logger (logging.Logger): Logger.
+        patient_id (Optional[str]): Patient to summarize in an NDJSON export; may be
+            omitted if the export holds a single patient.
     Returns:
         dict: The extracted metadata.
     """
+    if is_ndjson_export(Path(fhir)):
+        bundles = load_ndjson_bundles(fhir, logger)
+        if patient_id is None:
+            if len(bundles) != 1:
+                raise ValueError(f"{fhir} holds {len(bundles)} patients; pass the patient_id to summarize")
+            patient_id = next(iter(bundles))
+        return summarize_bundle(bundles[patient_id])
+
     try:
-        with open(fhir, "r", encoding="utf-8") as fh:
-            bundle = json.load(fh)
-            logger.debug(f"Bundle loaded from {fhir}")
+        summaries = [summary for _, summary in summarize_bundle_file(Path(fhir), logger)]
     except Exception as e:
         logger.error(f"Error reading FHIR file: {e}")
         raise
 
-    patient_data = None
-    encounters_dict: Dict[str, Encounter] = {}
-    observations_dict: Dict[str, List] = {}
-    medications_dict: Dict[str, List[MedicationSchema]] = {}
-    family_members: List[FamilyMember] = []
+    if len(summaries) != 1:
+        raise ValueError(f"{fhir} holds {len(summaries)} bundles; use summarize_bundle_file")
+    return summaries[0]
 
-    # --- Iterate bundle entries ---
-    for entry in bundle.get("entry", []):
-        resource = entry.get("resource", {})
+
+def process_ndjson_export(directory: Path, logger) -> Iterator[Tuple[str, str]]:
+    """
+    Summarize every patient of an NDJSON bulk export, reading it once.
+
+    Yields:
+        Tuple[str, str]: (patient ID, patient summary).
+    """
+    for patient_id, bundle in load_ndjson_bundles(directory, logger).items():
+        yield patient_id, summarize_bundle(bundle)
+
+
+def summarize_output_dir(fhir_base_dir: Path, workers: int = 1) -> Iterator[Tuple[Path, str]]:
+    """
+    Summarize every bundle file and NDJSON export under the FHIR output directory.
+
+    Files are summarized on a process pool of `workers` processes; the results come
+    back in sorted path order whatever the number of workers, so the summary file
+    written from them is deterministic.
+
+    Args:
+        fhir_base_dir (Path): FHIR output directory.
+        workers (int): Number of processes; with 1 the files are summarized in the
+            current process.
+    Yields:
+        Tuple[Path, str]: (case path, patient summary); the case path is the bundle
+        file (`<stem>_<i>.json` for the i-th further bundle of a file) or
+        `<export_dir>/<patient_id>`.
+    """
+    fhir_base_dir = Path(fhir_base_dir)
+    paths = sorted(fhir_base_dir.rglob("*.json")) + \
+        sorted({path.parent for path in fhir_base_dir.rglob("*.ndjson*")})
+    if not paths:
+        return
+
+    workers = max(1, min(workers, len(paths)))
+    if workers == 1:
+        for summaries in map(_summarize_path, paths):
+            yield from summaries
+        return
+
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map yields in input order while workers run ahead
+        for summaries in executor.map(_summarize_path, paths, chunksize=chunksize):
+            yield from summaries
+
+
+def _summarize_path(path: Path) -> List[Tuple[Path, str]]:
+    """Summaries of a bundle file or an NDJSON export, by case path."""
+    if is_ndjson_export(path):
+        return [(path / patient_id, summary) for patient_id, summary in process_ndjson_export(path, logger)]
+    return [
+        (path if bundle_index == 0 else path.with_name(f"{path.stem}_{bundle_index}{path.suffix}"), summary)
+        for bundle_index, summary in summarize_bundle_file(path, logger)
+    ]
+
+
+def load_ndjson_bundles(directory: Path, logger) -> Dict[str, Dict[str, Any]]:
+    """
+    Read an NDJSON bulk export back into one collection Bundle per patient.
+
+    Args:
+        directory (Path): Export directory with `<resourceType>.ndjson[.gz]` files.
+        logger (logging.Logger): Logger.
+    Returns:
+        Dict[str, Dict[str, Any]]: Bundles by patient ID, resources ordered as RESOURCE_ORDER.
+    """
+    resources: Dict[str, List[Dict[str, Any]]] = {}
+    for path in ndjson_files(directory):
+        with open_ndjson(path) as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                resource = json.loads(line)
+                patient_id = resource_patient_id(resource)
+                if patient_id is None:
+                    logger.warning(f"Skipping {resource.get('resourceType')} without a patient in {path}")
+                    continue
+                resources.setdefault(patient_id, []).append(resource)
+    logger.debug(f"Loaded {len(resources)} patients from {directory}")
+
+    def order(resource: Dict[str, Any]) -> int:
         r_type = resource.get("resourceType")
+        return RESOURCE_ORDER.index(r_type) if r_type in RESOURCE_ORDER else len(RESOURCE_ORDER)
 
-        if r_type == "Patient":
-            name_info = resource.get("name", [{}])[0]
-            given_names = name_info.get("given", [])
-            patient_id = resource.get("id")
-
-            patient_data = Patient_schema(
-                patient_id=patient_id,
-                first_name=given_names[0] if given_names else None,
-                second_name=name_info.get("family"),
-                gender=resource.get("gender"),
-                birthDate=resource.get("birthDate"),
-                address=Patient_Address(**(resource.get("address", [{}])[0] or {}))
-            )
+    return {
+        patient_id: {
+            "resourceType": "Bundle",
+            "type": "collection",
+            "entry": [{"resource": resource} for resource in sorted(patient_resources, key=order)]
+        }
+        for patient_id, patient_resources in resources.items()
+    }
+
+
+def summarize_bundle(bundle: Dict[str, Any]) -> str:
+    """
+    Convert a FHIR bundle (JSON form) into a patient summary.
+
+    Args:
+        bundle (Dict[str, Any]): Bundle with the resources of one patient.
+    Returns:
+        str: Patient summary.
+    """
+    return summarize_entries(bundle.get("entry", []))
 
-        elif r_type == "Encounter":
-            enc_id = resource.get("id")
-            reason_list = resource.get("reason", [])
-            reason_text = None
-            if reason_list and "value" in reason_list[0]:
-                val = reason_list[0]["value"]
-                if val and len(val) > 0 and "concept" in val[0]:
-                    reason_text = val[0]["concept"].get("text")
-            encounters_dict[enc_id] = Encounter(
-                encounter_date=None,
-                reason=reason_text,
-                observation={},
-                medication=[]
-            )
 
-        elif r_type == "Observation":
-            encounter_ref = resource.get("encounter", {}).get("reference")
-            if not encounter_ref:
-                continue
-            enc_id = encounter_ref.split("/")[-1]
-            category = resource.get("category", [{}])[0].get("coding", [{}])[0].get("code", "").lower()
-            obs_list = observations_dict.setdefault(enc_id, [])
-
-            obs_date_str = resource.get("effectiveDateTime")
-            if obs_date_str and enc_id in encounters_dict:
-                if not encounters_dict[enc_id].encounter_date:
-                    encounters_dict[enc_id].encounter_date = obs_date_str
-                else:
-                    existing = encounters_dict[enc_id].encounter_date
-                    if obs_date_str < existing:
-                        encounters_dict[enc_id].encounter_date = obs_date_str
-
-            if category == "laboratory":
-                test_name = resource.get("code", {}).get("coding", [{}])[0].get("display")
-                value_qty = resource.get("valueQuantity", {})
-                obs_list.append(LabObservation_schema(
-                    test_name=test_name,
-                    value=value_qty.get("value"),
-                    unit=value_qty.get("unit"),
-                    interpretation=(resource.get("interpretation", [{}])[0].get("coding", [{}])[0].get("code")),
-                    status=resource.get("status")
-                ))
-
-            elif category == "vital-signs":
-                obs_list.append(VitalSignObservation_schema(
-                    vital_type=resource.get("code", {}).get("text"),
-                    value=resource.get("valueQuantity", {}).get("value"),
-                    unit=resource.get("valueQuantity", {}).get("unit"),
-                    interpretation=None,
-                    status=resource.get("status")
-                ))
-
-            else:
-                obs_list.append(SymptomObservation_schema(
-                    symptom_name=resource.get("code", {}).get("text"),
-                    present=True,
-                    interpretation=None,
-                    status=resource.get("status")
-                ))
-
-            observations_dict[enc_id] = obs_list
-
-        elif r_type == "MedicationStatement":
-            enc_ref = resource.get("encounter", {}).get("reference")
-            if not enc_ref:
-                continue
-
-            enc_id = enc_ref.split("/")[-1]
-            med_info = resource.get("medication", {}).get("concept", {})
-            med_name = med_info.get("text")
-            dosage_info = resource.get("dosage", [{}])[0]
-            freq = dosage_info.get("timing", {}).get("repeat", {}).get("frequency")
-            period = dosage_info.get("timing", {}).get("repeat", {}).get("period")
-            period_unit = dosage_info.get("timing", {}).get("repeat", {}).get("periodUnit")
-
-            med = MedicationSchema(
-                name=med_name,
-                dosage_text=dosage_info.get("text"),
-                frequency=freq,
-                period=period,
-                period_unit=period_unit
+def summarize_entries(entries: Iterable[Dict[str, Any]]) -> str:
+    """
+    Convert the entries of a FHIR bundle into a patient summary, consuming them one
+    at a time (e.g. from `iter_bundle_entries`).
+
+    Args:
+        entries (Iterable[Dict[str, Any]]): Bundle entries of one patient.
+    Returns:
+        str: Patient summary.
+    """
+    summary = _PatientSummary()
+    for entry in entries:
+        resource = entry.get("resource", {})
+        handler = RESOURCE_HANDLERS.get(resource.get("resourceType"))
+        if handler:
+            handler(summary, resource)
+    return get_patient_str(summary.patient())
+
+
+def summarize_bundle_file(path: Path, logger) -> Iterator[Tuple[int, str]]:
+    """
+    Summarize the bundles of a JSON file, streaming its entries. A file may hold
+    several concatenated bundles, each summarized separately.
+
+    Args:
+        path (Path): Bundle JSON file.
+        logger (logging.Logger): Logger.
+    Yields:
+        Tuple[int, str]: (bundle index in the file, patient summary).
+    """
+    for bundle_index, entries in groupby(iter_bundle_entries(path), key=itemgetter(0)):
+        yield bundle_index, summarize_entries(entry for _, entry in entries)
+        logger.debug(f"Summarized bundle {bundle_index} of {path}")
+
+
+class _PatientSummary:
+    """Resources of one patient, collected entry by entry by the RESOURCE_HANDLERS."""
+
+    def __init__(self):
+        self.patient_id: Optional[str] = None
+        self.patient_data: Optional[Patient_schema] = None
+        self.encounters: Dict[str, Encounter] = {}
+        self.observations: Dict[str, List] = {}
+        # Earliest observation date of each encounter, used as the encounter date
+        self.observation_dates: Dict[str, str] = {}
+        self.medications: Dict[str, List[MedicationSchema]] = {}
+        self.family_members: List[FamilyMember] = []
+
+    def patient(self) -> Patient:
+        for enc_id, enc in self.encounters.items():
+            observations = self.observations.get(enc_id, [])
+            enc.encounter_date = self.observation_dates.get(enc_id)
+            enc.observation = EncounterObservation(
+                laboratory=[o for o in observations if isinstance(o, LabObservation_schema)],
+                vital_sign=[o for o in observations if isinstance(o, VitalSignObservation_schema)],
+                symptom=[o for o in observations if isinstance(o, SymptomObservation_schema)]
             )
-            medications_dict.setdefault(enc_id, []).append(med)
-
-        elif r_type == "List":
-            contained = resource.get("contained", [])
-            for fmh in contained:
-                if fmh.get("resourceType") == "FamilyMemberHistory":
-                    rel = fmh.get("relationship", {}).get("coding", [{}])[0].get("display")
-                    deceased = fmh.get("deceasedBoolean", False)
-                    conditions_list = []
-                    for cond in fmh.get("condition", []):
-                        cond_name = cond.get("code", {}).get("coding", [{}])[0].get("display")
-                        conditions_list.append(FamilyCondition(condition_name=cond_name))
-                    family_members.append(FamilyMember(
-                        relationship=rel,
-                        deceased=deceased,
-                        conditions=conditions_list
-                    ))
-
-    for enc_id, enc in encounters_dict.items():
-        enc.observation = {
-            "laboratory": [o for o in observations_dict.get(enc_id, []) if isinstance(o, LabObservation_schema)],
-            "vital_sign": [o for o in observations_dict.get(enc_id, []) if isinstance(o, VitalSignObservation_schema)],
-            "symptom": [o for o in observations_dict.get(enc_id, []) if isinstance(o, SymptomObservation_schema)]
-        }
-        enc.medication = medications_dict.get(enc_id, [])
+            enc.medication = self.medications.get(enc_id, [])
+
+        return Patient(
+            id=self.patient_id,
+            patient_info=self.patient_data,
+            encounters=list(self.encounters.values()),
+            family_history=FamilyHistorySchema(members=self.family_members)
+        )
 
-    patient_obj = Patient(
-        id = patient_id,
-        patient_info=patient_data,
-        encounters=list(encounters_dict.values()),
-        family_history=FamilyHistorySchema(members=family_members)
+
+def _patient_handler(summary: _PatientSummary, resource: Dict[str, Any]) -> None:
+    name_info = resource.get("name", [{}])[0]
+    given_names = name_info.get("given", [])
+    summary.patient_id = resource.get("id")
+
+    summary.patient_data = Patient_schema(
+        patient_id=summary.patient_id,
+        first_name=given_names[0] if given_names else None,
+        second_name=name_info.get("family"),
+        gender=resource.get("gender"),
+        birthDate=resource.get("birthDate"),
+        address=Patient_Address(**(resource.get("address", [{}])[0] or {}))
+    )
+
+
+def _encounter_handler(summary: _PatientSummary, resource: Dict[str, Any]) -> None:
+    enc_id = resource.get("id")
+    reason_list = resource.get("reason", [])
+    reason_text = None
+    if reason_list and "value" in reason_list[0]:
+        val = reason_list[0]["value"]
+        if val and len(val) > 0 and "concept" in val[0]:
+            reason_text = val[0]["concept"].get("text")
+    summary.encounters[enc_id] = Encounter(
+        encounter_date=None,
+        reason=reason_text,
+        medication=[]
     )
-    patient_info = get_patient_str(patient_obj)
-    return patient_info
 
+
+def _observation_handler(summary: _PatientSummary, resource: Dict[str, Any]) -> None:
+    encounter_ref = resource.get("encounter", {}).get("reference")
+    if not encounter_ref:
+        return
+    enc_id = encounter_ref.split("/")[-1]
+    category = resource.get("category", [{}])[0].get("coding", [{}])[0].get("code", "").lower()
+    obs_list = summary.observations.setdefault(enc_id, [])
+
+    obs_date_str = resource.get("effectiveDateTime")
+    if obs_date_str:
+        existing = summary.observation_dates.get(enc_id)
+        if not existing or obs_date_str < existing:
+            summary.observation_dates[enc_id] = obs_date_str
+
+    if category == "laboratory":
+        test_name = resource.get("code", {}).get("coding", [{}])[0].get("display")
+        value_qty = resource.get("valueQuantity", {})
+        obs_list.append(LabObservation_schema(
+            test_name=test_name,
+            value=value_qty.get("value"),
+            unit=value_qty.get("unit"),
+            interpretation=(resource.get("interpretation", [{}])[0].get("coding", [{}])[0].get("code")),
+            status=resource.get("status")
+        ))
+
+    elif category == "vital-signs":
+        obs_list.append(VitalSignObservation_schema(
+            vital_type=resource.get("code", {}).get("text"),
+            value=resource.get("valueQuantity", {}).get("value"),
+            unit=resource.get("valueQuantity", {}).get("unit"),
+            interpretation=None,
+            status=resource.get("status")
+        ))
+
+    else:
+        obs_list.append(SymptomObservation_schema(
+            symptom_name=resource.get("code", {}).get("text"),
+            present=True,
+            interpretation=None,
+            status=resource.get("status")
+        ))
+
+
+def _medication_handler(summary: _PatientSummary, resource: Dict[str, Any]) -> None:
+    enc_ref = resource.get("encounter", {}).get("reference")
+    if not enc_ref:
+        return
+
+    enc_id = enc_ref.split("/")[-1]
+    med_info = resource.get("medication", {}).get("concept", {})
+    med_name = med_info.get("text")
+    dosage_info = resource.get("dosage", [{}])[0]
+    freq = dosage_info.get("timing", {}).get("repeat", {}).get("frequency")
+    period = dosage_info.get("timing", {}).get("repeat", {}).get("period")
+    period_unit = dosage_info.get("timing", {}).get("repeat", {}).get("periodUnit")
+
+    med = MedicationSchema(
+        name=med_name,
+        dosage_text=dosage_info.get("text"),
+        frequency=freq,
+        period=period,
+        period_unit=period_unit
+    )
+    summary.medications.setdefault(enc_id, []).append(med)
+
+
+def _family_history_handler(summary: _PatientSummary, resource: Dict[str, Any]) -> None:
+    contained = resource.get("contained", [])
+    for fmh in contained:
+        if fmh.get("resourceType") == "FamilyMemberHistory":
+            rel = fmh.get("relationship", {}).get("coding", [{}])[0].get("display")
+            deceased = fmh.get("deceasedBoolean", False)
+            conditions_list = []
+            for cond in fmh.get("condition", []):
+                cond_name = cond.get("code", {}).get("coding", [{}])[0].get("display")
+                conditions_list.append(FamilyCondition(condition_name=cond_name))
+            summary.family_members.append(FamilyMember(
+                relationship=rel,
+                deceased=deceased,
+                conditions=conditions_list
+            ))
+
+
+# Handler of each summarized resource type; other resources are ignored
+RESOURCE_HANDLERS: Dict[str, Callable[[_PatientSummary, Dict[str, Any]], None]] = {
+    "Patient": _patient_handler,
+    "Encounter": _encounter_handler,
+    "Observation": _observation_handler,
+    "MedicationStatement": _medication_handler,
+    "List": _family_history_handler,
+}
@@ -1,15 +1,45 @@
-from typing import Optional
+import re
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple
 import logging
-import boto3
-from src.core.settings import GENERATION_PROMPT_TEMPERATURE, GENERATION_PROMPT_TOP_P, PROMPT_MAX_TOKENS
-from src.utils.prompt import CASE_GENERATION_PROMPT
+from src.core.settings import (GENERATION_BATCH_MAX_TOKENS, GENERATION_CASE_MAX_TOKENS, GENERATION_PROMPT_TEMPERATURE,
+                               GENERATION_PROMPT_TOP_P, PROMPT_MAX_TOKENS)
+from src.utils.prompt import CASE_GENERATION_PROMPT, MULTI_CASE_GENERATION_PROMPT
+from src.utils.bedrock_client import converse
+
+if TYPE_CHECKING:
+    import boto3
+
+CASE_DELIMITER = "### CASE ###"
+_CASE_DELIMITER_RE = re.compile(r"^\s*" + re.escape(CASE_DELIMITER) + r"\s*$", re.MULTILINE)
+
+
+def _generate(prompt: str, client, model: str, max_tokens: int, variant: Any) -> Tuple[str, Optional[str]]:
+    """
+    Send a generation prompt and return the answer text and the stop reason.
+    """
+    conversation = [{
+        "role": "user",
+        "content": [{"text": prompt}]
+    }]
+
+    response = converse(
+        client,
+        cache_variant=variant,
+        modelId=model,
+        messages=conversation,
+        inferenceConfig={"maxTokens": max_tokens, "temperature": GENERATION_PROMPT_TEMPERATURE, "topP": GENERATION_PROMPT_TOP_P}
+    )
+
+    raw_text = response["output"]["message"]["content"][0].get("text", "").strip()
+    return raw_text, response.get("stopReason")
 
 
 def generate_case(
     disease: str,
-    client: boto3.client,
+    client: "boto3.client",
     model: str,
-    logger: logging.Logger
+    logger: logging.Logger,
+    variant: int = 0
 ) -> Optional[str]:
     """
     Generates a synthetic clinical case description for a given disease using an LLM via AWS Bedrock.
@@ -19,28 +49,81 @@ def generate_case(
         client (boto3.client): An initialized AWS Bedrock runtime client.
         model (str): The model ID to use for generation (e.g., Meta Llama 3 or Anthropic Claude).
         logger (logging.Logger): Logger instance for logging progress and debugging.
+        variant (int): Index of the case among those generated for the disease; keeps
+            repeated generations apart in the LLM response cache.
 
     Returns:
         Optional[str]: The generated case text if successful, otherwise None.
     """
     prompt = CASE_GENERATION_PROMPT.format(disease=disease)
-
-    conversation = [{
-        "role": "user",
-        "content": [{"text": prompt}]
-    }]
-
-    response = client.converse(
-        modelId=model,
-        messages=conversation,
-        inferenceConfig={"maxTokens": PROMPT_MAX_TOKENS, "temperature": GENERATION_PROMPT_TEMPERATURE, "topP": GENERATION_PROMPT_TOP_P}
-    )
+    raw_text, _ = _generate(prompt, client, model, PROMPT_MAX_TOKENS, variant)
 
     logger.debug("Received response from model")
 
-    raw_text = response["output"]["message"]["content"][0].get("text", "").strip()
-
     if not raw_text:
         logger.warning("Empty response received from model")
         return ""
-    return raw_text
\ No newline at end of file
+    return raw_text
+
+
+def split_cases(raw_text: str, truncated: bool = False) -> List[str]:
+    """
+    Split a multi-case answer on CASE_DELIMITER lines.
+
+    Args:
+        raw_text (str): Model answer.
+        truncated (bool): The answer stopped at maxTokens; its last case is incomplete and dropped.
+    Returns:
+        List[str]: Non-empty case texts.
+    """
+    cases = [case.strip() for case in _CASE_DELIMITER_RE.split(raw_text)]
+    if truncated and cases:
+        cases.pop()
+    return [case for case in cases if case]
+
+
+def generate_cases(
+    disease: str,
+    count: int,
+    client: "boto3.client",
+    model: str,
+    logger: logging.Logger,
+    variant: int = 0
+) -> List[str]:
+    """
+    Generates `count` cases for a disease with a single Bedrock call.
+
+    The model is asked for `count` cases separated by CASE_DELIMITER lines, so the
+    generation prompt is sent once instead of `count` times. If fewer cases come
+    back (e.g. the answer hit maxTokens), the rest is topped up with `generate_case`.
+
+    Args:
+        disease (str): The name of the disease for which to generate cases.
+        count (int): Number of cases to generate.
+        client (boto3.client): An initialized AWS Bedrock runtime client.
+        model (str): The model ID to use for generation.
+        logger (logging.Logger): Logger instance for logging progress and debugging.
+        variant (int): Index of the first case among those generated for the disease.
+
+    Returns:
+        List[str]: Up to `count` generated case texts.
+    """
+    if count <= 1:
+        return [generate_case(disease, client, model, logger, variant=variant)][:count]
+
+    prompt = CASE_GENERATION_PROMPT.format(disease=disease) + MULTI_CASE_GENERATION_PROMPT.format(
+        count=count, delimiter=CASE_DELIMITER
+    )
+    max_tokens = min(GENERATION_CASE_MAX_TOKENS * count, GENERATION_BATCH_MAX_TOKENS)
+    raw_text, stop_reason = _generate(prompt, client, model, max_tokens, f"{variant}x{count}")
+
+    cases = split_cases(raw_text, truncated=stop_reason == "max_tokens")[:count]
+    logger.debug(f"Received {len(cases)}/{count} cases from model")
+
+    if len(cases) < count:
+        logger.warning(f"Model returned {len(cases)}/{count} cases for {disease}; generating the rest one by one")
+        for i in range(variant + len(cases), variant + count):
+            case_text = generate_case(disease, client, model, logger, variant=i)
+            if case_text:
+                cases.append(case_text)
+    return cases
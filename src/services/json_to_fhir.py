@@ -1,288 +1,329 @@
-from pydantic import ValidationError
-from datetime import datetime, timezone
+from pydantic import BaseModel, ValidationError
+from pydantic_core import to_json
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Callable, Dict, Any, Optional, Tuple, List, Set
+import json
 import uuid
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+from src.core import settings
 
 #Patient
-from fhir.resources.patient import Patient
-from src.schemas.patient import Patient_schema
-from fhir.resources.humanname import HumanName
-from fhir.resources.address import Address
+from src.schemas.patient import Patient_schema, validate_llm_output
 
 #Observations
-from fhir.resources.observation import Observation
-from fhir.resources.codeableconcept import CodeableConcept
-from fhir.resources.coding import Coding
-from fhir.resources.reference import Reference
-from fhir.resources.quantity import Quantity
 from src.schemas.observation import LabObservation_schema, SymptomObservation_schema, VitalSignObservation_schema
-from src.utils.codes_request import get_loinc_code, interpretation_map, get_snomed_code
+from src.enums.observation_enum import Interpretation
+from src.utils.codes_request import interpretation_map, code_for, resolve_terms
+from src.utils.terminology_cache import normalize_term
 
 #FamilyHistory
-from fhir.resources.list import List as FHIRList
-from fhir.resources.familymemberhistory import FamilyMemberHistory
 from src.schemas.familymemberhistory import FamilyHistorySchema
 
 #Medication
-from fhir.resources.medicationstatement import MedicationStatement
-from fhir.resources.codeablereference import CodeableReference
-from fhir.resources.annotation import Annotation
-from fhir.resources.dosage import Dosage
-from fhir.resources.timing import Timing
 from src.schemas.medication import MedicationSchema
 from src.enums.medication_enum import AdherenceEnum
 
 #Encounter
-from src.schemas.encounter import EncounterSchema
-from fhir.resources.encounter import Encounter
-from fhir.resources.identifier import Identifier
+from src.schemas.encounter import Encounter
 
 #Bundle
-from fhir.resources.bundle import Bundle, BundleEntry, BundleEntryRequest
+from src.utils.ndjson_writer import NDJSONBulkWriter
 
+logger = logging.getLogger(__name__)
 
-def patient_to_fhir(
-        data: Dict[str, Any]
-) -> Tuple[Patient, int, str]:
+@lru_cache(maxsize=None)
+def converter_fingerprint() -> str:
     """
-    Convert validated patient data into a FHIR Patient resource.
+    SHA-256 of the conversion code: this module and the LLM output schemas and enums.
+    Part of a case's input hash (see `case_input_hash`), so that changing the
+    conversion re-converts every case on the next incremental run.
+    """
+    src_dir = Path(__file__).resolve().parent.parent
+    digest = hashlib.sha256()
+    for path in [Path(__file__).resolve()] + sorted((src_dir / "schemas").glob("*.py")) + \
+            sorted((src_dir / "enums").glob("*.py")):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+# Resources are assembled as plain dicts (the JSON form of the fhir.resources models) and
+# serialized directly; `serialize_bundle` validates them with fhir.resources on a sample.
+
+
+# ==== Constant fragments ====
+# Built once and shared by reference by every resource: they must never be mutated.
+
+def _category(code: str, display: str) -> List[Dict[str, Any]]:
+    return [{
+        "coding": [{
+            "system": "http://terminology.hl7.org/CodeSystem/observation-category",
+            "code": code,
+            "display": display
+        }],
+        "text": display
+    }]
+
+
+OBSERVATION_CATEGORIES = {
+    "laboratory": _category("laboratory", "Laboratory"),
+    "exam": _category("exam", "Exam"),
+    "vital-signs": _category("vital-signs", "Vital Signs"),
+}
+
+ENCOUNTER_PRIORITY_NORMAL = {
+    "coding": [{
+        "system": "http://snomed.info/sct",
+        "code": "17621005",
+        "display": "Normal"
+    }]
+}
+
+ENCOUNTER_TYPE_CONSULTATION = [{
+    "coding": [{
+        "system": "http://snomed.info/sct",
+        "code": "11429006",
+        "display": "Consultation"
+    }]
+}]
+
+
+# Observation.meta recording how a lab or vital sign value was extracted (`provenance`)
+PROVENANCE_SYSTEM = "urn:fhir-agent:extraction-provenance"
+PROVENANCE_META = {
+    provenance: {"tag": [{"system": PROVENANCE_SYSTEM, "code": provenance, "display": display}]}
+    for provenance, display in (("rule", "Rule-based extraction"), ("llm", "LLM extraction"))
+}
+
+
+def _interpretation_coding(interpretation: Interpretation) -> List[Dict[str, Any]]:
+    return [{
+        "system": "http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation",
+        "code": interpretation_map.get(interpretation.value, "A"),
+        "display": interpretation.value.capitalize()
+    }]
+
+
+# Observation.interpretation values; labs carry the coding only, symptoms and vitals also the text
+INTERPRETATIONS = {
+    interpretation: [{"coding": _interpretation_coding(interpretation)}]
+    for interpretation in Interpretation
+}
+INTERPRETATIONS_WITH_TEXT = {
+    interpretation: [{
+        "coding": INTERPRETATIONS[interpretation][0]["coding"],
+        "text": interpretation.value.capitalize()
+    }]
+    for interpretation in Interpretation
+}
+
+
+# Namespace of the deterministic (UUIDv5) resource IDs
+FHIR_ID_NAMESPACE = uuid.UUID("a0a2a986-306e-4b08-a70e-8dcd38c5ba27")
+
+
+def make_resource_id(case_key: Optional[str], path: str, content: Any = None) -> str:
+    """
+    ID of a resource: a UUIDv5 of the case key, the resource's position in the case
+    (e.g. "encounter/0/laboratory/1") and its LLM content, so that converting the
+    same case output again reproduces the same IDs. Random (UUIDv4) without a case key.
+    """
+    if case_key is None:
+        return str(uuid.uuid4())
+    canonical = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return str(uuid.uuid5(FHIR_ID_NAMESPACE, f"{case_key}/{path}:{canonical}"))
 
-    Args:
-        data (Dict[str, Any]): Dictionary containing patient information.
-            Expected keys:
-                - first_name (str): Patient's given name.
-                - second_name (str): Patient's family name.
-                - address (dict): Address details with keys 'text', 'city', 'state', 'country'.
-                - gender (str): Patient's gender ("male", "female", "other", "unknown").
-                - birthdate (str): Patient's birth date in ISO format (YYYY-MM-DD).
 
-    Returns:
-        Tuple[Patient, patient_id]: JSON string representation of the FHIR Patient resource and patient_id.
+def _id_content(model: BaseModel) -> Dict[str, Any]:
+    """Content of a validated LLM object as hashed into its resource ID."""
+    return model.model_dump(mode="json", exclude_none=True)
 
-    Raises:
-        ValidationError: If the input data does not conform to Patient_schema.
+
+def fhir_datetime(value: str) -> str:
     """
+    Normalize a dateTime the way fhir.resources serializes it: values with a time
+    are re-rendered in ISO format, with "Z" for UTC. Dates and partial dates are kept.
+    """
+    if "T" not in value:
+        return value
     try:
-        Patient_schema.model_validate(data)
-    except ValidationError as err:
-        raise ValidationError(err.messages[0])
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    rendered = parsed.isoformat()
+    return rendered[:-6] + "Z" if rendered.endswith("+00:00") else rendered
 
-    resource_type = "Patient"
-    patient_id = str(uuid.uuid4())
-    human_name = HumanName(
-        family=data.get("second_name"),
-        given=[data.get("first_name")]
-    )
-    addr_data = data.get("address", {})
-    address = Address(
-        text=addr_data.get("text"),
-        city=addr_data.get("city"),
-        state=addr_data.get("state"),
-        country=addr_data.get("country")
-    )
-    gender = data.get("gender")
-    birthdate = data.get("birthDate")
-
-    patient = Patient(
-        id=patient_id,
-        resourceType=resource_type,
-        name=[human_name],
-        gender=gender,
-        birthDate=birthdate,
-        address=[address]
-    )
 
-    return patient, patient_id, f'{data.get("first_name")} {data.get("second_name")}'
+def patient_to_fhir(
+        patient: Patient_schema,
+        resource_id: Optional[str] = None
+) -> Tuple[Dict[str, Any], str, str]:
+    """
+    Convert validated patient data into a FHIR Patient resource.
+
+    Args:
+        patient (Patient_schema): Patient information of the validated LLM output.
+        resource_id (Optional[str]): Patient ID; a random UUID if not given.
+
+    Returns:
+        Tuple[Dict[str, Any], str, str]: FHIR Patient resource, patient_id and patient name.
+    """
+    patient_id = resource_id or str(uuid.uuid4())
+    address = patient.address
+
+    patient_resource = {
+        "resourceType": "Patient",
+        "id": patient_id,
+        "name": [{
+            "family": patient.second_name,
+            "given": [patient.first_name]
+        }],
+        "gender": patient.gender.value if patient.gender else None,
+        "birthDate": patient.birthDate,
+        "address": [{
+            "text": address.text,
+            "city": address.city,
+            "state": address.state,
+            "country": address.country
+        }] if address else None
+    }
+
+    return patient_resource, patient_id, f'{patient.first_name} {patient.second_name}'
 
 
 
 def lab_observation_to_fhir(
-        data: Dict[str, Any],
+        obs: LabObservation_schema,
         patient_id: int,
         encounter_id: int,
-        date: Optional[str] = None
-) -> Observation:
+        date: Optional[str] = None,
+        codes: Optional[Dict] = None,
+        resource_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Convert validated lab observation data into a FHIR Observation resource.
 
     Args:
-        data (Dict[str, Any]): Dictionary containing observation details.
+        obs (LabObservation_schema): Validated lab observation.
         patient_id (int): ID of the patient to reference in the Observation.
         encounter_id (int): ID of the encounter to reference in the Observation.
         date (Optional[str]): ISO 8601 datetime string for when the observation was effective.
-            Defaults to current UTC time if not provided.
+            Omitted if not provided.
+        codes (Optional[Dict]): Pre-resolved terminology map from `resolve_terms`.
+        resource_id (Optional[str]): Resource ID; a random UUID if not given.
 
     Returns:
-        str: JSON string representation of the FHIR Observation resource.
-
-    Raises:
-        ValueError: If the input data does not conform to LabObservation_schema.
+        Dict[str, Any]: FHIR Observation resource.
     """
-    try:
-        obs = LabObservation_schema(**data)
-    except ValidationError as err:
-        raise ValueError(f"Invalid lab observation structure: {err}")
-
-    loinc_info = get_loinc_code(obs.test_name)
+    loinc_info = code_for("loinc", obs.test_name, codes)
     if loinc_info:
         loinc_code, loinc_display = loinc_info
     else:
         loinc_code, loinc_display = "unknown", obs.test_name
 
 
-    observation = Observation(
-        id=str(uuid.uuid4()),
-        resourceType="Observation",
-        status=obs.status.value,
-        category=[
-            CodeableConcept(
-                coding=[
-                    Coding(
-                        system="http://terminology.hl7.org/CodeSystem/observation-category",
-                        code="laboratory",
-                        display="Laboratory"
-                    )
-                ],
-                text="Laboratory"
-            )
-        ],
-        code=CodeableConcept(
-            coding=[
-                Coding(
-                    system="http://loinc.org",
-                    code=loinc_code,
-                    display=loinc_display
-                )
-            ],
-            text=obs.test_name
-        ),
-        subject=Reference(reference=f"Patient/{patient_id}"),
-        encounter=Reference(reference=f"Encounter/{encounter_id}"),
-        effectiveDateTime=date or datetime.now(timezone.utc).isoformat()
-    )
+    observation = {
+        "resourceType": "Observation",
+        "id": resource_id or str(uuid.uuid4()),
+        "meta": PROVENANCE_META.get(obs.provenance),
+        "status": obs.status.value,
+        "category": OBSERVATION_CATEGORIES["laboratory"],
+        "code": {
+            "coding": [{
+                "system": "http://loinc.org",
+                "code": loinc_code,
+                "display": loinc_display
+            }],
+            "text": obs.test_name
+        },
+        "subject": {"reference": f"Patient/{patient_id}"},
+        "encounter": {"reference": f"Encounter/{encounter_id}"},
+        "effectiveDateTime": fhir_datetime(date) if date else None
+    }
 
     # Add valueQuantity if present
     if obs.value is not None and obs.unit:
-        observation.valueQuantity = Quantity(
-            value=obs.value,
-            unit=obs.unit,
-            system="http://unitsofmeasure.org",
-            code=obs.unit
-        )
+        observation["valueQuantity"] = {
+            "value": obs.value,
+            "unit": obs.unit,
+            "system": "http://unitsofmeasure.org",
+            "code": obs.unit
+        }
 
     # Add interpretation if exists
     if obs.interpretation:
-        code = interpretation_map.get(obs.interpretation.value, "A")
-        observation.interpretation = [
-            CodeableConcept(
-                coding=[
-                    Coding(
-                        system="http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation",
-                        code=code,
-                        display=obs.interpretation.value.capitalize()
-                    )
-                ]
-            )
-        ]
+        observation["interpretation"] = INTERPRETATIONS[obs.interpretation]
 
     # Add definition (LOINC reference page)
     if loinc_code != "unknown":
-        observation.note = [{
+        observation["note"] = [{
             "text": f"Definition: https://loinc.org/{loinc_code}/"
         }]
 
     return observation
 
 def symptom_observation_to_fhir(
-    data: Dict[str, Any],
+    obs: SymptomObservation_schema,
     patient_id: str,
     encounter_id: Optional[str] = None,
-    date: Optional[str] = None
-) -> Observation:
+    date: Optional[str] = None,
+    codes: Optional[Dict] = None,
+    resource_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Convert validated symptom observation data into a FHIR Observation resource.
-    Mirrors lab_observation_to_fhir structure using fhir.resources classes.
+    Mirrors lab_observation_to_fhir structure.
 
     Args:
-        data (Dict[str, Any]): Dictionary containing symptom observation details.
+        obs (SymptomObservation_schema): Validated symptom observation.
         patient_id (str): Patient reference ID.
         encounter_id (Optional[str]): Encounter reference ID.
-        date (Optional[str]): ISO 8601 datetime string. Defaults to current UTC.
+        date (Optional[str]): ISO 8601 datetime string. Omitted if not provided.
+        codes (Optional[Dict]): Pre-resolved terminology map from `resolve_terms`.
+        resource_id (Optional[str]): Resource ID; a random UUID if not given.
 
     Returns:
-        str: JSON string of FHIR Observation.
-    Raises:
-        ValueError: If the input `data` does not conform to the SymptomObservation_schema.
-        Exception: For any unexpected FHIR object construction or serialization errors.
+        Dict[str, Any]: FHIR Observation resource.
     """
-    try:
-        obs = SymptomObservation_schema(**data)
-    except ValidationError as err:
-        raise ValueError(f"Invalid symptom observation structure: {err}")
-
-    snomed_info = get_snomed_code(obs.symptom_name)
+    snomed_info = code_for("snomed", obs.symptom_name, codes)
     if snomed_info:
         snomed_code, snomed_display = snomed_info
     else:
         snomed_code, snomed_display = "unknown", obs.symptom_name
 
     # Build Observation
-    observation = Observation(
-        id=str(uuid.uuid4()),
-        resourceType="Observation",
-        status=obs.status.value,
-        category=[
-            CodeableConcept(
-                coding=[
-                    Coding(
-                        system="http://terminology.hl7.org/CodeSystem/observation-category",
-                        code="exam",
-                        display="Exam"
-                    )
-                ],
-                text="Exam"
-            )
-        ],
-        code=CodeableConcept(
-            coding=[
-                Coding(
-                    system="http://snomed.info/sct",
-                    code=snomed_code,
-                    display=snomed_display
-                )
-            ],
-            text=obs.symptom_name
-        ),
-        subject=Reference(reference=f"Patient/{patient_id}"),
-        encounter=Reference(reference=f"Encounter/{encounter_id}"),
-        effectivePeriod={
-            "start": date or datetime.now(timezone.utc).isoformat()
-        }
-    )
-
-    # Symptom presence
-    observation.valueBoolean = bool(obs.present)
+    observation = {
+        "resourceType": "Observation",
+        "id": resource_id or str(uuid.uuid4()),
+        "status": obs.status.value,
+        "category": OBSERVATION_CATEGORIES["exam"],
+        "code": {
+            "coding": [{
+                "system": "http://snomed.info/sct",
+                "code": snomed_code,
+                "display": snomed_display
+            }],
+            "text": obs.symptom_name
+        },
+        "subject": {"reference": f"Patient/{patient_id}"},
+        "encounter": {"reference": f"Encounter/{encounter_id}"},
+        "effectivePeriod": {"start": fhir_datetime(date)} if date else None,
+        # Symptom presence
+        "valueBoolean": bool(obs.present)
+    }
 
     # Interpretation if exists
     if obs.interpretation:
-        code = interpretation_map.get(obs.interpretation.value, "A")
-        observation.interpretation = [
-            CodeableConcept(
-                coding=[
-                    Coding(
-                        system="http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation",
-                        code=code,
-                        display=obs.interpretation.value.capitalize()
-                    )
-                ],
-                text=obs.interpretation.value.capitalize()
-            )
-        ]
+        observation["interpretation"] = INTERPRETATIONS_WITH_TEXT[obs.interpretation]
 
     # SNOMED reference
     if snomed_code != "unknown":
-        observation.note = [{
+        observation["note"] = [{
             "text": f"Definition: https://snomed.info/id/{snomed_code}"
         }]
 
@@ -290,118 +331,83 @@ def symptom_observation_to_fhir(
 
 
 def vital_observation_to_fhir(
-    data: dict,
+    obs: VitalSignObservation_schema,
     patient_id: str,
     encounter_id: Optional[str] = None,
-    date: Optional[str] = None
-) -> Observation:
+    date: Optional[str] = None,
+    codes: Optional[Dict] = None,
+    resource_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Convert a validated vital sign observation into a FHIR-compliant Observation resource.
 
     Args:
-        data (dict): Dictionary containing vital observation details following the
-            VitalSignObservation_schema format
+        obs (VitalSignObservation_schema): Validated vital sign observation.
         patient_id (str): Unique FHIR Patient resource ID reference.
         encounter_id (Optional[str]): Optional FHIR Encounter resource ID reference.
         date (Optional[str]): ISO 8601 datetime string indicating when the observation
-            was effective. Defaults to current UTC time if not provided.
+            was effective. Omitted if not provided.
+        codes (Optional[Dict]): Pre-resolved terminology map from `resolve_terms`.
+        resource_id (Optional[str]): Resource ID; a random UUID if not given.
 
     Returns:
-        str: JSON-formatted string representing the FHIR Observation resource
-             (resourceType = "Observation"), suitable for use in clinical data exchange
-             or FHIR servers.
-
-    Raises:
-        ValueError: If the input `data` does not conform to the VitalSignObservation_schema.
-        Exception: For any unexpected FHIR object construction or serialization errors.
+        Dict[str, Any]: FHIR Observation resource (resourceType = "Observation"),
+             suitable for use in clinical data exchange or FHIR servers.
     """
-
-    try:
-        obs = VitalSignObservation_schema(**data)
-    except ValidationError as e:
-        raise ValueError(f"Invalid vital observation structure: {e}")
-
-    loinc_info = get_loinc_code(obs.vital_type)
+    loinc_info = code_for("loinc", obs.vital_type, codes)
     if loinc_info:
         loinc_code, loinc_display = loinc_info
     else:
         loinc_code, loinc_display = "unknown", obs.vital_type
 
 
-    observation = Observation(
-            id=str(uuid.uuid4()),
-            resourceType="Observation",
-            status=obs.status.value,
-            category=[
-                CodeableConcept(
-                    coding=[
-                        Coding(
-                            system="http://terminology.hl7.org/CodeSystem/observation-category",
-                            code="vital-signs",
-                            display="Vital Signs"
-                        )
-                    ],
-                    text="Vital Signs"
-                )
-            ],
-            code=CodeableConcept(
-                coding=[Coding(system="http://loinc.org", code=loinc_code, display=loinc_display)],
-                text=obs.vital_type
-            ),
-            subject=Reference(reference=f"Patient/{patient_id}"),
-            encounter=Reference(reference=f"Encounter/{encounter_id}"),
-            effectiveDateTime=date or datetime.now(timezone.utc).isoformat()
-        )
+    observation = {
+        "resourceType": "Observation",
+        "id": resource_id or str(uuid.uuid4()),
+        "meta": PROVENANCE_META.get(obs.provenance),
+        "status": obs.status.value,
+        "category": OBSERVATION_CATEGORIES["vital-signs"],
+        "code": {
+            "coding": [{"system": "http://loinc.org", "code": loinc_code, "display": loinc_display}],
+            "text": obs.vital_type
+        },
+        "subject": {"reference": f"Patient/{patient_id}"},
+        "encounter": {"reference": f"Encounter/{encounter_id}"},
+        "effectiveDateTime": fhir_datetime(date) if date else None
+    }
 
     if obs.value is not None and obs.unit:
-        observation.valueQuantity = Quantity(
-            value=obs.value,
-            unit=obs.unit,
-            system="http://unitsofmeasure.org",
-            code=obs.unit
-        )
+        observation["valueQuantity"] = {
+            "value": obs.value,
+            "unit": obs.unit,
+            "system": "http://unitsofmeasure.org",
+            "code": obs.unit
+        }
 
     if obs.interpretation:
-        code = interpretation_map.get(obs.interpretation.value, "A")
-        observation.interpretation = [
-            CodeableConcept(
-                coding=[Coding(
-                    system="http://terminology.hl7.org/CodeSystem/v3-ObservationInterpretation",
-                    code=code,
-                    display=obs.interpretation.value.capitalize()
-                )],
-                text=obs.interpretation.value.capitalize()
-            )
-        ]
+        observation["interpretation"] = INTERPRETATIONS_WITH_TEXT[obs.interpretation]
 
     return observation
 
 
 def family_history_to_fhir_json(
-        data: Dict,
-        patient_id: str
-) -> FamilyMemberHistory:
+        fam_history: FamilyHistorySchema,
+        patient_id: str,
+        codes: Optional[Dict] = None,
+        resource_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
-    Convert structured family history data (parsed from LLM output) into a FHIR-compliant JSON string.
+    Convert structured family history data (parsed from LLM output) into a FHIR-compliant List resource.
     Args:
-        data (dict): Dictionary containing structured family history data following the
-            FamilyHistorySchema format
+        fam_history (FamilyHistorySchema): Validated family history.
         patient_id (str): Unique FHIR Patient ID to link the FamilyMemberHistory resources to.
+        codes (Optional[Dict]): Pre-resolved terminology map from `resolve_terms`.
+        resource_id (Optional[str]): Resource ID; a random UUID if not given.
     Returns:
-        str: A JSON-formatted string representing the complete FHIR List resource with nested
-        FamilyMemberHistory entries. The JSON structure complies with FHIR R4 standards.
-
-    Raises:
-        ValueError: If the provided JSON does not conform to the FamilyHistorySchema.
-        Exception: For unexpected FHIR construction or serialization errors.
+        Dict[str, Any]: The complete FHIR List resource with nested (contained)
+        FamilyMemberHistory entries. The structure complies with FHIR R4 standards.
     """
 
-    # Validate and parse the LLM JSON
-    try:
-        fam_history = FamilyHistorySchema(**data)
-    except ValidationError as e:
-        raise ValueError(f"Invalid family history structure: {e}")
-
     members = fam_history.members
     list_note_text = fam_history.note
 
@@ -415,14 +421,14 @@ def family_history_to_fhir_json(
         for idx, member in enumerate(members, start=1):
             fmh_id = f"fmh-{idx}"
 
-            rel_code, rel_display = get_snomed_code(member.relationship) or ("unknown", member.relationship)
+            rel_code, rel_display = code_for("snomed", member.relationship, codes) or ("unknown", member.relationship)
 
         #Map condition
         condition_list = []
         for cond in member.conditions:
             cond_name = cond.condition_name
             cond_outcome = cond.outcome
-            cond_code, cond_display = get_snomed_code(cond_name) or ("unknown", cond_name)
+            cond_code, cond_display = code_for("snomed", cond_name, codes) or ("unknown", cond_name)
             cond_entry = {
                 "code": {
                     "coding": [{
@@ -434,7 +440,7 @@ def family_history_to_fhir_json(
             }
 
             if cond_outcome:
-                outcome_code, outcome_display = get_snomed_code(cond_outcome) or ("unknown", cond_outcome)
+                outcome_code, outcome_display = code_for("snomed", cond_outcome, codes) or ("unknown", cond_outcome)
                 cond_entry["outcome"] = {
                     "coding": [{
                         "system": "http://snomed.info/sct",
@@ -444,99 +450,98 @@ def family_history_to_fhir_json(
                 }
             condition_list.append(cond_entry)
 
-        fmh_resource = FamilyMemberHistory(
-            id=fmh_id,
-            resourceType="FamilyMemberHistory",
-            status="completed",
-            patient=Reference(reference=f"Patient/{patient_id}"),
-            relationship=CodeableConcept(
-                coding=[Coding(system="http://snomed.info/sct", code=rel_code, display=rel_display)]
-            ),
-            deceasedBoolean=member.deceased,
-            condition=condition_list
-        )
+        fmh_resource = {
+            "resourceType": "FamilyMemberHistory",
+            "id": fmh_id,
+            "status": "completed",
+            "patient": {"reference": f"Patient/{patient_id}"},
+            "relationship": {
+                "coding": [{"system": "http://snomed.info/sct", "code": rel_code, "display": rel_display}]
+            },
+            "deceasedBoolean": member.deceased,
+            "condition": condition_list
+        }
 
         contained_resources.append(fmh_resource)
         entries.append({"item": {"reference": f"#{fmh_id}"}})
 
-        family_history = FHIRList(
-            id=str(uuid.uuid4()),
-            resourceType="List",
-            contained=contained_resources,
-            status="current",
-            mode="snapshot",
-            code=CodeableConcept(
-                coding=[Coding(
-                    system="http://loinc.org",
-                    code="8670-2",
-                    display="History of family member diseases"
-                )]
-            ),
-            subject=[Reference(reference=f"Patient/{patient_id}")],
-            note=[{"text": list_note_text}] if list_note_text else None,
-            entry=entries
-        )
+        family_history = {
+            "resourceType": "List",
+            "id": resource_id or str(uuid.uuid4()),
+            "contained": contained_resources,
+            "status": "current",
+            "mode": "snapshot",
+            "code": {
+                "coding": [{
+                    "system": "http://loinc.org",
+                    "code": "8670-2",
+                    "display": "History of family member diseases"
+                }]
+            },
+            "subject": [{"reference": f"Patient/{patient_id}"}],
+            "note": [{"text": list_note_text}] if list_note_text else None,
+            "entry": entries
+        }
 
         return family_history
 
 
 def medication_to_fhir(
-        data: Dict[str, Any],
+        med: MedicationSchema,
         patient_id: int,
         encounter_id: Optional[int] = None,
-        date: Optional[str] = None
-) -> MedicationStatement:
+        date: Optional[str] = None,
+        codes: Optional[Dict] = None,
+        resource_id: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Convert validated medication data into a FHIR MedicationStatement resource
     with full adherence and timing support.
+    `codes` is an optional pre-resolved terminology map from `resolve_terms`;
+    `resource_id` defaults to a random UUID.
     """
-    try:
-        med = MedicationSchema(**data)
-    except ValidationError as err:
-        raise ValueError(f"Invalid medication structure: {err}")
-
-    snomed_code, snomed_display = get_snomed_code(med.name)
-
-    med_statement = MedicationStatement(
-        id=str(uuid.uuid4()),
-        resourceType="MedicationStatement",
-        status="recorded",
-        medication=CodeableReference(
-            concept=CodeableConcept(
-                coding=[Coding(
-                    system="http://snomed.info/sct",
-                    code=snomed_code,
-                    display=snomed_display
-                )],
-                text=med.name
-            )
-        ),
-        subject=Reference(reference=f"Patient/{patient_id}"),
-        encounter=Reference(reference=f"Encounter/{encounter_id}"),
-        effectiveDateTime=date or datetime.now(timezone.utc).isoformat(),
-        informationSource=[Reference(reference=f"Patient/{patient_id}")]
-    )
+    snomed_code, snomed_display = code_for("snomed", med.name, codes)
+
+    med_statement = {
+        "resourceType": "MedicationStatement",
+        "id": resource_id or str(uuid.uuid4()),
+        "status": "recorded",
+        "medication": {
+            "concept": {
+                "coding": [{
+                    "system": "http://snomed.info/sct",
+                    "code": snomed_code,
+                    "display": snomed_display
+                }],
+                "text": med.name
+            }
+        },
+        "subject": {"reference": f"Patient/{patient_id}"},
+        "encounter": {"reference": f"Encounter/{encounter_id}"},
+        "effectiveDateTime": fhir_datetime(date) if date else None,
+        "informationSource": [{"reference": f"Patient/{patient_id}"}]
+    }
 
     # Note
     if med.note:
-        med_statement.note = [Annotation(text=med.note)]
+        med_statement["note"] = [{"text": med.note}]
 
     # Dosage with timing
     if med.dosage_text or (med.frequency and med.period):
         timing = None
         if med.frequency and med.period:
-            timing = Timing(
-                repeat={
+            timing = {
+                "repeat": {
                     "frequency": med.frequency if med.frequency else None,
                     "period": med.period if med.period else None,
                     "periodUnit": med.period_unit.value if med.period_unit else None
                 }
-            )
-        dosage = Dosage(
-            text=med.dosage_text,
-            timing=timing
-        )
-        med_statement.dosage = [dosage]
+            }
+        dosage = {
+            "text": med.dosage_text,
+            "timing": timing
+        }
+        med_statement["dosage"] = [dosage]
 
     if med.adherence:
         # Adherence
@@ -562,65 +567,47 @@ def medication_to_fhir(
                 }]
             }
 
-        med_statement.adherence = adherence_dict
+        med_statement["adherence"] = adherence_dict
 
     return med_statement
 
 def encounter_to_fhir(
-        data: dict,
+        encounter: Encounter,
         patient_id: str,
         patient_name: Optional[str] = None,
-) -> tuple[Encounter, int]:
+        resource_id: Optional[str] = None
+) -> Tuple[Dict[str, Any], str]:
     """
-    Convert LLM data into a FHIR Encounter resource.
+    Convert a validated encounter into a FHIR Encounter resource.
 
     Args:
-        data: LLM data
+        encounter: Validated encounter of the LLM output
         patient_id: Patient ID
         patient_name: Patient name
+        resource_id: Encounter ID; a random UUID if not given
     Returns:
-        Tuple[Encounter, int]: Encounter and patient ID.
+        Tuple[Dict[str, Any], str]: FHIR Encounter resource and encounter ID.
     """
-    try:
-        encounter = EncounterSchema(**data)
-    except ValidationError as err:
-        raise ValueError(f"Invalid encounter structure: {err}")
-
-    encounter_id = str(uuid.uuid4())
-    try:
-        encounter_resource = Encounter(
-            id=encounter_id,
-            resourceType="Encounter",
-            identifier=[Identifier(
-                use="temp",
-                value=f"Encounter_{patient_name if patient_name else patient_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            )],
-            status="completed",
-            priority=CodeableConcept(
-                coding=[Coding(
-                    system="http://snomed.info/sct",
-                    code="17621005",
-                    display="Normal"
-                )]
-            ),
-            type=[CodeableConcept(
-                coding=[Coding(
-                    system="http://snomed.info/sct",
-                    code="11429006",
-                    display="Consultation"
-                )]
-            )],
-            subject=Reference(
-                reference=f"Patient/{patient_id}",
-                display=patient_name
-            )
-        )
-    except ValidationError as err:
-        raise ValueError(f"Invalid encounter structure: {err}")
+    encounter_id = resource_id or str(uuid.uuid4())
+    encounter_resource = {
+        "resourceType": "Encounter",
+        "id": encounter_id,
+        "identifier": [{
+            "use": "temp",
+            "value": f"Encounter_{patient_name if patient_name else patient_id}_{encounter_id}"
+        }],
+        "status": "completed",
+        "priority": ENCOUNTER_PRIORITY_NORMAL,
+        "type": ENCOUNTER_TYPE_CONSULTATION,
+        "subject": {
+            "reference": f"Patient/{patient_id}",
+            "display": patient_name
+        }
+    }
 
     # Assign reason from LLM if provided
     if encounter.reason:
-        encounter_resource.reason = [{
+        encounter_resource["reason"] = [{
             "value": [{
                 "concept": {
                     "text": encounter.reason
@@ -630,123 +617,319 @@ def encounter_to_fhir(
 
     return encounter_resource, encounter_id
 
+def collect_terms(llm_output: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """
+    Planning pass over the LLM output: gather every term that needs a terminology
+    lookup, grouped by code system.
+
+    Args:
+        llm_output: LLM output following OUTPUT_SCHEMA
+    Returns:
+        Dict[str, Set[str]]: Terms keyed by code system ("loinc", "snomed").
+    """
+    terms: Dict[str, Set[str]] = {"loinc": set(), "snomed": set()}
+
+    for encounter_data in llm_output.get("encounters") or []:
+        obs_data = encounter_data.get("observation") or {}
+        terms["loinc"].update(lab.get("test_name") for lab in obs_data.get("laboratory") or [])
+        terms["loinc"].update(vital.get("vital_type") for vital in obs_data.get("vital_sign") or [])
+        terms["snomed"].update(sym.get("symptom_name") for sym in obs_data.get("symptom") or [])
+        terms["snomed"].update(med.get("name") for med in encounter_data.get("medication") or [])
+
+    for member in (llm_output.get("family_history") or {}).get("members") or []:
+        terms["snomed"].add(member.get("relationship"))
+        for cond in member.get("conditions") or []:
+            terms["snomed"].update((cond.get("condition_name"), cond.get("outcome")))
+
+    for system_terms in terms.values():
+        system_terms.discard(None)
+    return terms
+
+
+class TermPrefetcher:
+    """
+    Resolves the terms of streamed LLM fragments in the background, so that
+    terminology lookups overlap with generation. Use as the `on_fragment`
+    callback of `process_patient_records_stream` and pass `result()` to
+    `to_fhir_bundle`.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = []
+
+    def __call__(self, name: str, value: Dict[str, Any]) -> None:
+        if name == "encounters":
+            terms = collect_terms({"encounters": [value]})
+            self._futures.append(self._executor.submit(resolve_terms, terms))
+
+    def result(self) -> Dict:
+        """Wait for all pending lookups and return the merged terminology map."""
+        codes = {}
+        for future in self._futures:
+            codes.update(future.result())
+        self._executor.shutdown()
+        return codes
+
+
+def resolve_case_terms(llm_output: Dict[str, Any], codes: Optional[Dict] = None) -> Dict:
+    """
+    Resolve every distinct term of a case not resolved yet, in one concurrent step.
+
+    Args:
+        llm_output: LLM output following OUTPUT_SCHEMA, validated here into the Patient model
+        codes: Terminology map already resolved for part of the case (e.g. by TermPrefetcher)
+    Returns:
+        Dict: Terminology map covering all terms of the case.
+    """
+    codes = dict(codes or {})
+    terms = collect_terms(llm_output)
+    for system, system_terms in terms.items():
+        terms[system] = {term for term in system_terms if (system, normalize_term(term)) not in codes}
+    codes.update(resolve_terms(terms))
+    return codes
+
+
 def to_fhir_bundle(
         llm_output: Dict[str, Any],
         case_id: int,
-        output_dir:Path = './data/output') -> str:
+        output_dir:Path = './data/output',
+        codes: Optional[Dict] = None,
+        ndjson: Optional[NDJSONBulkWriter] = None,
+        on_written: Optional[Callable[[Path], None]] = None) -> str:
     """
     Convert the structured LLM output (patient case) into a full FHIR Bundle.
 
+    Resource IDs are deterministic (see `make_resource_id`), keyed by
+    "<output_dir name>/<case_id>", so converting the same output again
+    rewrites the same file.
+
     Args:
         llm_output: LLM output
         case_id: case ID
         output_dir: Output directory
+        codes: Terminology map already resolved for part of the case (e.g. by TermPrefetcher)
+        ndjson: NDJSON bulk export to append the resources to, instead of writing a bundle file
+        on_written: Called with the output path once the output is on disk (for NDJSON,
+            when the writer flushes the case)
+    Returns:
+        str: Path of the FHIR Bundle file (of the NDJSON export directory with `ndjson`)
+    """
+    output_dir = Path(output_dir)
+    codes = resolve_case_terms(llm_output, codes)
+    case_key = f"{output_dir.name}/{case_id}"
+    bundle, patient_id = build_fhir_bundle(llm_output, codes, case_key=case_key)
+    if ndjson is not None:
+        return write_fhir_ndjson(bundle, ndjson, case_key,
+                                 on_flushed=partial(on_written, ndjson.directory) if on_written else None)
+    path = write_fhir_bundle(bundle, patient_id, case_id, output_dir)
+    if on_written:
+        on_written(path)
+    return path
+
+
+def _entry(resource: Dict[str, Any], resource_type: str) -> Dict[str, Any]:
+    return {
+        "fullUrl": f"urn:uuid:{resource['id']}",
+        "resource": resource,
+        "request": {"method": "POST", "url": resource_type}
+    }
+
+
+def build_fhir_bundle(
+        llm_output: Dict[str, Any],
+        codes: Optional[Dict] = None,
+        case_key: Optional[str] = None
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Build the FHIR transaction Bundle of a case.
+
+    Args:
+        llm_output: LLM output
+        codes: Terminology map from `resolve_case_terms`; missing terms are looked up one by one
+        case_key: Stable case identifier (e.g. "<disease>/<case_id>") the resource IDs are derived
+            from; random IDs if not given
     Returns:
-        str: Output directory for FHIR Bundle
+        Tuple[Dict[str, Any], str]: The bundle (JSON form, see `serialize_bundle`) and the patient ID.
+    Raises:
+        ValueError: If the LLM output does not match OUTPUT_SCHEMA.
     """
 
-    entries: List[BundleEntry] = []
+    # Validate the whole output once; builders get typed objects
+    try:
+        patient = validate_llm_output(llm_output)
+    except ValidationError as err:
+        raise ValueError(f"Invalid LLM output structure: {err}")
+
+    entries: List[Dict[str, Any]] = []
 
     # PATIENT
-    patient_resource, patient_id, patient_name = patient_to_fhir(llm_output["patient"])
-    entries.append(
-        BundleEntry(
-            fullUrl=f"urn:uuid:{patient_id}",
-            resource=patient_resource,
-            request=BundleEntryRequest(method="POST", url="Patient")
-        )
+    patient_resource, patient_id, patient_name = patient_to_fhir(
+        patient.patient_info,
+        resource_id=make_resource_id(case_key, "patient", _id_content(patient.patient_info))
     )
+    entries.append(_entry(patient_resource, "Patient"))
 
     # ENCOUNTER
-    for encounter_data in llm_output.get("encounters", []):
-        date = encounter_data["encounter_date"]
+    for enc_idx, encounter in enumerate(patient.encounters):
+        date = encounter.encounter_date
+        enc_path = f"encounter/{enc_idx}"
         encounter_resource, encounter_id = encounter_to_fhir(
-            encounter_data,
+            encounter,
             patient_id=patient_id,
-            patient_name=patient_name
-        )
-
-        entries.append(
-            BundleEntry(
-                fullUrl=f"urn:uuid:{encounter_id}",
-                resource=encounter_resource,
-                request=BundleEntryRequest(method="POST", url="Encounter")
-            )
+            patient_name=patient_name,
+            resource_id=make_resource_id(case_key, enc_path, [date, encounter.reason])
         )
+        entries.append(_entry(encounter_resource, "Encounter"))
 
         #observations
-        obs_data = encounter_data.get("observation", {})
+        observation = encounter.observation
         #lab
-        for lab in obs_data.get("laboratory", []):
+        for idx, lab in enumerate(observation.laboratory):
             obs = lab_observation_to_fhir(
                 lab,
                 patient_id,
                 encounter_id,
-                date)
-            entries.append(BundleEntry(
-                fullUrl=f"urn:uuid:{obs.id}",
-                resource=obs,
-                request=BundleEntryRequest(method="POST", url="Observation"),
-
-            ))
+                date,
+                codes=codes,
+                resource_id=make_resource_id(case_key, f"{enc_path}/laboratory/{idx}", _id_content(lab)))
+            entries.append(_entry(obs, "Observation"))
         #symptom
-        for sym in obs_data.get("symptom", []):
+        for idx, sym in enumerate(observation.symptom):
             obs = symptom_observation_to_fhir(
                 sym,
                 patient_id,
                 encounter_id,
-                date)
-            entries.append(BundleEntry(
-                fullUrl=f"urn:uuid:{obs.id}",
-                resource=obs,
-                request=BundleEntryRequest(method="POST", url="Observation")
-            ))
+                date,
+                codes=codes,
+                resource_id=make_resource_id(case_key, f"{enc_path}/symptom/{idx}", _id_content(sym)))
+            entries.append(_entry(obs, "Observation"))
         #vital signs
-        for vital in obs_data.get("vital_sign", []):
+        for idx, vital in enumerate(observation.vital_sign):
             obs = vital_observation_to_fhir(
                 vital,
                 patient_id,
                 encounter_id,
-                date)
-            entries.append(BundleEntry(
-                fullUrl=f"urn:uuid:{obs.id}",
-                resource=obs,
-                request=BundleEntryRequest(method="POST", url="Observation")
-            ))
+                date,
+                codes=codes,
+                resource_id=make_resource_id(case_key, f"{enc_path}/vital_sign/{idx}", _id_content(vital)))
+            entries.append(_entry(obs, "Observation"))
 
         #medications
-        for med in encounter_data.get("medication", []):
+        for idx, med in enumerate(encounter.medication):
             med_res = medication_to_fhir(
                 med,
                 patient_id,
                 encounter_id,
-                date)
-            entries.append(BundleEntry(
-                fullUrl=f"urn:uuid:{med_res.id}",
-                resource=med_res,
-                request=BundleEntryRequest(method="POST", url="MedicationStatement")
-            ))
+                date,
+                codes=codes,
+                resource_id=make_resource_id(case_key, f"{enc_path}/medication/{idx}", _id_content(med)))
+            entries.append(_entry(med_res, "MedicationStatement"))
 
     # FAMILY HISTORY
-    if "family_history" in llm_output and llm_output["family_history"].get("members"):
-        fam_hist = family_history_to_fhir_json(llm_output["family_history"], patient_id)
-        entries.append(
-            BundleEntry(
-                fullUrl=f"urn:uuid:{fam_hist.id}",
-                resource=fam_hist,
-                request=BundleEntryRequest(method="POST", url="FamilyMemberHistory")
-            )
+    if patient.family_history.members:
+        fam_hist = family_history_to_fhir_json(
+            patient.family_history,
+            patient_id,
+            codes=codes,
+            resource_id=make_resource_id(case_key, "family_history", _id_content(patient.family_history))
         )
+        entries.append(_entry(fam_hist, "FamilyMemberHistory"))
 
     # BUNDLE
-    bundle = Bundle(
-        type="transaction",
-        entry=entries
-    )
+    bundle = {
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": entries
+    }
+    return bundle, patient_id
+
+
+def _prune(value: Any) -> Any:
+    """Drop None values from dicts, recursively (fhir.resources excludes them when serializing)."""
+    if isinstance(value, dict):
+        return {k: _prune(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_prune(v) for v in value]
+    return value
+
+
+def _in_validation_sample(bundle: Dict[str, Any]) -> bool:
+    # Sampled on the (deterministic) patient URL, so a case is either always or never validated
+    key = bundle["entry"][0]["fullUrl"] if bundle["entry"] else ""
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 < settings.FHIR_VALIDATION_SAMPLE_RATE
+
+
+def checked_bundle(bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON form of a bundle built by `build_fhir_bundle`, ready to be dumped with pydantic-core.
+
+    With FHIR_STRICT_VALIDATION, or for a FHIR_VALIDATION_SAMPLE_RATE fraction of the
+    cases (chosen from the patient ID), the bundle is also validated with fhir.resources
+    and a warning is logged if the two serializations differ. The output is always the
+    dict-built JSON, so it does not depend on whether the bundle was validated.
+
+    Args:
+        bundle (Dict[str, Any]): Bundle dict.
+    Returns:
+        Dict[str, Any]: The bundle without None values.
+    Raises:
+        ValueError: If validation is strict and the bundle is not a valid FHIR Bundle.
+    """
+    pruned = _prune(bundle)
+    if not settings.FHIR_STRICT_VALIDATION and not _in_validation_sample(bundle):
+        return pruned
 
+    # fhir.resources is slow to import and only needed here
+    from fhir.resources.bundle import Bundle
+
+    try:
+        validated_json = Bundle.model_validate(bundle).model_dump_json(indent=2)
+    except ValidationError as err:
+        if settings.FHIR_STRICT_VALIDATION:
+            raise ValueError(f"Invalid FHIR bundle: {err}")
+        logger.warning(f"FHIR bundle failed validation: {err}")
+        return pruned
+
+    if validated_json != to_json(pruned, indent=2).decode():
+        logger.warning("Fast FHIR serialization differs from fhir.resources output")
+    return pruned
+
+
+def serialize_bundle(bundle: Dict[str, Any]) -> str:
+    """
+    Serialize a bundle built by `build_fhir_bundle` to indented JSON (see `checked_bundle`).
+    """
+    return to_json(checked_bundle(bundle), indent=2).decode()
+
+
+def write_fhir_bundle(bundle: Dict[str, Any], patient_id: str, case_id: int, output_dir: Path) -> Path:
+    """
+    Serialize a bundle to `<output_dir>/<case_id>_<patient_id>.json`.
+    """
     output_dir.mkdir(parents=True, exist_ok=True)
     filename = output_dir / f"{case_id}_{patient_id}.json"
-    bundle_json = bundle.model_dump_json(indent=2)
+    bundle_json = serialize_bundle(bundle)
     with open(filename, "w", encoding="utf-8") as f:
         f.write(bundle_json)
     return filename
+
+
+def write_fhir_ndjson(
+        bundle: Dict[str, Any],
+        writer: NDJSONBulkWriter,
+        case_key: str,
+        on_flushed: Optional[Callable[[], None]] = None
+) -> Path:
+    """
+    Write the resources of a case's bundle to an NDJSON bulk export, one line per
+    resource in its `<resourceType>.ndjson` file. The resources of an earlier
+    conversion of the case are replaced. The lines are buffered: `on_flushed` is
+    called once they are on disk.
+
+    Returns:
+        Path: The export directory.
+    """
+    writer.write_case(case_key, [entry["resource"] for entry in checked_bundle(bundle)["entry"]], on_flushed)
+    return writer.directory
@@ -0,0 +1,168 @@
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.services.json_to_fhir import (build_fhir_bundle, checked_bundle, collect_terms, resolve_case_terms,
+                                      write_fhir_bundle)
+from src.utils.codes_request import resolve_terms
+from src.utils.ndjson_writer import NDJSONWriterPool
+from src.utils.terminology_cache import normalize_term
+
+logger = logging.getLogger(__name__)
+
+# (disease, case ID, LLM output)
+ConversionItem = Tuple[str, str, Dict[str, Any]]
+
+# Per-process state set by _init_worker: pre-resolved terminology map and output settings
+_worker: Dict[str, Any] = {}
+
+
+def prewarm_terms(llm_outputs: Iterable[Dict[str, Any]]) -> Dict:
+    """
+    Resolve the terms of all cases in one bulk lookup, before the cases are distributed.
+
+    Returns:
+        Dict: Terminology map (see `resolve_terms`) covering every case.
+    """
+    terms: Dict[str, Set[str]] = {"loinc": set(), "snomed": set()}
+    for llm_output in llm_outputs:
+        for system, system_terms in collect_terms(llm_output).items():
+            terms[system].update(system_terms)
+    started = time.perf_counter()
+    codes = resolve_terms(terms)
+    logger.info(f"Pre-resolved {len(codes)} terms in {time.perf_counter() - started:.1f}s")
+    return codes
+
+
+def _init_worker(codes: Dict, output_dir: str, ndjson: bool) -> None:
+    _worker.update(codes=codes, output_dir=Path(output_dir), ndjson=ndjson)
+
+
+def _case_codes(llm_output: Dict[str, Any]) -> Dict:
+    """The shared terminology map, completed with lookups only if some term of the case is missing."""
+    codes = _worker["codes"]
+    for system, system_terms in collect_terms(llm_output).items():
+        if any((system, normalize_term(term)) not in codes for term in system_terms):
+            return resolve_case_terms(llm_output, codes)
+    return codes
+
+
+def _convert_case(item: ConversionItem) -> Dict[str, Any]:
+    """
+    Build (and, for bundle output, write) the FHIR bundle of one case in a worker process.
+    Errors are returned rather than raised so a bad case does not stop the batch.
+    """
+    disease, case_id, llm_output = item
+    # CPU time: wall time would count waiting for a core when workers outnumber them
+    started = time.process_time()
+    result: Dict[str, Any] = {"disease": disease, "case_id": case_id, "pid": os.getpid()}
+    try:
+        bundle, patient_id = build_fhir_bundle(llm_output, _case_codes(llm_output), case_key=f"{disease}/{case_id}")
+        if _worker["ndjson"]:
+            # NDJSON files are shared by all cases: resources are written by the parent process
+            result["resources"] = [entry["resource"] for entry in checked_bundle(bundle)["entry"]]
+        else:
+            result["path"] = write_fhir_bundle(bundle, patient_id, case_id, _worker["output_dir"] / disease)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["cpu"] = time.process_time() - started
+    return result
+
+
+def convert_cases(
+        items: List[ConversionItem],
+        output_dir: Path,
+        workers: Optional[int] = None,
+        ndjson: Optional[NDJSONWriterPool] = None,
+        chunksize: Optional[int] = None,
+        on_written: Optional[Callable[[str, Path], None]] = None
+) -> Dict[str, Path]:
+    """
+    Convert LLM outputs (e.g. replayed from the LLM cache or returned by a batch job)
+    to FHIR on a process pool.
+
+    Bundle building is CPU-bound pydantic work, so cases are spread over `workers`
+    processes. Terminology lookups are done up front for all cases (`prewarm_terms`)
+    and the resulting map is handed to each worker once, so workers do no I/O besides
+    writing their bundles. Per-worker throughput is logged at the end.
+
+    Args:
+        items (List[ConversionItem]): (disease, case ID, LLM output) of each case.
+        output_dir (Path): Output directory; bundles go to `<output_dir>/<disease>/`.
+        workers (Optional[int]): Number of processes; one per CPU if not set. With 1 the
+            cases are converted in the current process.
+        ndjson (Optional[NDJSONWriterPool]): Append the resources to per-disease NDJSON
+            exports instead of writing bundle files.
+        chunksize (Optional[int]): Cases sent to a worker at a time.
+        on_written (Optional[Callable[[str, Path], None]]): Called with the case key and
+            output path once a case's output is on disk (for NDJSON, when the export
+            flushes the case, possibly after this function returns).
+    Returns:
+        Dict[str, Path]: Output path (bundle file, or NDJSON export directory) by
+        "<disease>/<case_id>", for the cases converted successfully.
+    """
+    if not items:
+        return {}
+    output_dir = Path(output_dir)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(items)))
+    chunksize = chunksize or max(1, len(items) // (workers * 4))
+    initargs = (prewarm_terms(llm_output for _, _, llm_output in items), str(output_dir), ndjson is not None)
+
+    started = time.perf_counter()
+    if workers == 1:
+        _init_worker(*initargs)
+        outputs, stats = _collect(map(_convert_case, items), output_dir, ndjson, on_written)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            outputs, stats = _collect(executor.map(_convert_case, items, chunksize=chunksize), output_dir, ndjson,
+                                      on_written)
+
+    _log_throughput(stats, time.perf_counter() - started, workers)
+    return outputs
+
+
+def _collect(
+        results: Iterable[Dict[str, Any]],
+        output_dir: Path,
+        ndjson: Optional[NDJSONWriterPool],
+        on_written: Optional[Callable[[str, Path], None]] = None
+) -> Tuple[Dict[str, Path], Dict[int, Dict[str, float]]]:
+    """Write/record the worker results as they arrive; returns the outputs and per-worker stats."""
+    outputs: Dict[str, Path] = {}
+    stats: Dict[int, Dict[str, float]] = {}
+    for result in results:
+        case_key = f"{result['disease']}/{result['case_id']}"
+        worker_stats = stats.setdefault(result["pid"], {"cases": 0, "failed": 0, "cpu": 0.0})
+        worker_stats["cpu"] += result["cpu"]
+        if "error" in result:
+            worker_stats["failed"] += 1
+            logger.error(f"Conversion of {case_key} failed: {result['error']}")
+            continue
+        worker_stats["cases"] += 1
+        if ndjson is not None:
+            writer = ndjson.writer(output_dir / result["disease"])
+            writer.write_case(case_key, result["resources"],
+                              partial(on_written, case_key, writer.directory) if on_written else None)
+            outputs[case_key] = writer.directory
+        else:
+            outputs[case_key] = result["path"]
+            if on_written:
+                on_written(case_key, result["path"])
+        logger.debug(f"FHIR output of {case_key}: {outputs[case_key]}")
+    return outputs, stats
+
+
+def _log_throughput(stats: Dict[int, Dict[str, float]], elapsed: float, workers: int) -> None:
+    total = sum(worker_stats["cases"] for worker_stats in stats.values())
+    cpu = sum(worker_stats["cpu"] for worker_stats in stats.values())
+    for pid, worker_stats in sorted(stats.items()):
+        rate = worker_stats["cases"] / worker_stats["cpu"] if worker_stats["cpu"] else 0.0
+        logger.info(f"Worker {pid}: {worker_stats['cases']:.0f} cases, {worker_stats['failed']:.0f} failed, "
+                    f"{worker_stats['cpu']:.1f}s CPU, {rate:.1f} cases/CPU-s")
+    # Speedup over one process doing the same work: ideally close to min(workers, cores)
+    logger.info(f"Converted {total} cases in {elapsed:.1f}s with {workers} worker(s): "
+                f"{total / elapsed if elapsed else 0:.1f} cases/s, speedup {cpu / elapsed if elapsed else 0:.1f}x")
@@ -0,0 +1,253 @@
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from src.services.generation import generate_cases
+from src.services.json_to_fhir import (TermPrefetcher, build_fhir_bundle, converter_fingerprint, resolve_case_terms,
+                                      write_fhir_bundle, write_fhir_ndjson)
+from src.services.text_to_json import check_pre_extraction, extract_patient_data
+from src.utils.llm_cache import LLMCacheMiss
+from src.utils.load_save import disease_key, save_generated_case
+from src.utils.manifest import ConversionManifest, case_input_hash
+from src.utils.ndjson_writer import NDJSONWriterPool
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("generate", "extract", "resolve", "build", "write")
+DEFAULT_CONCURRENCY = {"generate": 2, "extract": 4, "resolve": 4, "build": 2, "write": 2}
+DEFAULT_QUEUE_SIZE = 8
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+
+Job = Dict[str, Any]
+
+
+class CasePipeline:
+    """
+    asyncio pipeline turning cases into FHIR bundles:
+    generate -> extract -> resolve codes -> build bundle -> write.
+
+    Each stage runs `concurrency[stage]` workers that take jobs from a bounded
+    input queue and run the (blocking) stage function on a shared thread pool.
+    A full queue blocks the upstream workers, so a slow stage throttles the
+    stages before it instead of piling up work in memory, while the Bedrock
+    stages (generate, extract) stay busy as long as downstream keeps up.
+
+    A job is a dict that every stage enriches: "disease" and "case" (or
+    "generate": (disease, first variant, count) for cases still to be generated),
+    then "llm_output", "codes", "bundle"/"patient_id" and "path". A job failing
+    in any stage is logged and dropped.
+
+    With a `manifest`, cases whose input is unchanged since their last conversion
+    are dropped before extraction, and every written bundle is recorded. With
+    `ndjson`, resources are appended to per-disease NDJSON exports instead of
+    being written as one bundle file per case; those cases are recorded once the
+    export has flushed them (at the latest when the pool is closed).
+    """
+
+    def __init__(
+            self,
+            client,
+            model: str,
+            output_dir: Path,
+            cases_file: Optional[str] = None,
+            extraction: str = "converse",
+            pre_extraction: bool = False,
+            concurrency: Optional[Dict[str, int]] = None,
+            queue_size: int = DEFAULT_QUEUE_SIZE,
+            manifest: Optional[ConversionManifest] = None,
+            ndjson: Optional[NDJSONWriterPool] = None
+    ):
+        check_pre_extraction(extraction, pre_extraction)
+        self.client = client
+        self.model = model
+        self.output_dir = Path(output_dir)
+        self.cases_file = cases_file
+        self.extraction = extraction
+        self.pre_extraction = pre_extraction
+        self.concurrency = {stage: max(1, (concurrency or {}).get(stage, DEFAULT_CONCURRENCY[stage]))
+                            for stage in STAGES}
+        self.queue_size = queue_size
+        self.manifest = manifest
+        self.ndjson = ndjson
+
+        self._save_lock = threading.Lock()
+        self._stats = {stage: {"jobs": 0, "failed": 0, "busy": 0.0} for stage in STAGES}
+
+    # ==== Stage functions (run on worker threads) ====
+
+    def generate(self, job: Job) -> List[Job]:
+        if "generate" not in job:
+            return [job]
+        disease, variant, count = job["generate"]
+        case_texts = generate_cases(disease, count, self.client, self.model, logger, variant=variant)
+
+        jobs = []
+        for case_text in case_texts:
+            if not case_text:
+                continue
+            # The cases file is rewritten on every save
+            with self._save_lock:
+                case = save_generated_case(disease, case_text, self.cases_file)
+            jobs.append({"disease": disease_key(disease), "case": case})
+        return jobs
+
+    def extract(self, job: Job) -> Union[Job, List[Job]]:
+        if self.manifest is not None:
+            job["input_hash"] = case_input_hash(job["case"]["text"], model=self.model, extraction=self.extraction,
+                                                pre_extraction=self.pre_extraction,
+                                                converter=converter_fingerprint())
+            if self.manifest.is_current(_case_key(job), job["input_hash"]):
+                logger.info(f"Skipping unchanged case {_case_key(job)}")
+                return []
+        logger.info(f"Processing {job['disease']} - {job['case']['id']}")
+        prefetcher = TermPrefetcher() if self.extraction == "stream" else None
+        job["llm_output"] = extract_patient_data(job["case"]["text"], self.client, self.model, logger,
+                                                 extraction=self.extraction, pre_extraction=self.pre_extraction,
+                                                 on_fragment=prefetcher)
+        job["codes"] = prefetcher.result() if prefetcher else None
+        return job
+
+    def resolve(self, job: Job) -> Job:
+        job["codes"] = resolve_case_terms(job["llm_output"], job["codes"])
+        return job
+
+    def build(self, job: Job) -> Job:
+        job["bundle"], job["patient_id"] = build_fhir_bundle(job["llm_output"], job["codes"], case_key=_case_key(job))
+        return job
+
+    def write(self, job: Job) -> Job:
+        disease_dir = self.output_dir / job["disease"]
+        record = partial(self.manifest.record, _case_key(job), job["input_hash"]) if self.manifest else None
+        if self.ndjson is not None:
+            writer = self.ndjson.writer(disease_dir)
+            # Recorded once the writer has flushed the case's lines
+            job["path"] = write_fhir_ndjson(job["bundle"], writer, _case_key(job),
+                                            on_flushed=partial(record, writer.directory) if record else None)
+            logger.info(f"FHIR resources of {_case_key(job)} added to {job['path']}")
+        else:
+            job["path"] = write_fhir_bundle(job["bundle"], job["patient_id"], job["case"]["id"], disease_dir)
+            logger.info(f"FHIR bundle saved to {job['path']}")
+            if record:
+                record(job["path"])
+        return job
+
+    # ==== Orchestration ====
+
+    async def _stage(
+            self,
+            name: str,
+            func: Callable[[Job], Union[Job, List[Job]]],
+            inbox: asyncio.Queue,
+            outbox: asyncio.Queue,
+            executor: ThreadPoolExecutor
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        stats = self._stats[name]
+
+        async def worker():
+            while True:
+                job = await inbox.get()
+                if job is _DONE:
+                    # Leave the marker for the other workers of this stage
+                    await inbox.put(_DONE)
+                    return
+                start = time.perf_counter()
+                try:
+                    result = await loop.run_in_executor(executor, func, job)
+                except LLMCacheMiss as e:
+                    logger.warning(f"Skipping case in replay mode: {e}")
+                    stats["failed"] += 1
+                    continue
+                except Exception as e:
+                    logger.error(f"Pipeline stage '{name}' failed for {_describe(job)}: {e}")
+                    stats["failed"] += 1
+                    continue
+                finally:
+                    stats["busy"] += time.perf_counter() - start
+                stats["jobs"] += 1
+                for output in result if isinstance(result, list) else [result]:
+                    await outbox.put(output)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency[name])))
+        await outbox.put(_DONE)
+
+    async def _feed(self, jobs: Iterable[Job], queue: asyncio.Queue) -> None:
+        for job in jobs:
+            await queue.put(job)
+        await queue.put(_DONE)
+
+    async def run(self, jobs: Iterable[Job]) -> List[Path]:
+        """
+        Run all jobs through the pipeline.
+
+        Args:
+            jobs (Iterable[Job]): Initial jobs, from `case_jobs` and/or `generation_jobs`.
+        Returns:
+            List[Path]: Paths of the saved FHIR bundles, in completion order.
+        """
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(len(STAGES) + 1)]
+        # The last queue only collects finished jobs
+        queues[-1] = asyncio.Queue()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sum(self.concurrency.values()), thread_name_prefix="pipeline") as executor:
+            await asyncio.gather(
+                self._feed(jobs, queues[0]),
+                *(self._stage(name, getattr(self, name), queues[i], queues[i + 1], executor)
+                  for i, name in enumerate(STAGES))
+            )
+
+        paths = []
+        while not queues[-1].empty():
+            job = queues[-1].get_nowait()
+            if job is not _DONE:
+                paths.append(job["path"])
+
+        self._log_stats(time.perf_counter() - started)
+        return paths
+
+    def _log_stats(self, elapsed: float) -> None:
+        for name in STAGES:
+            stats = self._stats[name]
+            # Average number of busy workers: close to the concurrency limit for the bottleneck stage
+            logger.info(f"Stage {name}: {stats['jobs']} jobs, {stats['failed']} failed, "
+                        f"{stats['busy'] / elapsed if elapsed else 0:.1f}/{self.concurrency[name]} workers busy")
+        logger.info(f"Pipeline finished in {elapsed:.1f}s")
+
+
+def _case_key(job: Job) -> str:
+    return f"{job['disease']}/{job['case']['id']}"
+
+
+def _describe(job: Job) -> str:
+    if "case" in job:
+        return f"{job['disease']} - {job['case']['id']}"
+    disease, variant, count = job["generate"]
+    return f"{disease} (generation of cases {variant}-{variant + count - 1})"
+
+
+def case_jobs(cases: Dict[str, List[dict]]) -> List[Job]:
+    """Jobs for cases already in the cases file."""
+    return [{"disease": disease, "case": case} for disease, case_list in (cases or {}).items() for case in case_list]
+
+
+def generation_jobs(diseases: List[dict], batch_size: int = 1) -> List[Job]:
+    """Jobs generating `num_generation` cases per disease entry, `batch_size` cases per call."""
+    jobs = []
+    for disease_entry in diseases:
+        num_gen = disease_entry.get("num_generation", 1)
+        for start in range(0, num_gen, batch_size):
+            jobs.append({"generate": (disease_entry["name"], start, min(batch_size, num_gen - start))})
+    return jobs
+
+
+def run_pipeline(pipeline: CasePipeline, jobs: Iterable[Job]) -> List[Path]:
+    """Synchronous entry point running `CasePipeline.run` on a fresh event loop."""
+    return asyncio.run(pipeline.run(jobs))
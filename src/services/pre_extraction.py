@@ -0,0 +1,324 @@
+import re
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.terminology_cache import normalize_term
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = r"(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)"
+
+# (vital_type, pattern, unit); the first group is the value. Vital types are LOINC display names.
+VITAL_PATTERNS: List[Tuple[str, re.Pattern, Optional[str]]] = [
+    ("Body temperature", re.compile(
+        r"\b(?:temperature|temp|febrile|fever)\D{0,30}?" + _NUMBER + r"\s*(?:°|º|degrees?)\s*(C|F|Celsius|Fahrenheit)\b",
+        re.IGNORECASE), None),
+    ("Heart rate", re.compile(
+        r"\b(?:heart rate|pulse(?: rate)?|HR)\D{0,20}?" + _NUMBER + r"\s*(?:bpm|beats(?: per |/)min(?:ute)?)",
+        re.IGNORECASE), "/min"),
+    ("Respiratory rate", re.compile(
+        r"\b(?:respiratory rate|RR)\D{0,20}?" + _NUMBER + r"\s*(?:breaths(?: per |/)min(?:ute)?|/min)",
+        re.IGNORECASE), "/min"),
+    ("Oxygen saturation", re.compile(
+        r"\b(?:oxygen saturation|SpO2|O2 sat(?:uration)?|saturating)\D{0,20}?" + _NUMBER + r"\s*%",
+        re.IGNORECASE), "%"),
+    ("Body weight", re.compile(
+        r"\bweigh(?:s|t|ing|ed)?\D{0,20}?" + _NUMBER + r"\s*(kg|kilograms?|lbs?|pounds)\b",
+        re.IGNORECASE), None),
+    ("Body height", re.compile(
+        r"\b(?:height|measur(?:es|ing))\D{0,20}?" + _NUMBER + r"\s*(cm|m)\b|" + _NUMBER + r"\s*(cm|m)\s+tall\b",
+        re.IGNORECASE), None),
+    ("Body mass index", re.compile(
+        r"\b(?:BMI|body mass index)\D{0,20}?" + _NUMBER + r"(?:\s*kg/m(?:2|²))?",
+        re.IGNORECASE), "kg/m2"),
+]
+
+_BLOOD_PRESSURE_RE = re.compile(r"\b(?:blood pressure|BP)\D{0,20}?(\d{2,3})\s*/\s*(\d{2,3})\s*(?:mm\s?Hg)?", re.IGNORECASE)
+
+_LAB_VALUE_RE = re.compile(
+    _NUMBER + r"\s*(ng/mL|ng/dL|pg/mL|[µu]g/dL|mcg/dL|[µu]g/L|[µu]g/24\s?h|mg/dL|mg/L|mg/24\s?h|g/dL|g/L|"
+    r"mmol/L|[µu]mol/L|mEq/L|[µu]?IU/mL|mIU/L|IU/L|U/L|cells/[µu]L|cells/mm3|/[µu]L|/mm3|"
+    r"(?:x|×)\s?10\^?\d/L|fL|%)(?![\w/])"
+)
+# A lab name ends at the previous clause boundary
+_CLAUSE_BREAK_RE = re.compile(r"[,;:!?]|\.\s|\b(?:and|with|while|but)\b", re.IGNORECASE)
+_PARENTHETICAL_RE = re.compile(r"\([^)]*\)")
+_TRAILING_CONNECTOR_RE = re.compile(
+    r"(?:\s+(?:levels?|count|concentration|values?|of|was|were|is|are|at|measured|reached|=))+\s*$",
+    re.IGNORECASE
+)
+_LAB_NAME_MAX_WORDS = 4
+
+_MONTHS = ("january", "february", "march", "april", "may", "june", "july", "august", "september",
+           "october", "november", "december")
+_MONTH_RE = "(" + "|".join(_MONTHS) + ")"
+# Dates in the text: "2024-03-15", "March 15, 2024", "15 March 2024"
+_DATE_RE = re.compile(
+    r"\b(\d{4})-(\d{2})-(\d{2})\b|"
+    r"\b" + _MONTH_RE + r"\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b|"
+    r"\b(\d{1,2})\s+" + _MONTH_RE + r"\s+(\d{4})\b",
+    re.IGNORECASE
+)
+
+# Qualifiers in front of a lab name, mapped to the schema's interpretation values
+QUALIFIERS = {
+    "elevated": "high", "high": "high", "raised": "high", "increased": "high",
+    "low": "low", "decreased": "low", "reduced": "low",
+    "normal": "normal", "abnormal": "abnormal", "critical": "critical",
+}
+_FILLER_WORDS = {
+    "a", "an", "the", "his", "her", "their", "in", "on", "for", "from", "to", "ago", "had", "has", "have",
+    "found", "markedly", "mildly", "slightly", "significantly",
+    "very", "also", "about", "approximately", "around", "nearly", "over", "under", "serum", "plasma", "blood",
+    # Reporting verbs: "laboratory results show hemoglobin 9.1 g/dL"
+    "show", "shows", "showed", "shown", "showing", "reveal", "reveals", "revealed", "revealing",
+    "demonstrate", "demonstrates", "demonstrated", "demonstrating", "include", "includes", "included", "including",
+    "indicate", "indicates", "indicated", "confirm", "confirms", "confirmed", "report", "reports", "reported",
+    "note", "notes", "noted", "document", "documents", "documented", "disclose", "discloses", "disclosed",
+}
+
+
+def _to_float(value: str) -> float:
+    return float(value.replace(",", ""))
+
+
+def _temperature_unit(unit: str) -> str:
+    return "°F" if unit[0].upper() == "F" else "°C"
+
+
+def _overlaps(span: Tuple[int, int], taken: List[Tuple[int, int]]) -> bool:
+    return any(start < span[1] and span[0] < end for start, end in taken)
+
+
+def extract_vitals(text: str) -> List[Dict[str, Any]]:
+    """
+    Extract vital signs with their values and units.
+
+    Returns:
+        List[Dict[str, Any]]: `vital_sign` entries of OUTPUT_SCHEMA plus their "span" in `text`.
+    """
+    vitals = []
+    for match in _BLOOD_PRESSURE_RE.finditer(text):
+        for vital_type, value in (("Systolic blood pressure", match.group(1)),
+                                  ("Diastolic blood pressure", match.group(2))):
+            vitals.append({"vital_type": vital_type, "value": _to_float(value), "unit": "mm[Hg]",
+                           "span": match.span()})
+
+    for vital_type, pattern, unit in VITAL_PATTERNS:
+        for match in pattern.finditer(text):
+            groups = [g for g in match.groups() if g is not None]
+            value = _to_float(groups[0])
+            if unit is not None:
+                vital_unit = unit
+            elif vital_type == "Body temperature":
+                vital_unit = _temperature_unit(groups[1])
+            else:
+                vital_unit = groups[1].lower()
+            vitals.append({"vital_type": vital_type, "value": value, "unit": vital_unit, "span": match.span()})
+
+    vitals.sort(key=lambda vital: vital["span"])
+    return vitals
+
+
+def _lab_name(text: str, value_start: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Find the name of the lab test whose value starts at `value_start`, looking back to the
+    previous clause boundary. Returns (name, interpretation from a qualifier such as "elevated").
+    """
+    clause_start = 0
+    for boundary in _CLAUSE_BREAK_RE.finditer(text, max(0, value_start - 120), value_start):
+        clause_start = boundary.end()
+    lookback = _PARENTHETICAL_RE.sub(" ", text[clause_start:value_start])
+    # An unclosed "(" starts the name: "inflammatory markers (CRP 45 mg/L"
+    lookback = lookback[lookback.rfind("(") + 1:]
+    lookback = _TRAILING_CONNECTOR_RE.sub("", lookback)
+
+    # The name is the run of words right before the value, up to a filler word or qualifier
+    words: List[str] = []
+    interpretation = None
+    for word in reversed(lookback.split()):
+        lowered = word.lower()
+        if lowered in QUALIFIERS:
+            interpretation = QUALIFIERS[lowered]
+            break
+        if lowered in _FILLER_WORDS or len(words) == _LAB_NAME_MAX_WORDS:
+            break
+        words.insert(0, word)
+
+    if not words or not any(ch.isalpha() for ch in words[-1]):
+        return None, None
+    return " ".join(words), interpretation
+
+
+def extract_labs(text: str, exclude: List[Tuple[int, int]] = ()) -> List[Dict[str, Any]]:
+    """
+    Extract laboratory results ("ferritin 1,250 ng/mL", "ALT of 120 U/L").
+
+    Args:
+        text (str): Patient record text.
+        exclude (List[Tuple[int, int]]): Spans already claimed by vital signs.
+    Returns:
+        List[Dict[str, Any]]: `laboratory` entries of OUTPUT_SCHEMA plus their "span" in `text`.
+    """
+    labs = []
+    for match in _LAB_VALUE_RE.finditer(text):
+        if _overlaps(match.span(), list(exclude)):
+            continue
+        name, interpretation = _lab_name(text, match.start())
+        if name is None:
+            continue
+        labs.append({
+            "test_name": name,
+            "value": _to_float(match.group(1)),
+            "unit": match.group(2).replace("u", "µ", 1) if match.group(2).startswith("u") else match.group(2),
+            "interpretation": interpretation,
+            "span": match.span(),
+        })
+    return labs
+
+
+def _mentioned_dates(text: str) -> List[Tuple[int, str]]:
+    """(position, ISO date) of every date written in `text`."""
+    dates = []
+    for match in _DATE_RE.finditer(text):
+        g = match.groups()
+        if g[0]:
+            year, month, day = g[0], g[1], g[2]
+        elif g[3]:
+            year, month, day = g[5], _MONTHS.index(g[3].lower()) + 1, g[4]
+        else:
+            year, month, day = g[8], _MONTHS.index(g[7].lower()) + 1, g[6]
+        dates.append((match.start(), f"{int(year):04d}-{int(month):02d}-{int(day):02d}"))
+    return dates
+
+
+def pre_extract(text: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Rule-based extraction of vital signs and laboratory results from a patient record.
+
+    Every item gets an id ("V1", "L1", ...) that the LLM uses to assign it to an
+    encounter instead of re-emitting it (see `format_pre_extracted` and `reconcile`).
+
+    Args:
+        text (str): Patient record text.
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: {"vital_sign": [...], "laboratory": [...]}.
+    """
+    vitals = extract_vitals(text)
+    labs = extract_labs(text, exclude=[vital["span"] for vital in vitals])
+    for prefix, items in (("V", vitals), ("L", labs)):
+        for index, item in enumerate(items, 1):
+            item["id"] = f"{prefix}{index}"
+            item["status"] = "final"
+    logger.debug(f"Pre-extracted {len(vitals)} vital signs and {len(labs)} laboratory results")
+    return {"vital_sign": vitals, "laboratory": labs}
+
+
+def format_pre_extracted(items: Dict[str, List[Dict[str, Any]]]) -> str:
+    """
+    Render pre-extracted items as one "<id>: <name> <value> <unit>" line each, for the prompt.
+    """
+    lines = [f"{v['id']}: {v['vital_type']} {v['value']:g} {v['unit']}" for v in items["vital_sign"]]
+    lines += [f"{lab['id']}: {lab['test_name']} {lab['value']:g} {lab['unit']}" for lab in items["laboratory"]]
+    return "\n".join(lines)
+
+
+def _public(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in item.items() if k not in ("id", "span")}
+
+
+def reconcile(
+        llm_output: Dict[str, Any],
+        items: Dict[str, List[Dict[str, Any]]],
+        text: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Merge pre-extracted items into the LLM output, recording provenance.
+
+    - Items referenced by an encounter's "prefilled" id list are added to that
+      encounter with "provenance": "rule"; values emitted by the LLM get "provenance": "llm".
+    - If the LLM also emitted an item with the same name, the rule value wins and
+      missing fields (e.g. interpretation) are taken from the LLM entry.
+    - Items no encounter referenced go to the encounter dated with the last date
+      written before them in `text`; otherwise to the only encounter, or to an
+      undated encounter (created if needed).
+
+    Args:
+        llm_output (Dict[str, Any]): Parsed LLM output.
+        items (Dict[str, List[Dict[str, Any]]]): Result of `pre_extract`.
+        text (Optional[str]): Patient record text the items were extracted from.
+    Returns:
+        Dict[str, Any]: `llm_output`, updated in place.
+    """
+    by_id = {item["id"]: (kind, item) for kind in ("vital_sign", "laboratory") for item in items[kind]}
+    name_fields = {"vital_sign": "vital_type", "laboratory": "test_name"}
+    encounters = llm_output.get("encounters") or []
+    used = set()
+
+    def merge(encounter: Dict[str, Any], item_ids: List[str]) -> None:
+        observation = encounter.get("observation") or {}
+        encounter["observation"] = observation
+        for kind, name_field in name_fields.items():
+            entries = observation.get(kind) or []
+            for entry in entries:
+                entry.setdefault("provenance", "llm")
+            by_name = {normalize_term(str(entry.get(name_field))): entry for entry in entries}
+
+            for item_id in item_ids:
+                item_kind, item = by_id.get(item_id, (None, None))
+                if item_kind != kind:
+                    continue
+                rule_entry = {**_public(item), "provenance": "rule"}
+                duplicate = by_name.get(normalize_term(item[name_field]))
+                if duplicate is None:
+                    entries.append(rule_entry)
+                    continue
+                for field, value in duplicate.items():
+                    if rule_entry.get(field) is None:
+                        rule_entry[field] = value
+                entries[entries.index(duplicate)] = rule_entry
+            observation[kind] = entries
+
+    for encounter in encounters:
+        item_ids = [str(item_id) for item_id in encounter.pop("prefilled", None) or []]
+        unknown = [item_id for item_id in item_ids if item_id not in by_id]
+        if unknown:
+            logger.warning(f"LLM referenced unknown pre-extracted items: {unknown}")
+        used.update(item_ids)
+        merge(encounter, item_ids)
+
+    leftover = [item_id for item_id in by_id if item_id not in used]
+    if leftover:
+        logger.debug(f"Pre-extracted items not assigned by the LLM: {leftover}")
+        llm_output["encounters"] = encounters
+        dates = _mentioned_dates(text) if text else []
+        assigned: Dict[int, List[str]] = {}
+        for item_id in leftover:
+            encounter = _leftover_encounter(encounters, by_id[item_id][1]["span"][0], dates)
+            assigned.setdefault(id(encounter), []).append(item_id)
+        for encounter in encounters:
+            if id(encounter) in assigned:
+                merge(encounter, assigned[id(encounter)])
+
+    return llm_output
+
+
+def _leftover_encounter(
+        encounters: List[Dict[str, Any]],
+        position: int,
+        dates: List[Tuple[int, str]]
+) -> Dict[str, Any]:
+    """Encounter for a pre-extracted item at `position` of the text that the LLM did not assign."""
+    preceding = [date for start, date in dates if start < position]
+    if preceding:
+        dated = [enc for enc in encounters if str(enc.get("encounter_date") or "")[:10] == preceding[-1]]
+        if len(dated) == 1:
+            return dated[0]
+    if len(encounters) == 1:
+        return encounters[0]
+    undated = [enc for enc in encounters if not enc.get("encounter_date")]
+    if undated:
+        return undated[0]
+    encounter = {"encounter_date": None, "reason": None, "observation": {}, "medication": []}
+    encounters.append(encounter)
+    return encounter
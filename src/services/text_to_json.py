@@ -1,13 +1,83 @@
+import re
 import json
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from src.utils.llm_utils import extract_json_block
+from src.utils.bedrock_client import converse, converse_stream
+from src.utils.json_stream import JSONStreamParser, WATCH_ITEMS, WATCH_VALUE
 from src.core import settings
-from src.utils.prompt import EXTRACTION_PROMPT
-from src.utils.prompt_schemas import OUTPUT_SCHEMA
+from src.utils.prompt import (EXTRACTION_PROMPT, PRE_EXTRACTED_PROMPT, SEGMENT_EXTRACTION_PROMPT,
+                              TOOL_EXTRACTION_PROMPT)
+from src.utils.prompt_schemas import OUTPUT_SCHEMA, OUTPUT_JSON_SCHEMA
+from src.services.pre_extraction import format_pre_extracted, pre_extract, reconcile
 import logging
 
 logger = logging.getLogger(__name__)
 
-def process_patient_records(patient_record_text:str, client, model, logger) -> dict:
+def split_prompt(template: str, dynamic_field: str, **static: Any) -> Tuple[str, str]:
+    """
+    Split a prompt template into a static prefix and the template of its variable suffix.
+
+    The prefix (everything before `{dynamic_field}`) is formatted with `static` once;
+    the suffix still contains `{dynamic_field}`. Indentation and surrounding blank
+    lines of the template are removed.
+
+    Returns:
+        Tuple[str, str]: (prefix, suffix template).
+    """
+    template = inspect.cleandoc(template)
+    index = template.index("{" + dynamic_field + "}")
+    return template[:index].format(**static), template[index:]
+
+
+# Compact schema: indentation only costs input tokens
+COMPACT_OUTPUT_SCHEMA = json.dumps(OUTPUT_SCHEMA, separators=(",", ":"), ensure_ascii=False)
+
+EXTRACTION_PROMPT_PREFIX, EXTRACTION_PROMPT_SUFFIX = split_prompt(
+    EXTRACTION_PROMPT, "patient_record_text", schema=COMPACT_OUTPUT_SCHEMA
+)
+
+
+def supports_prompt_cache(model: str) -> bool:
+    return settings.PROMPT_CACHE_ENABLED and any(prefix in model for prefix in settings.PROMPT_CACHE_MODELS)
+
+
+def build_prompt_content(prefix: str, suffix: str, model: str) -> List[Dict[str, Any]]:
+    """
+    Build the content blocks of a user message from a static prefix and a variable suffix.
+
+    On models with prompt caching, a `cachePoint` separates the two so Bedrock reuses
+    the cached prefix across calls; other models get a single text block.
+    """
+    if supports_prompt_cache(model):
+        return [{"text": prefix}, {"cachePoint": {"type": "default"}}, {"text": suffix}]
+    return [{"text": prefix + suffix}]
+
+
+def build_extraction_prompt(patient_record_text: str) -> str:
+    """
+    Build the extraction prompt for a patient record.
+    """
+    return EXTRACTION_PROMPT_PREFIX + EXTRACTION_PROMPT_SUFFIX.format(patient_record_text=patient_record_text)
+
+
+def build_extraction_content(
+        patient_record_text: str,
+        model: str,
+        pre_extracted: Optional[Dict[str, List[Dict[str, Any]]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Build the extraction prompt as content blocks, with a cache point after the schema where supported.
+    Pre-extracted measurements, if any, are listed after the record.
+    """
+    suffix = EXTRACTION_PROMPT_SUFFIX.format(patient_record_text=patient_record_text)
+    if pre_extracted and (pre_extracted["vital_sign"] or pre_extracted["laboratory"]):
+        suffix += PRE_EXTRACTED_PROMPT.format(items=format_pre_extracted(pre_extracted))
+    return build_prompt_content(EXTRACTION_PROMPT_PREFIX, suffix, model)
+
+
+def process_patient_records(patient_record_text:str, client, model, logger, pre_extraction: bool = False) -> dict:
     """
     Extract metadata and compounds from text using LLM.
 
@@ -16,27 +86,436 @@ def process_patient_records(patient_record_text:str, client, model, logger) -> d
         client (boto3.client): AWS boto3 client.
         model (ModelID): AWS model ID.
         logger (logging.Logger): Logger.
+        pre_extraction (bool): Extract vital signs and lab results with rules first, so the
+            LLM only assigns them to encounters by id (see `pre_extraction.reconcile`).
     Returns:
         dict: The extracted metadata.
     """
-    schema_str = json.dumps(OUTPUT_SCHEMA, indent=2)
-    prompt = EXTRACTION_PROMPT.format(schema=schema_str, patient_record_text=patient_record_text)
+    pre_extracted = pre_extract(patient_record_text) if pre_extraction else None
+    content = build_extraction_content(patient_record_text, model, pre_extracted)
+    cleaned = _converse_json(content, client, model, logger)
+    if pre_extracted and isinstance(cleaned, dict):
+        cleaned = reconcile(cleaned, pre_extracted, patient_record_text)
+
+    logger.info("Successfully parsed JSON response")
+    return cleaned
+
+
+EXTRACTION_TOOL_NAME = "record_patient_data"
+
+
+def build_tool_config(model: str) -> Dict[str, Any]:
+    """
+    Build the Converse toolConfig exposing OUTPUT_SCHEMA as the input schema of a single tool.
+    The tool is forced through toolChoice on models that support it; others get "auto".
+    """
+    tool_config = {
+        "tools": [{
+            "toolSpec": {
+                "name": EXTRACTION_TOOL_NAME,
+                "description": "Record the structured patient data extracted from a clinical text.",
+                "inputSchema": {"json": OUTPUT_JSON_SCHEMA},
+            }
+        }]
+    }
+    if any(prefix in model for prefix in settings.TOOL_CHOICE_MODELS):
+        tool_config["toolChoice"] = {"tool": {"name": EXTRACTION_TOOL_NAME}}
+    return tool_config
+
+
+def process_patient_records_tool(patient_record_text: str, client, model, logger) -> dict:
+    """
+    Extract patient data through Bedrock tool use instead of free-text JSON.
+
+    OUTPUT_SCHEMA is passed as the JSON schema of a tool, and the model's `toolUse`
+    input is returned as is, so no JSON scraping (or schema text in the prompt) is
+    needed. If the model answers in text instead, the text is parsed as a fallback.
+
+    Args:
+        patient_record_text (str): patient record text.
+        client (boto3.client): AWS boto3 client.
+        model (ModelID): AWS model ID.
+        logger (logging.Logger): Logger.
+    Returns:
+        dict: The extracted metadata.
+    """
+    prompt = TOOL_EXTRACTION_PROMPT.format(tool_name=EXTRACTION_TOOL_NAME, patient_record_text=patient_record_text)
 
     conversation = [{
         "role": "user",
         "content": [{"text": prompt}]
     }]
 
+    response = converse(
+        client,
+        modelId=model,
+        messages=conversation,
+        inferenceConfig={"maxTokens": settings.PROMPT_MAX_TOKENS, "temperature": settings.PROMPT_TEMPERATURE},
+        toolConfig=build_tool_config(model)
+    )
+    logger.debug("Received response from model")
+
+    content = response["output"]["message"]["content"]
+    for block in content:
+        tool_use = block.get("toolUse")
+        if tool_use and tool_use.get("name") == EXTRACTION_TOOL_NAME:
+            logger.info("Received structured tool input")
+            return tool_use["input"]
 
-    response = client.converse(
+    logger.warning("Model did not call the extraction tool; parsing the text answer")
+    raw_text = "".join(block.get("text", "") for block in content).strip()
+    return extract_json_block(raw_text)
+
+
+def _converse_json(
+        prompt: Union[str, List[Dict[str, Any]]],
+        client,
+        model,
+        logger,
+        max_tokens: int = settings.PROMPT_MAX_TOKENS
+) -> Any:
+    """
+    Send a single-turn prompt (text or content blocks) and parse the JSON block of the answer.
+    """
+    conversation = [{
+        "role": "user",
+        "content": prompt if isinstance(prompt, list) else [{"text": prompt}]
+    }]
+
+    response = converse(
+        client,
         modelId=model,
         messages=conversation,
-        inferenceConfig={"maxTokens": settings.PROMPT_MAX_TOKENS, "temperature": settings.PROMPT_TEMPERATURE}
+        inferenceConfig={"maxTokens": max_tokens, "temperature": settings.PROMPT_TEMPERATURE}
     )
     logger.debug("Received response from model")
 
-    raw_text = response["output"]["message"]["content"][0].get("text", "").strip()
-    cleaned = extract_json_block(raw_text)
+    raw_text = response["output"]["message"]["content"][0].get("text", "")
+    if response.get("stopReason") == "max_tokens":
+        raw_text = _continue_truncated(conversation, raw_text, client, model, logger)
+    return extract_json_block(raw_text.strip())
+
+
+def _continue_truncated(conversation: List[Dict[str, Any]], partial_text: str, client, model, logger) -> str:
+    """
+    Continue an answer that stopped at maxTokens.
+
+    The partial answer is sent back as an assistant prefill, so the model appends to
+    it with a small output budget instead of regenerating the whole JSON. After
+    MAX_CONTINUATIONS attempts the (still truncated) text is returned as is and
+    `extract_json_block` repairs it.
+
+    Args:
+        conversation (List[Dict[str, Any]]): The original single-turn conversation.
+        partial_text (str): Text generated so far.
+        client (boto3.client): AWS boto3 client.
+        model (ModelID): AWS model ID.
+        logger (logging.Logger): Logger.
+    Returns:
+        str: The partial text extended by the continuations.
+    """
+    text = partial_text
+    for attempt in range(1, settings.MAX_CONTINUATIONS + 1):
+        # Bedrock rejects a final assistant message ending in whitespace
+        prefill = text.rstrip()
+        tail = text[len(prefill):]
+        logger.warning(f"Answer truncated at maxTokens, requesting continuation {attempt}/{settings.MAX_CONTINUATIONS}")
+        response = converse(
+            client,
+            modelId=model,
+            messages=conversation + [{"role": "assistant", "content": [{"text": prefill}]}],
+            inferenceConfig={"maxTokens": settings.CONTINUATION_MAX_TOKENS, "temperature": settings.PROMPT_TEMPERATURE}
+        )
+        continuation = "".join(block.get("text", "") for block in response["output"]["message"]["content"])
+        # The stripped whitespace may be part of a JSON string ("has " + "fever"): put it
+        # back unless the model already started with whitespace
+        if tail and continuation and not continuation[0].isspace():
+            continuation = tail + continuation
+        text = prefill + continuation
+        if response.get("stopReason") != "max_tokens":
+            return text
+
+    logger.warning("Answer still truncated after continuations; repairing the partial JSON")
+    return text
+
+
+def process_patient_records_stream(
+        patient_record_text: str,
+        client,
+        model,
+        logger,
+        on_fragment: Optional[Callable[[str, Any], None]] = None
+) -> dict:
+    """
+    Streaming variant of `process_patient_records` built on `converse_stream`.
+
+    The `patient` object and each element of `encounters` are parsed as soon as they
+    close and handed to `on_fragment`, so downstream work (e.g. terminology
+    resolution) overlaps with token generation. An answer that stops at maxTokens
+    is continued as in `_converse_json`.
+
+    Args:
+        patient_record_text (str): patient record text.
+        client (boto3.client): AWS boto3 client.
+        model (ModelID): AWS model ID.
+        logger (logging.Logger): Logger.
+        on_fragment (Optional[Callable[[str, Any], None]]): Called with ("patient", dict)
+            and ("encounters", dict) for every completed fragment.
+    Returns:
+        dict: The extracted metadata, parsed from the full streamed text.
+    """
+    conversation = [{
+        "role": "user",
+        "content": build_extraction_content(patient_record_text, model)
+    }]
+
+    parser = JSONStreamParser({"patient": WATCH_VALUE, "encounters": WATCH_ITEMS})
+
+    def feed(chunk: str) -> None:
+        for name, value in parser.feed(chunk):
+            logger.debug(f"Streamed {name} fragment")
+            if on_fragment:
+                on_fragment(name, value)
+
+    stream = converse_stream(
+        client,
+        modelId=model,
+        messages=conversation,
+        inferenceConfig={"maxTokens": settings.PROMPT_MAX_TOKENS, "temperature": settings.PROMPT_TEMPERATURE}
+    )
+    try:
+        while True:
+            feed(next(stream))
+    except StopIteration as done:
+        stop_reason = done.value
+    logger.debug("Stream from model finished")
+
+    raw_text = parser.text
+    if stop_reason == "max_tokens":
+        raw_text = _continue_truncated(conversation, raw_text, client, model, logger)
+        # Fragments completed by the continuation (unless it replaced trailing whitespace)
+        if raw_text.startswith(parser.text):
+            feed(raw_text[len(parser.text):])
+
+    cleaned = extract_json_block(raw_text.strip())
 
     logger.info("Successfully parsed JSON response")
-    return cleaned
\ No newline at end of file
+    return cleaned
+
+
+# ==== Chunked extraction ====
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z\"'(])")
+_FAMILY_RE = re.compile(
+    r"\b(family history|mother|father|parents?|sister|brother|siblings?|son|daughter|"
+    r"grand(mother|father|parents?)|aunt|uncle|cousin|maternal|paternal)\b",
+    re.IGNORECASE
+)
+# Relatives acting as informants ("his mother reports ...") do not make a sentence family history
+_INFORMANT_RE = re.compile(
+    r"\b(mother|father|parents?|caregivers?)\s+(also\s+)?(mentions?|reports?|notes?|says|states|describes?|brought)\b",
+    re.IGNORECASE
+)
+_PREVIOUS_ENCOUNTER_RE = re.compile(
+    r"\b(\w+ (days?|weeks?|months?|years?) ago|last (week|month|year)|previously|prior|earlier|"
+    r"in (19|20)\d{2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{4}|\d{4}-\d{2}-\d{2})\b",
+    re.IGNORECASE
+)
+
+SEGMENT_SECTIONS = {
+    "patient": ("the patient's demographic data", {"patient": OUTPUT_SCHEMA["patient"]}),
+    "encounters": ("a single medical encounter", {"encounters": OUTPUT_SCHEMA["encounters"]}),
+    "family_history": ("the patient's family history", {"family_history": OUTPUT_SCHEMA["family_history"]}),
+}
+
+
+def segment_record(patient_record_text: str) -> Dict[str, List[str]]:
+    """
+    Split a patient record into demographics, encounters and family history.
+
+    The first sentence carries the demographics (and opens the current encounter).
+    Sentences mentioning relatives go to the family history; a sentence with a
+    past-time marker ("two months ago", "in 2019", "10-09-2015") opens a new encounter.
+
+    Args:
+        patient_record_text (str): patient record text.
+    Returns:
+        Dict[str, List[str]]: Text segments keyed by section ("patient", "encounters", "family_history").
+    """
+    sentences = [s.strip() for s in _SENTENCE_RE.split(patient_record_text.strip()) if s.strip()]
+    if not sentences:
+        return {"patient": [], "encounters": [], "family_history": []}
+
+    encounters: List[List[str]] = [[sentences[0]]]
+    family: List[str] = []
+    for sentence in sentences[1:]:
+        if _FAMILY_RE.search(sentence) and not _INFORMANT_RE.search(sentence):
+            family.append(sentence)
+        elif _PREVIOUS_ENCOUNTER_RE.search(sentence):
+            encounters.append([sentence])
+        else:
+            encounters[-1].append(sentence)
+
+    return {
+        "patient": [sentences[0]],
+        "encounters": [" ".join(encounter) for encounter in encounters],
+        "family_history": [" ".join(family)] if family else [],
+    }
+
+
+def build_segment_prompt(section: str, segment_text: str) -> str:
+    """
+    Build the extraction prompt for one segment, using only the section's part of OUTPUT_SCHEMA.
+    """
+    description, schema = SEGMENT_SECTIONS[section]
+    return SEGMENT_EXTRACTION_PROMPT.format(
+        section=description,
+        schema=json.dumps(schema, indent=2),
+        patient_record_text=segment_text
+    )
+
+
+def merge_extractions(parts: List[Dict[str, Any]]) -> dict:
+    """
+    Merge segment extractions into one OUTPUT_SCHEMA-shaped dict.
+
+    - patient: fields of the first part win; missing fields (and address fields) are
+      filled from later parts.
+    - encounters: encounters with the same date are merged, then sorted
+      chronologically (undated encounters keep their relative order at the end).
+    - family_history: members with the same relationship are merged; notes are joined.
+
+    Args:
+        parts (List[Dict[str, Any]]): Extractions in segment order (demographics first).
+    Returns:
+        dict: The merged extraction.
+    """
+    patient: Dict[str, Any] = {}
+    encounters: List[Dict[str, Any]] = []
+    members: Dict[str, Dict[str, Any]] = {}
+    notes: List[str] = []
+
+    for part in parts:
+        for field, value in (part.get("patient") or {}).items():
+            if field == "address" and isinstance(value, dict):
+                address = patient.setdefault("address", {}) or {}
+                for key, item in value.items():
+                    if address.get(key) is None:
+                        address[key] = item
+                patient["address"] = address
+            elif patient.get(field) is None:
+                patient[field] = value
+
+        for encounter in part.get("encounters") or []:
+            date = encounter.get("encounter_date")
+            same_day = next((e for e in encounters if date and e.get("encounter_date") == date), None)
+            if same_day is None:
+                encounters.append(encounter)
+                continue
+            same_day["reason"] = same_day.get("reason") or encounter.get("reason")
+            observation = same_day.setdefault("observation", {}) or {}
+            for kind, items in (encounter.get("observation") or {}).items():
+                observation[kind] = (observation.get(kind) or []) + (items or [])
+            same_day["observation"] = observation
+            same_day["medication"] = (same_day.get("medication") or []) + (encounter.get("medication") or [])
+
+        family_history = part.get("family_history") or {}
+        for member in family_history.get("members") or []:
+            key = str(member.get("relationship", "")).strip().lower()
+            if key in members:
+                members[key]["conditions"] = (members[key].get("conditions") or []) + (member.get("conditions") or [])
+                members[key]["deceased"] = members[key].get("deceased") or member.get("deceased")
+            else:
+                members[key] = member
+        if family_history.get("note"):
+            notes.append(family_history["note"])
+
+    # Stable sort: dated encounters chronologically (ISO dates sort lexicographically), undated last
+    encounters.sort(key=lambda e: (e.get("encounter_date") is None, e.get("encounter_date") or ""))
+
+    return {
+        "patient": patient,
+        "encounters": encounters,
+        "family_history": {"members": list(members.values()), "note": " ".join(notes) or None},
+    }
+
+
+def process_patient_records_chunked(patient_record_text: str, client, model, logger) -> dict:
+    """
+    Chunked variant of `process_patient_records` for long multi-visit records.
+
+    The record is segmented into demographics, encounters and family history; each
+    segment is extracted concurrently with a smaller prompt and output budget, and
+    the results are merged into one OUTPUT_SCHEMA-shaped dict.
+
+    Args:
+        patient_record_text (str): patient record text.
+        client (boto3.client): AWS boto3 client.
+        model (ModelID): AWS model ID.
+        logger (logging.Logger): Logger.
+    Returns:
+        dict: The extracted metadata.
+    """
+    segments = segment_record(patient_record_text)
+    prompts = [
+        build_segment_prompt(section, text)
+        for section in ("patient", "encounters", "family_history")
+        for text in segments[section]
+    ]
+    logger.debug(f"Extracting {len(prompts)} segments")
+
+    with ThreadPoolExecutor(max_workers=settings.CHUNK_MAX_WORKERS) as executor:
+        parts = list(executor.map(
+            lambda prompt: _converse_json(prompt, client, model, logger, max_tokens=settings.CHUNK_MAX_TOKENS),
+            prompts
+        ))
+
+    merged = merge_extractions([part for part in parts if isinstance(part, dict)])
+    logger.info("Successfully merged chunked JSON responses")
+    return merged
+
+
+EXTRACTION_MODES = ("converse", "stream", "chunked", "tool")
+
+
+def check_pre_extraction(extraction: str, pre_extraction: bool) -> None:
+    """
+    Raise ValueError if `pre_extraction` is requested with an extraction mode that ignores it.
+    """
+    if pre_extraction and extraction != "converse":
+        raise ValueError(f"pre_extraction is only supported with \"converse\" extraction, not \"{extraction}\"")
+
+
+def extract_patient_data(
+        patient_record_text: str,
+        client,
+        model,
+        logger,
+        extraction: str = "converse",
+        pre_extraction: bool = False,
+        on_fragment: Optional[Callable[[str, Any], None]] = None
+) -> dict:
+    """
+    Run the extraction variant selected by `extraction`.
+
+    Args:
+        patient_record_text (str): patient record text.
+        client (boto3.client): AWS boto3 client.
+        model (ModelID): AWS model ID.
+        logger (logging.Logger): Logger.
+        extraction (str): One of EXTRACTION_MODES.
+        pre_extraction (bool): Rule-based pre-extraction of vitals and labs ("converse" only).
+        on_fragment (Optional[Callable[[str, Any], None]]): Fragment callback ("stream" only).
+    Returns:
+        dict: The extracted metadata.
+    Raises:
+        ValueError: If `pre_extraction` is set with another extraction than "converse".
+    """
+    check_pre_extraction(extraction, pre_extraction)
+    if extraction == "stream":
+        return process_patient_records_stream(patient_record_text, client, model, logger, on_fragment=on_fragment)
+    if extraction == "chunked":
+        return process_patient_records_chunked(patient_record_text, client, model, logger)
+    if extraction == "tool":
+        return process_patient_records_tool(patient_record_text, client, model, logger)
+    return process_patient_records(patient_record_text, client, model, logger, pre_extraction=pre_extraction)
@@ -0,0 +1,205 @@
+import os
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.core import settings
+from src.utils import codes_request
+from src.utils.terminology_cache import MISS
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUS = codes_request.RETRY_STATUS
+
+
+class TerminologyRequestError(requests.RequestException):
+    """Raised when a terminology API keeps failing after all retries."""
+
+
+class AsyncTerminologyClient:
+    """
+    asyncio client for the LOINC (Clinical Tables) and SNOMED CT (BioPortal) APIs.
+
+    The HTTP calls themselves are blocking `requests` calls: they share one pooled
+    session and run on a dedicated thread pool, awaited from the event loop, so
+    hundreds of lookups can be in flight while at most `max_concurrency` hit the
+    network at once, even when several threads resolve terms on their own loops.
+    Every request has a timeout; throttling (429) and transient 5xx responses are
+    retried with jittered exponential backoff, honouring `Retry-After` when the
+    server sends it. Request building and response parsing are shared with
+    `codes_request`, and results go through the same terminology cache and local
+    backends as the synchronous lookups.
+    """
+
+    def __init__(
+            self,
+            max_concurrency: int = settings.TERMINOLOGY_MAX_CONCURRENCY,
+            timeout: float = settings.TERMINOLOGY_REQUEST_TIMEOUT,
+            max_retries: int = settings.TERMINOLOGY_MAX_RETRIES,
+            backoff_base: float = settings.TERMINOLOGY_BACKOFF_BASE,
+            backoff_max: float = settings.TERMINOLOGY_BACKOFF_MAX
+    ):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="terminology")
+        # One semaphore per event loop: callers in different threads each run their own loop
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return self._semaphores[loop]
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    async def _get_json(self, url: str, params: Dict[str, str], auth=None) -> Any:
+        loop = asyncio.get_running_loop()
+        request = partial(self._session.get, url, params=params, auth=auth, timeout=self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with self._semaphore():
+                try:
+                    response = await loop.run_in_executor(self._executor, request)
+                except (requests.Timeout, requests.ConnectionError) as e:
+                    reason = f"{type(e).__name__}: {e}"
+                else:
+                    if response.status_code not in RETRY_STATUS:
+                        response.raise_for_status()
+                        return response.json()
+                    reason = f"HTTP {response.status_code}"
+                    retry_after = response.headers.get("Retry-After")
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff(attempt, retry_after)
+            logger.warning("%s from %s (attempt %d/%d), retrying in %.1fs",
+                           reason, url, attempt + 1, self.max_retries + 1, delay)
+            await asyncio.sleep(delay)
+
+        raise TerminologyRequestError(f"{reason} from {url} after {self.max_retries + 1} attempts")
+
+    async def query_remote(self, system: str, term: str) -> Optional[Tuple[str, str]]:
+        """
+        Query the remote API of a code system for a single term.
+        """
+        if system == "loinc":
+            data = await self._get_json(codes_request.LOINC_API_URL, codes_request.loinc_params(term),
+                                        auth=codes_request.loinc_auth())
+            return codes_request.parse_loinc_response(data, term)
+        if system == "snomed":
+            data = await self._get_json(codes_request.SNOMED_API_URL, codes_request.snomed_params(term))
+            return codes_request.parse_snomed_response(data)
+        raise ValueError(f"Unknown code system: {system}")
+
+    async def lookup(self, system: str, term: str) -> Optional[Tuple[str, str]]:
+        """
+        Resolve a term through the cache and the configured backends, returning the
+        same value as the matching synchronous lookup in `codes_request.CODE_LOOKUPS`.
+
+        Raises:
+            requests.RequestException: If the remote API fails after all retries.
+        """
+        miss = codes_request.MISS_VALUES[system]
+        cached = codes_request.terminology_cache.get(system, term)
+        if cached is not MISS:
+            return cached if cached is not None else miss
+
+        result = None
+        for name in settings.TERMINOLOGY_BACKENDS:
+            if name == "remote":
+                result = await self.query_remote(system, term)
+            else:
+                result = codes_request.TERMINOLOGY_BACKENDS[system][name](term)
+            if result and result[0]:
+                break
+        else:
+            result = None
+
+        found = bool(result and result[0])
+        codes_request.terminology_cache.set(system, term, result if found else None)
+        return tuple(result) if found else miss
+
+    async def resolve(
+            self,
+            terms: Dict[str, Iterable[str]]
+    ) -> Dict[Tuple[str, str], Optional[Tuple[str, str]]]:
+        """
+        Resolve many terms concurrently; see `codes_request.resolve_terms` for the result shape.
+        Terms that fail after all retries are logged and mapped to `codes_request.LOOKUP_FAILED`,
+        so they are neither cached nor looked up again.
+        """
+        unique = codes_request.unique_terms(terms)
+        results = await asyncio.gather(
+            *(self.lookup(system, term) for (system, _), term in unique.items()),
+            return_exceptions=True
+        )
+
+        resolved = {}
+        for (key, term), result in zip(unique.items(), results):
+            if isinstance(result, Exception):
+                logger.error("Could not resolve %s term '%s': %s", key[0], term, result)
+                result = codes_request.LOOKUP_FAILED
+            resolved[key] = result
+        return resolved
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self._session.close()
+
+
+_client: Optional[AsyncTerminologyClient] = None
+_client_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # A forked child (e.g. a ProcessPool worker) inherits the client but not its
+    # executor threads, so lookups submitted to it would never run
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client() -> AsyncTerminologyClient:
+    """Return the process-wide client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AsyncTerminologyClient()
+        return _client
+
+
+def resolve_terms_async(
+        terms: Dict[str, Iterable[str]]
+) -> Dict[Tuple[str, str], Optional[Tuple[str, str]]]:
+    """
+    Synchronous entry point running `AsyncTerminologyClient.resolve` on a fresh event loop.
+    """
+    return asyncio.run(get_client().resolve(terms))
@@ -0,0 +1,192 @@
+import time
+import random
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generator, Optional
+
+from src.core import settings
+from src.utils.llm_cache import LLMCacheMiss, get_llm_cache
+
+if TYPE_CHECKING:
+    import boto3
+
+# boto3 / botocore are imported on first use: they are the largest part of the startup time
+# and are not needed by the modes that never call Bedrock.
+
+logger = logging.getLogger(__name__)
+
+# Bedrock error codes that signal throttling rather than a bad request
+THROTTLING_ERRORS = frozenset({"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException"})
+
+
+def create_aws_session() -> "boto3.Session":
+    """Create a boto3 session from the configured credentials and region."""
+    import boto3
+
+    session = boto3.Session(
+        aws_access_key_id=settings.AWS_KEY,
+        aws_secret_access_key=settings.AWS_SECRET,
+        region_name=settings.AWS_REGION,
+    )
+    logger.info("AWS session initialized")
+    return session
+
+
+def create_bedrock_client(max_pool_connections: int = settings.BEDROCK_MAX_POOL_CONNECTIONS):
+    """
+    Create a bedrock-runtime client that can be shared by worker threads.
+
+    Args:
+        max_pool_connections (int): Size of the HTTP connection pool; should match the number of workers.
+    Returns:
+        boto3.client: Configured Bedrock runtime client using botocore adaptive retries.
+    """
+    from botocore.config import Config
+
+    session = create_aws_session()
+
+    config = Config(
+        max_pool_connections=max(max_pool_connections, 1),
+        retries={"mode": "adaptive", "max_attempts": settings.BEDROCK_MAX_ATTEMPTS},
+        read_timeout=settings.BEDROCK_READ_TIMEOUT,
+    )
+    client = session.client("bedrock-runtime", config=config)
+    logger.info("Bedrock client created (pool size %d)", config.max_pool_connections)
+    return client
+
+
+class LazyClient:
+    """
+    Client proxy calling `factory` on first use, e.g. `LazyClient(create_bedrock_client)`.
+    Runs that are fully served by the LLM response cache never create the client.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+
+def converse(client, cache_variant: Optional[Any] = None, **request: Any) -> Dict[str, Any]:
+    """
+    Call `client.converse` through the LLM response cache.
+
+    Args:
+        client (boto3.client): Bedrock runtime client (unused on cache hits).
+        cache_variant (Optional[Any]): Extra cache key component, for callers that
+            deliberately repeat an identical request (e.g. sampling several cases).
+        **request: Keyword arguments passed through to `converse`.
+    Returns:
+        Dict[str, Any]: The Converse API response.
+    Raises:
+        LLMCacheMiss: In read-only cache mode when the response is not cached.
+    """
+    cache = get_llm_cache()
+    if not cache.enabled:
+        return converse_with_backoff(client, **request)
+
+    key = _cache_key(request, cache_variant)
+    cached = cache.get(key)
+    if cached is not None:
+        logger.debug("LLM cache hit %s", key)
+        return cached
+    if cache.read_only:
+        raise LLMCacheMiss(f"No cached response for request {key}")
+
+    response = converse_with_backoff(client, **request)
+    cache.put(key, response)
+    return response
+
+
+def converse_stream(client, cache_variant: Optional[Any] = None, **request: Any) -> Generator[str, None, Optional[str]]:
+    """
+    Call `client.converse_stream` and yield text deltas as they arrive.
+
+    Shares cache entries with `converse`: a cached response is yielded as a single
+    chunk, and a completed stream is stored in the Converse response shape.
+
+    Args:
+        client (boto3.client): Bedrock runtime client (unused on cache hits).
+        cache_variant (Optional[Any]): Extra cache key component, see `converse`.
+        **request: Keyword arguments passed through to `converse_stream`.
+    Yields:
+        str: Generated text fragments.
+    Returns:
+        Optional[str]: The stop reason (e.g. "max_tokens"), as the generator's return value.
+    Raises:
+        LLMCacheMiss: In read-only cache mode when the response is not cached.
+    """
+    cache = get_llm_cache()
+    key = _cache_key(request, cache_variant) if cache.enabled else None
+    if key:
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit %s", key)
+            yield "".join(block.get("text", "") for block in cached["output"]["message"]["content"])
+            return cached.get("stopReason")
+        if cache.read_only:
+            raise LLMCacheMiss(f"No cached response for request {key}")
+
+    response = converse_with_backoff(client, operation="converse_stream", **request)
+    parts, stop_reason, usage = [], None, None
+    for event in response["stream"]:
+        if "contentBlockDelta" in event:
+            text = event["contentBlockDelta"]["delta"].get("text")
+            if text:
+                parts.append(text)
+                yield text
+        elif "messageStop" in event:
+            stop_reason = event["messageStop"].get("stopReason")
+        elif "metadata" in event:
+            usage = event["metadata"].get("usage")
+
+    if key:
+        cache.put(key, {
+            "output": {"message": {"role": "assistant", "content": [{"text": "".join(parts)}]}},
+            "stopReason": stop_reason,
+            "usage": usage,
+        })
+    return stop_reason
+
+
+def _cache_key(request: Dict[str, Any], cache_variant: Optional[Any]) -> str:
+    return get_llm_cache().key(request if cache_variant is None else {**request, "cacheVariant": cache_variant})
+
+
+def converse_with_backoff(client, operation: str = "converse", **request: Any) -> Dict[str, Any]:
+    """
+    Call a Bedrock runtime operation, backing off and retrying when Bedrock throttles.
+
+    botocore's adaptive mode already rate-limits the client; this adds a longer,
+    jittered exponential backoff for throttling that outlasts its retry budget,
+    which is common when many workers share one account quota.
+
+    Args:
+        client (boto3.client): Bedrock runtime client.
+        operation (str): Client method to call ("converse" or "converse_stream").
+        **request: Keyword arguments passed through to the operation.
+    Returns:
+        Dict[str, Any]: The API response.
+    Raises:
+        ClientError: For non-throttling errors, or when throttling persists after all retries.
+    """
+    from botocore.exceptions import ClientError
+
+    call = getattr(client, operation)
+    for attempt in range(settings.BEDROCK_THROTTLE_RETRIES + 1):
+        try:
+            return call(**request)
+        except ClientError as err:
+            code = err.response.get("Error", {}).get("Code")
+            if code not in THROTTLING_ERRORS or attempt == settings.BEDROCK_THROTTLE_RETRIES:
+                raise
+            delay = random.uniform(0, min(settings.BEDROCK_BACKOFF_MAX, settings.BEDROCK_BACKOFF_BASE * 2 ** attempt))
+            logger.warning("Bedrock %s (attempt %d), retrying in %.1fs", code, attempt + 1, delay)
+            time.sleep(delay)
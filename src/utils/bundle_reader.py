@@ -0,0 +1,72 @@
+import logging
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, Tuple
+
+from pydantic_core import from_json
+
+from src.utils.json_stream import JSONStreamParser, OBJECT_END, WATCH_ITEMS
+
+logger = logging.getLogger(__name__)
+
+# Characters read at a time by the fallback parser
+CHUNK_CHARS = 1 << 16
+
+
+def iter_bundle_entries(path: Path) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Read the entries of a FHIR bundle file one at a time, without loading the whole file.
+
+    The file may hold several concatenated bundles (e.g. one JSON bundle per line);
+    entries are tagged with the index of their bundle. Uses ijson when installed and
+    otherwise the incremental JSONStreamParser, so memory use is bounded by the
+    largest entry rather than the file.
+
+    Args:
+        path (Path): Bundle JSON file.
+    Yields:
+        Tuple[int, Dict[str, Any]]: (bundle index, entry), in file order.
+    Raises:
+        ValueError: If the file is not valid JSON (ijson.JSONError with ijson).
+    """
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+
+    if ijson is not None:
+        with open(path, "rb") as fh:
+            yield from _ijson_entries(ijson, fh)
+    else:
+        with open(path, "r", encoding="utf-8") as fh:
+            yield from _parser_entries(fh)
+
+
+def _ijson_entries(ijson, fh: IO[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    bundle_index = 0
+    builder = None
+    for prefix, event, value in ijson.parse(fh, multiple_values=True, use_float=True):
+        if prefix == "entry.item" and event == "start_map":
+            builder = ijson.ObjectBuilder()
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == "entry.item" and event == "end_map":
+                yield bundle_index, builder.value
+                builder = None
+        elif prefix == "" and event == "end_map":
+            bundle_index += 1
+
+
+def _parser_entries(fh: IO[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    # No full output to fall back on: a malformed entry fails the file, as with ijson
+    parser = JSONStreamParser({"entry": WATCH_ITEMS}, keep_text=False, object_ends=True, loads=from_json,
+                              strict=True)
+    bundle_index = 0
+    while True:
+        chunk = fh.read(CHUNK_CHARS)
+        if not chunk:
+            return
+        for name, entry in parser.feed(chunk):
+            if name == OBJECT_END:
+                bundle_index += 1
+            else:
+                yield bundle_index, entry
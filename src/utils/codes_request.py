@@ -1,11 +1,17 @@
 import os
 import logging
-from typing import Optional, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Optional, Tuple
+from src.core import settings
 from src.core.settings import LOINC_PASSWORD, LOINC_USERNAME, BIOPORTAL_API_KEY
+from src.utils.terminology_cache import TerminologyCache, normalize_term
+from src.utils.local_terminology import TerminologyIndex
 
-import requests
-from requests.auth import HTTPBasicAuth
-from dotenv import load_dotenv
+if TYPE_CHECKING:
+    import requests
 
 interpretation_map = {
             "high": "H",
@@ -20,15 +26,115 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-# Create a session with authentication
-session = requests.Session()
-if LOINC_USERNAME and LOINC_PASSWORD:
-    session.auth = HTTPBasicAuth(LOINC_USERNAME, LOINC_PASSWORD)
+# The HTTP session (and `requests` itself) is only created for remote lookups
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
 
+# Responses worth retrying: throttling and transient server errors
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
 
-def get_loinc_code(
+
+def loinc_auth() -> Optional["requests.auth.AuthBase"]:
+    """Basic auth for the LOINC API, if credentials are configured."""
+    if LOINC_USERNAME and LOINC_PASSWORD:
+        from requests.auth import HTTPBasicAuth
+        return HTTPBasicAuth(LOINC_USERNAME, LOINC_PASSWORD)
+    return None
+
+
+def get_session() -> "requests.Session":
+    """
+    Shared requests session, created on first use. Throttling (429) and transient
+    5xx responses are retried with exponential backoff, honouring `Retry-After`.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(total=settings.TERMINOLOGY_MAX_RETRIES, status_forcelist=RETRY_STATUS,
+                              backoff_factor=settings.TERMINOLOGY_BACKOFF_BASE, respect_retry_after_header=True)
+                adapter = HTTPAdapter(max_retries=retry, pool_maxsize=settings.TERMINOLOGY_MAX_WORKERS)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+# Persistent cache shared by all lookups (positive and negative results)
+terminology_cache = TerminologyCache(
+    settings.TERMINOLOGY_CACHE_PATH,
+    ttl=settings.TERMINOLOGY_CACHE_TTL,
+    negative_ttl=settings.TERMINOLOGY_CACHE_NEGATIVE_TTL,
+    max_entries=settings.TERMINOLOGY_CACHE_MAX_ENTRIES,
+    enabled=settings.TERMINOLOGY_CACHE_ENABLED,
+)
+
+# Value returned by the public lookup functions when a term is not found
+MISS_VALUES = {"loinc": None, "snomed": (None, None)}
+
+# Marks a term whose lookup failed in a map built by `resolve_terms`
+LOOKUP_FAILED = object()
+
+LOINC_API_URL = "https://clinicaltables.nlm.nih.gov/api/loinc_items/v3/search"
+SNOMED_API_URL = "https://data.bioontology.org/search"
+
+
+def loinc_params(search_term: str) -> Dict[str, str]:
+    return {"terms": search_term}
+
+
+def parse_loinc_response(data: list, search_term: str) -> Optional[Tuple[str, str]]:
+    """
+    Pick the first (code, display) pair from a Clinical Tables LOINC response.
+    """
+    codes = data[1]
+    names = [n[0] for n in data[3]]
+
+    if not codes or not names:
+        logger.warning("No LOINC results for search term '%s'.", search_term)
+        return None
+
+    # Safely pick the first result
+    code, name = codes[0], names[0]
+    if code and name:
+        return code, name
+
+    logger.warning("No canonical code found for search term '%s'.", search_term)
+    return None
+
+
+def snomed_params(term: str) -> Dict[str, str]:
+    return {
+        "q": term,
+        "ontologies": "SNOMEDCT",
+        "apikey": BIOPORTAL_API_KEY
+    }
+
+
+def parse_snomed_response(data: dict) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Pick the first (code, prefLabel) pair from a BioPortal search response.
+    """
+    # Take the first result if available
+    results = data.get("collection", [])
+    if not results:
+        return None, None
+
+    result = results[0]
+    pref_label = result.get("prefLabel")
+    concept_id = result.get("@id")
+
+    snomed_code = concept_id.split("/")[-1] if concept_id else None
+    return snomed_code, pref_label
+
+
+def query_loinc_api(
     search_term: str,
-    session: requests.Session = session,
+    session: Optional["requests.Session"] = None,
 ) -> Optional[Tuple[str, str]]:
     """
     Query the Clinical Tables LOINC API for a given lab test name and attempt
@@ -44,7 +150,8 @@ def get_loinc_code(
 
     Args:
         search_term (str): The lab test name to search for (e.g., "HDL cholesterol").
-        session (requests.Session): An authenticated requests session.
+        session (requests.Session): A requests session; the shared session
+            (`get_session`) if not given.
 
     Returns:
         Optional[Tuple[str, str]]: A tuple of (LOINC code, display name) if found,
@@ -53,67 +160,194 @@ def get_loinc_code(
     Raises:
         requests.RequestException: If the API call fails.
     """
-    url = "https://clinicaltables.nlm.nih.gov/api/loinc_items/v3/search"
-    params = {"terms": search_term}
+    import requests
 
+    session = session or get_session()
     try:
-        resp = session.get(url, params=params)
+        resp = session.get(LOINC_API_URL, params=loinc_params(search_term), auth=loinc_auth(),
+                           timeout=settings.TERMINOLOGY_REQUEST_TIMEOUT)
         resp.raise_for_status()
-        data = resp.json()
+        return parse_loinc_response(resp.json(), search_term)
 
-        codes = data[1]
-        names = [n[0] for n in data[3]]
+    except requests.RequestException as e:
+        logger.error("Error querying LOINC API: %s", e)
+        raise
 
-        if not codes or not names:
-            logger.warning("No LOINC results for search term '%s'.", search_term)
-            return None
 
-        # Safely pick the first result
-        code, name = codes[0], names[0]
-        if code and name:
-            return code, name
+def query_snomed_api(term: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Query BioPortal for a term and return the first SNOMED CT code.
+    Errors are raised rather than swallowed, so that failed requests
+    are never stored in the terminology cache.
+    """
+    response = get_session().get(SNOMED_API_URL, params=snomed_params(term),
+                                 timeout=settings.TERMINOLOGY_REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return parse_snomed_response(response.json())
 
-        logger.warning("No canonical code found for search term '%s'.", search_term)
-        return None
 
-    except requests.RequestException as e:
-        logger.error("Error querying LOINC API: %s", e)
-        raise
+_local_indexes: Dict[str, Optional[TerminologyIndex]] = {}
+
+
+def query_local_index(system: str, term: str) -> Optional[Tuple[str, str]]:
+    """
+    Look up a term in the memory-mapped local index of a code system.
+    The index is opened on first use; a missing index file simply yields no result.
+    """
+    if system not in _local_indexes:
+        path = Path(settings.LOCAL_TERMINOLOGY_INDEXES[system])
+        if path.exists():
+            _local_indexes[system] = TerminologyIndex(path)
+            logger.info("Loaded local %s index from %s", system, path)
+        else:
+            _local_indexes[system] = None
+            logger.info("No local %s index at %s; skipping local lookups", system, path)
 
+    index = _local_indexes[system]
+    return index.lookup(term) if index else None
 
+
+# Lookup backends per code system, tried in the order given by settings.TERMINOLOGY_BACKENDS
+TERMINOLOGY_BACKENDS: Dict[str, Dict[str, Callable[[str], Optional[Tuple[str, str]]]]] = {
+    "loinc": {
+        "local": partial(query_local_index, "loinc"),
+        "remote": query_loinc_api,
+    },
+    "snomed": {
+        "local": partial(query_local_index, "snomed"),
+        "remote": query_snomed_api,
+    },
+}
+
+
+def lookup_code(system: str, term: str) -> Optional[Tuple[str, str]]:
+    """
+    Resolve a term against the configured backends and return the first (code, display) found.
+
+    Args:
+        system (str): Code system ("loinc" or "snomed").
+        term (str): Term to look up.
+    Returns:
+        Optional[Tuple[str, str]]: (code, display) or None if no backend knows the term.
+    """
+    for name in settings.TERMINOLOGY_BACKENDS:
+        result = TERMINOLOGY_BACKENDS[system][name](term)
+        if result and result[0]:
+            return tuple(result)
+    return None
+
+
+@terminology_cache.cached("loinc")
+def get_loinc_code(search_term: str) -> Optional[Tuple[str, str]]:
+    """
+    Resolve a lab test or vital sign name to a LOINC code.
+    Results (including empty ones) are served from the persistent terminology cache when available.
+
+    Args:
+        search_term (str): The lab test name to search for (e.g., "HDL cholesterol").
+    Returns:
+        Optional[Tuple[str, str]]: A tuple of (LOINC code, display name) if found,
+        otherwise None.
+    Raises:
+        requests.RequestException: If the remote API call fails.
+    """
+    return lookup_code("loinc", search_term)
+
+
+@terminology_cache.cached("snomed", miss=MISS_VALUES["snomed"])
 def get_snomed_code(term:str)->Optional[Tuple[str, str]]:
     """
-    Query BioPortal for a symptom term and return the first SNOMED CT code.
+    Resolve a symptom, medication or condition term to the first SNOMED CT code.
+    Results (including empty ones) are served from the persistent terminology cache when available.
 
     Parameters:
         term (str): The symptom or test name to search.
     Returns:
         tuple: (snomed_code, pref_label) or (None, None) if not found.
+    Raises:
+        requests.RequestException: If the remote API call fails.
     """
-    url = "https://data.bioontology.org/search"
-    params = {
-        "q": term,
-        "ontologies": "SNOMEDCT",
-        "apikey": BIOPORTAL_API_KEY
+    return lookup_code("snomed", term) or (None, None)
+
+
+# Public lookup function per code system
+CODE_LOOKUPS: Dict[str, Callable[[str], Optional[Tuple[str, str]]]] = {
+    "loinc": get_loinc_code,
+    "snomed": get_snomed_code,
+}
+
+
+def unique_terms(terms: Dict[str, Iterable[str]]) -> Dict[Tuple[str, str], str]:
+    """
+    Deduplicate terms per code system on their normalized form.
+
+    Returns:
+        Dict[Tuple[str, str], str]: Original spelling keyed by (code system, normalized term).
+    """
+    return {
+        (system, normalize_term(term)): term
+        for system, system_terms in terms.items()
+        for term in system_terms if term
     }
 
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
 
-        # Take the first result if available
-        results = data.get("collection", [])
-        if not results:
-            return None, None
+def resolve_terms(
+        terms: Dict[str, Iterable[str]],
+        max_workers: int = settings.TERMINOLOGY_MAX_WORKERS
+) -> Dict[Tuple[str, str], Optional[Tuple[str, str]]]:
+    """
+    Resolve many terms at once.
 
-        result = results[0]
-        pref_label = result.get("prefLabel")
-        concept_id = result.get("@id")
+    Terms are deduplicated per code system on their normalized form, so each
+    distinct term costs at most one lookup. With TERMINOLOGY_ASYNC enabled the
+    lookups go through the pooled asyncio client (see `async_codes_request`),
+    otherwise through a bounded worker pool of synchronous lookups. Terms whose
+    lookup fails (after retries) are logged and mapped to LOOKUP_FAILED, so they
+    are neither cached nor looked up again by `code_for`.
 
-        snomed_code = concept_id.split("/")[-1] if concept_id else None
-        return snomed_code, pref_label
+    Args:
+        terms (Dict[str, Iterable[str]]): Terms to resolve, keyed by code system ("loinc", "snomed").
+        max_workers (int): Maximum number of concurrent synchronous lookups.
+    Returns:
+        Dict[Tuple[str, str], Optional[Tuple[str, str]]]: Lookup results keyed by
+        (code system, normalized term), in the same shape the lookup functions return,
+        or LOOKUP_FAILED.
+    """
+    unique = unique_terms(terms)
+    if not unique:
+        return {}
+
+    if settings.TERMINOLOGY_ASYNC:
+        from src.utils.async_codes_request import resolve_terms_async
+        return resolve_terms_async(terms)
 
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as pool:
+        futures = {key: pool.submit(CODE_LOOKUPS[key[0]], term) for key, term in unique.items()}
+        return {key: lookup_result(key, unique[key], future) for key, future in futures.items()}
+
+
+def lookup_result(key: Tuple[str, str], term: str, future) -> Optional[Tuple[str, str]]:
+    """Result of a lookup future, or LOOKUP_FAILED (logged) if the lookup raised."""
+    try:
+        return future.result()
     except Exception as e:
-        print("Error:", e)
-        return None, None
\ No newline at end of file
+        logger.error("Could not resolve %s term '%s': %s", key[0], term, e)
+        return LOOKUP_FAILED
+
+
+def code_for(
+        system: str,
+        term: str,
+        codes: Optional[Dict[Tuple[str, str], Optional[Tuple[str, str]]]] = None
+) -> Optional[Tuple[str, str]]:
+    """
+    Return the lookup result for a term from a map built by `resolve_terms`,
+    falling back to a direct lookup when the term was not resolved in advance.
+    A term whose lookup already failed gets the not-found value without a new request.
+    """
+    if codes is not None:
+        key = (system, normalize_term(term))
+        if key in codes:
+            result = codes[key]
+            return MISS_VALUES[system] if result is LOOKUP_FAILED else result
+    return CODE_LOOKUPS[system](term)
@@ -0,0 +1,188 @@
+import re
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils.llm_utils import extract_json_block
+
+logger = logging.getLogger(__name__)
+
+# Watch modes: emit the value of a top-level key, or each element of a top-level array
+WATCH_VALUE = "value"
+WATCH_ITEMS = "items"
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_STRUCTURAL = re.compile(r'["{}\[\]:,]')
+
+# Event name emitted (with a None value) when a top-level object closes, with `object_ends`
+OBJECT_END = "__object_end__"
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "start", "name", "count")
+
+    def __init__(self, kind: str, start: Optional[int] = None, name: Optional[str] = None):
+        self.kind = kind
+        self.key: Optional[str] = None
+        self.start = start
+        self.name = name
+        self.count = 0
+
+
+class JSONStreamParser:
+    """
+    Incremental parser emitting parts of a top-level JSON object as soon as they close.
+
+    Text is fed in arbitrary chunks (e.g. Bedrock stream deltas). The parser tracks
+    strings and nesting in a single pass over each new character and, for every
+    watched key of the top-level object, emits either the whole value
+    (WATCH_VALUE) or each element of the array (WATCH_ITEMS) once its closing
+    bracket arrives. Text before the first "{" (Markdown fences, preambles) is ignored.
+
+    Concatenated top-level objects are parsed one after the other; with `object_ends`
+    an (OBJECT_END, None) event marks the end of each. With `keep_text=False`, text
+    no pending value refers to is dropped after each chunk, so memory is bounded by
+    the largest watched value rather than the whole input (`text` is then partial).
+    A watched value that does not parse is skipped with a warning (the caller can
+    fall back to the full output), or raises ValueError with `strict`.
+
+    Example:
+        parser = JSONStreamParser({"patient": WATCH_VALUE, "encounters": WATCH_ITEMS})
+        for chunk in chunks:
+            for name, value in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(
+            self,
+            watch: Dict[str, str],
+            keep_text: bool = True,
+            object_ends: bool = False,
+            loads: Callable[[str], Any] = extract_json_block,
+            strict: bool = False
+    ):
+        self.watch = watch
+        self.keep_text = keep_text
+        self.object_ends = object_ends
+        self.loads = loads
+        self.strict = strict
+        self.text = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[Tuple[int, int]] = None
+
+    def _watched_name(self) -> Optional[str]:
+        """Name to emit for a container opening at the current position, if watched."""
+        if len(self._stack) == 1:
+            key = self._stack[0].key
+            if self.watch.get(key) == WATCH_VALUE:
+                return key
+        elif len(self._stack) == 2 and self._stack[1].kind == "[":
+            key = self._stack[0].key
+            if self.watch.get(key) == WATCH_ITEMS:
+                return key
+        return None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a chunk of text.
+
+        Returns:
+            List[Tuple[str, Any]]: (watched key, parsed value) for every value completed by this chunk.
+        """
+        self.text += chunk
+        text = self.text
+        events = []
+
+        # Jump from one significant character to the next: quotes and backslashes
+        # inside strings, brackets and separators outside
+        i, end = self._pos, len(text)
+        while i < end:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                match = _STRING_SPECIAL.search(text, i)
+                if match is None:
+                    break
+                i = match.start()
+                if text[i] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    self._last_string = (self._string_start, i)
+                i += 1
+                continue
+
+            if not self._stack:
+                i = text.find("{", i)
+                if i < 0:
+                    break
+                self._stack.append(_Frame("{"))
+                i += 1
+                continue
+
+            match = _STRUCTURAL.search(text, i)
+            if match is None:
+                break
+            i = match.start()
+            ch = text[i]
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                name = self._watched_name()
+                self._stack.append(_Frame(ch, start=i if name else None, name=name))
+            elif ch in "}]":
+                frame = self._stack.pop()
+                if frame.name is not None:
+                    value = self._parse(text[frame.start:i + 1], frame.name)
+                    if value is not None:
+                        events.append((frame.name, value))
+                if not self._stack and self.object_ends:
+                    events.append((OBJECT_END, None))
+            elif ch == ":" and self._stack[-1].kind == "{" and self._last_string:
+                start, stop = self._last_string
+                self._stack[-1].key = text[start + 1:stop]
+            elif ch == "," and self._stack[-1].kind == "{":
+                self._stack[-1].key = None
+            i += 1
+
+        self._pos = len(text)
+        if not self.keep_text:
+            self._compact()
+        return events
+
+    def _compact(self) -> None:
+        """Drop the consumed text that no open watched value, string or pending key refers to."""
+        keep = self._pos
+        if self._in_string:
+            keep = min(keep, self._string_start)
+        if self._last_string:
+            keep = min(keep, self._last_string[0])
+        for frame in self._stack:
+            if frame.start is not None:
+                keep = min(keep, frame.start)
+        if not keep:
+            return
+
+        self.text = self.text[keep:]
+        self._pos -= keep
+        self._string_start -= keep
+        if self._last_string:
+            self._last_string = (self._last_string[0] - keep, self._last_string[1] - keep)
+        for frame in self._stack:
+            if frame.start is not None:
+                frame.start -= keep
+
+    def _parse(self, fragment: str, name: str) -> Any:
+        try:
+            return self.loads(fragment)
+        except ValueError as e:
+            if self.strict:
+                raise ValueError(f"Malformed '{name}' value in JSON stream: {e}") from e
+            logger.warning("Could not parse streamed '%s' fragment; it will be taken from the full output", name)
+            return None
@@ -0,0 +1,143 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.core import settings
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ("off", "read-write", "read-only")
+
+# Response fields worth persisting; ResponseMetadata (request IDs, headers) is dropped
+_STORED_FIELDS = ("output", "stopReason", "usage", "metrics")
+
+
+class LLMCacheMiss(LookupError):
+    """Raised in read-only (replay) mode when a request has no cached response."""
+
+
+class LLMResponseCache:
+    """
+    Content-addressed on-disk cache of Bedrock Converse responses.
+
+    The key is a SHA-256 of the canonical JSON of the request (model ID, messages,
+    inferenceConfig and any other Converse arguments), so a cached response is
+    only reused for an identical call. Each response is one JSON file under
+    `<directory>/<key[:2]>/<key>.json`. Reads refresh the file's mtime; when the
+    total size exceeds `max_bytes`, the least recently used files are removed.
+
+    Modes:
+        "off": the cache is bypassed.
+        "read-write": hits are served from disk, misses are requested and stored.
+        "read-only": replay mode; a miss raises LLMCacheMiss instead of calling the model.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, mode: str = "read-write"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode '{mode}', expected one of {CACHE_MODES}")
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.mode = mode
+
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def read_only(self) -> bool:
+        return self.mode == "read-only"
+
+    @staticmethod
+    def key(request: Dict[str, Any]) -> str:
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                response = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable LLM cache entry %s: %s", path, e)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return response
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        if self.read_only:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({k: response[k] for k in _STORED_FIELDS if k in response},
+                          ensure_ascii=False, default=str).encode("utf-8")
+
+        # Write atomically so concurrent readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(p.stat().st_size for p in self.directory.glob("*/*.json"))
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            ((p.stat().st_mtime, p.stat().st_size, p) for p in self.directory.glob("*/*.json")),
+            key=lambda entry: entry[0]
+        )
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._size = total
+        logger.debug("Evicted %d LLM cache entries", removed)
+
+
+_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide response cache configured from settings."""
+    global _cache
+    if _cache is None:
+        _cache = LLMResponseCache(settings.LLM_CACHE_DIR, settings.LLM_CACHE_MAX_BYTES, settings.LLM_CACHE_MODE)
+    return _cache
+
+
+def configure_llm_cache(mode: str) -> LLMResponseCache:
+    """Replace the process-wide cache with one using `mode` (e.g. from the YAML config)."""
+    global _cache
+    _cache = LLMResponseCache(settings.LLM_CACHE_DIR, settings.LLM_CACHE_MAX_BYTES, mode)
+    logger.info("LLM response cache mode: %s", mode)
+    return _cache
@@ -2,7 +2,7 @@ import re
 import yaml
 import json
 import logging
-from typing import Any
+from typing import Any, Iterator, List, Optional, Tuple
 from pathlib import Path
 from pydantic_core import from_json
 
@@ -10,66 +10,157 @@ _CONTROL_CHARS_RE = re.compile(r"[\x00-\x08\x0B-\x0C\x0E-\x1F]")
 logger = logging.getLogger(__name__)
 
 
-def _extract_json_value(raw: str) -> str:
+_PYTHON_LITERALS = {"None": "null", "True": "true", "False": "false"}
+_STRING_OR_LITERAL_RE = re.compile(r'"(?:\\.|[^"\\])*"|\b(None|True|False)\b')
+# Structural tokens of a JSON value; strings are matched whole so brackets inside them are skipped
+_JSON_TOKEN_RE = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(?P<closed>")?|[{}\[\],:]|\b(?:None|True|False)\b')
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _scan_json_value(raw: str, start: int) -> Optional[str]:
     """
-    Returns the first JSON value (object, array, string, number, boolean, null) found in `raw`.
-    Raises if none is found.
+    Single-pass, string-aware scan for the JSON object or array opening at `raw[start]`.
+
+    - Brackets inside string values are ignored, so the *balanced* value is returned.
+    - Python literals (None/True/False) outside strings are normalized to JSON.
+    - If the value is truncated (e.g. the model hit maxTokens), it is cut back to the
+      last complete element and the open arrays/objects are closed.
+
+    Returns None if a closing bracket does not match the open one (not a JSON value).
     """
-    # Try to find JSON object first
-    m = re.search(r"\{.*\}", raw, re.S)
-    if m:
-        return m.group(0)
+    stack: List[str] = []
+    # For each open object: True while the next string is a key
+    expect_key: List[bool] = []
+    literals: List[Tuple[int, str]] = []
+    safe = start
+    end = None
 
-    # Try to find JSON array
-    m = re.search(r"\[.*\]", raw, re.S)
-    if m:
-        return m.group(0)
+    for token in _JSON_TOKEN_RE.finditer(raw, start):
+        ch = token.group()[0]
+        if ch == '"':
+            if token.group("closed") is None:
+                break
+            if not (stack[-1] == "{" and expect_key[-1]):
+                safe = token.end()
+        elif ch in "{[":
+            stack.append(ch)
+            expect_key.append(ch == "{")
+            safe = token.end()
+        elif ch in "}]":
+            if _CLOSERS[stack[-1]] != ch:
+                return None
+            stack.pop()
+            expect_key.pop()
+            safe = token.end()
+            if not stack:
+                end = safe
+                break
+        elif ch == ",":
+            safe = token.start()
+            if stack[-1] == "{":
+                expect_key[-1] = True
+        elif ch == ":":
+            expect_key[-1] = False
+        else:
+            literals.append((token.start(), _PYTHON_LITERALS[token.group()]))
+
+    if end is None:
+        # Truncated: keep the last complete element and close what is still open
+        # (no bracket was opened or closed after `safe`, so `stack` still describes that point)
+        value = raw[start:safe].rstrip().rstrip(",")
+        # Drop array elements that were opened but never filled
+        while len(stack) > 1 and value[-1] in "{[":
+            body = value[:-1].rstrip()
+            if body[-1] not in ",[":
+                break
+            value = body.rstrip(",").rstrip()
+            stack.pop()
+        end = start + len(value)
+        closing = "".join(_CLOSERS[opener] for opener in reversed(stack))
+        logger.warning("Repaired truncated JSON value (closed %d open containers)", len(stack))
+    else:
+        value = raw[start:end]
+        closing = ""
+
+    if literals:
+        # JSON literals have the same length as their Python spelling
+        pieces, last = [], start
+        for pos, replacement in literals:
+            if pos >= end:
+                break
+            pieces.append(raw[last:pos])
+            pieces.append(replacement)
+            last = pos + len(replacement)
+        pieces.append(raw[last:end])
+        value = "".join(pieces)
+
+    return value + closing
+
+
+def _json_values(raw: str) -> Iterator[str]:
+    """
+    Yields the candidate JSON values (object, array, string, number, boolean, null)
+    found in `raw`, most likely first: objects, then arrays (arrays first if `raw`
+    itself is one), then primitives. Bracketed prose such as "[1]" or "{sic}" before
+    the actual value is thus skipped once it fails to parse.
+    """
+    # Objects and arrays: string-aware scan from each opening bracket
+    objects = [m.start() for m in re.finditer(r"\{", raw)]
+    arrays = [m.start() for m in re.finditer(r"\[", raw)]
+    starts = arrays + objects if raw.lstrip().startswith("[") else objects + arrays
+    for start in starts:
+        value = _scan_json_value(raw, start)
+        if value is not None:
+            yield value
 
     # Try to find JSON primitive values (boolean, number, string, null)
     m = re.search(r'\b(true|false|null)\b', raw, re.IGNORECASE)
     if m:
-        return m.group(0)
+        yield m.group(0)
 
     # Try to find numbers
     m = re.search(r'\b\d+(?:\.\d+)?\b', raw)
     if m:
-        return m.group(0)
+        yield m.group(0)
 
     # Try to find quoted strings
     m = re.search(r'"[^"]*"', raw)
     if m:
-        return m.group(0)
+        yield m.group(0)
 
 
 def normalize_llm_json(text: str) -> str:
-    # Replace Python-style literals with JSON
-    text = re.sub(r'\bNone\b', 'null', text)
-    text = re.sub(r'\bTrue\b', 'true', text)
-    text = re.sub(r'\bFalse\b', 'false', text)
-    return text
+    """
+    Replace Python-style literals (None/True/False) with JSON ones, leaving string values untouched.
+    """
+    return _STRING_OR_LITERAL_RE.sub(
+        lambda m: _PYTHON_LITERALS[m.group(1)] if m.group(1) else m.group(0),
+        text
+    )
+
 
 def extract_json_block(raw: str) -> Any:
     """
     Cleans and parses the JSON returned by get_text_generation_response_openai.
     - Removes Markdown fences and other noise
+    - Finds balanced JSON values in one pass each, normalizing Python literals
+      outside strings and repairing truncated objects/arrays
     - Strips illegal control characters
-    - Delegates to pydantic_core.from_json for fast validation
+    - Delegates to pydantic_core.from_json for fast validation, returning the
+      first candidate value that parses
     """
-    try:
-        # 1. Drop ```json / ``` fences if present
-        cleaned = raw.replace("```json", "").replace("```", "")
-        # 2. Pull out the JSON value (object, array, primitive)
-        cleaned = _extract_json_value(cleaned)
-        # 3. Remove any remaining control bytes that break json.loads()
-        cleaned = _CONTROL_CHARS_RE.sub("", cleaned)
-
-        #4. Normalize
-        normalized = normalize_llm_json(cleaned)
-
-        # 5. Parse
-        return from_json(normalized)
-    except Exception as exc:
-        logger.error("Failed to parse LLM JSON: %s\nRAW: %s", exc, raw)
-        raise ValueError("extract_json_block failed; request won't be processed") from exc
+    error: Optional[Exception] = None
+    # 1. Drop ```json / ``` fences if present
+    cleaned = raw.replace("```json", "").replace("```", "")
+    # 2. Pull out the JSON values (object, array, primitive)
+    for value in _json_values(cleaned):
+        try:
+            # 3. Remove any remaining control bytes that break json.loads()
+            # 4. Parse (Python literals were normalized while scanning)
+            return from_json(_CONTROL_CHARS_RE.sub("", value))
+        except ValueError as exc:
+            error = error or exc
+    logger.error("Failed to parse LLM JSON: %s\nRAW: %s", error or "no JSON value found", raw)
+    raise ValueError("extract_json_block failed; request won't be processed") from error
 
 
@@ -1,8 +1,16 @@
 from pathlib import Path
+import os
 import json
 from datetime import datetime
+from typing import List
 import yaml
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
 def load_config(path: Path) -> dict:
     with open(path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
@@ -45,16 +53,16 @@ Encounter {i}:
   Date: {enc.encounter_date}
   Reason: {enc.reason}
   Symptoms:"""
-        for symptom in enc.observation.get("symptom", []):
+        for symptom in enc.observation.symptom:
             patient_str += f"\n    - {symptom.symptom_name}: {'Present' if symptom.present else 'Absent'}"
 
         patient_str += "\n  Vital Signs:"
-        for vital in enc.observation.get("vital_sign", []):
+        for vital in enc.observation.vital_sign:
             if vital.value and vital.unit:
                 patient_str += f"\n    - {vital.vital_type}: {vital.value} {vital.unit}"
 
         patient_str += "\n  Laboratory Results:"
-        for lab in enc.observation.get("laboratory", []):
+        for lab in enc.observation.laboratory:
             value_str = f"Value: {lab.value}\n      Unit: {lab.unit}" if lab.value is not None else "Not available"
             patient_str += f"\n    - {lab.test_name}:\n      {value_str}"
 
@@ -87,6 +95,19 @@ Encounter {i}:
 
     return patient_str
 
+def format_summary_entry(patient_info: str, fhir_file: Path) -> str:
+    """Entry of summary.txt for a patient summary: disease and case come from the FHIR path."""
+    disease = fhir_file.parent.name
+    case = fhir_file.stem
+
+    return (
+        f"**Disease:** {disease}\n"
+        f"**Case:** {case}\n"
+        f"**Summary:**\n{patient_info}\n"
+        "--------------------------------\n"
+    )
+
+
 def save_patient_summary(
         patient_info: str,
         fhir_file: Path,
@@ -102,25 +123,84 @@ def save_patient_summary(
     Returns:
         None
     """
-    disease = fhir_file.parent.name
-    case = fhir_file.stem
+    with SummaryWriter(fhir_folder) as writer:
+        writer.write(patient_info, fhir_file)
 
-    summary_file = fhir_folder / "summary.txt"
 
-    entry = (
-        f"**Disease:** {disease}\n"
-        f"**Case:** {case}\n"
-        f"**Summary:**\n{patient_info}\n"
-        "--------------------------------\n"
-    )
+class SummaryWriter:
+    """
+    Appends patient summaries to `<fhir_folder>/summary.txt` through one buffered handle.
 
-    with summary_file.open("a", encoding="utf-8") as f:
-        f.write(entry)
+    Entries are written in the order `write` is called. Whenever the buffer holds
+    `buffer_bytes`, and on `flush` / `close`, the buffered entries are appended in one
+    write under an exclusive lock on the file (fcntl.lockf, which also works on NFS),
+    so several processes or nodes can feed the same summary file without interleaving
+    entries.
 
+    Example:
+        with SummaryWriter(Path("data/output")) as writer:
+            writer.write(patient_info, fhir_file)
+    """
 
-def save_generated_case(disease: str, case_text: str, yaml_path: str = "src/config/generated_cases.yaml") -> None:
+    def __init__(self, fhir_folder: Path, buffer_bytes: int = 1 << 20):
+        self.path = Path(fhir_folder) / "summary.txt"
+        self.buffer_bytes = buffer_bytes
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._fh = None
+
+    def write(self, patient_info: str, fhir_file: Path) -> None:
+        entry = format_summary_entry(patient_info, fhir_file).encode("utf-8")
+        self._buffer.append(entry)
+        self._buffered += len(entry)
+        if self._buffered >= self.buffer_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._fh = open(self.path, "ab")
+        data = b"".join(self._buffer)
+        self._buffer, self._buffered = [], 0
+
+        if fcntl is None:
+            # No POSIX locks (Windows): single-writer only
+            self._fh.write(data)
+            self._fh.flush()
+            return
+        fcntl.lockf(self._fh, fcntl.LOCK_EX)
+        try:
+            self._fh.write(data)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+        finally:
+            fcntl.lockf(self._fh, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        self.flush()
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self) -> "SummaryWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def disease_key(disease: str) -> str:
+    """Key of a disease in the cases file (and name of its output directory)."""
+    return disease.lower().replace(" ", "_")
+
+
+def save_generated_case(disease: str, case_text: str, yaml_path: str = "src/config/generated_cases.yaml") -> dict:
     """
     Appends a generated case description for a given disease to a YAML file.
+    A case whose text is already saved for the disease (e.g. a generation replayed
+    from the LLM response cache) is not added again.
 
     Args:
         disease (str): The name of the disease for which the case was generated.
@@ -129,30 +209,36 @@ def save_generated_case(disease: str, case_text: str, yaml_path: str = "src/conf
             Defaults to "src/config/generated_cases.yaml".
 
     Returns:
-        None
+        dict: The saved (or already saved) case entry ("id" and "text").
     """
 
     yaml_file = Path(yaml_path)
     yaml_file.parent.mkdir(parents=True, exist_ok=True)
 
+    data = None
     if yaml_file.exists():
         with open(yaml_file, "r") as f:
             data = yaml.load(f, Loader=yaml.FullLoader)
     if data is None:
         data = {}
 
-    disease_key = disease.lower().replace(" ", "_")
+    key = disease_key(disease)
 
-    if disease_key not in data:
-        data[disease_key] = []
+    if key not in data:
+        data[key] = []
+    for case in data[key]:
+        if case["text"] == case_text:
+            return case
 
-    case_id = f"case_{len(data[disease_key]) + 1}"
-    data[disease_key].append({
+    case_id = f"case_{len(data[key]) + 1}"
+    case = {
         "id": case_id,
         "text": case_text
-    })
+    }
+    data[key].append(case)
 
     with open(yaml_file, "w", encoding="utf-8") as f:
         yaml.dump(data, f, sort_keys=False, allow_unicode=True)
+    return case
 
 
@@ -0,0 +1,275 @@
+import re
+import csv
+import sys
+import mmap
+import struct
+import logging
+import argparse
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.utils.terminology_cache import normalize_term
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"TTIDX001"
+# record count, token count, then (offset, length) of the six data sections
+_HEADER = struct.Struct("<2Q12Q")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset({"a", "an", "and", "by", "for", "in", "of", "on", "or", "the", "to", "with"})
+_SEPARATOR = "\x1f"
+
+# Number of tokens a trailing prefix may expand to, and how many ranked matches are inspected for an exact hit
+MAX_PREFIX_TOKENS = 64
+MAX_CANDIDATES = 32
+
+# SNOMED CT RF2 description type for synonyms (the preferred term is always one of them)
+SNOMED_SYNONYM_TYPE = "900000000000013009"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a term into lowercase alphanumeric tokens, dropping stop words.
+    """
+    return [tok for tok in _TOKEN_RE.findall(normalize_term(text)) if tok not in _STOPWORDS]
+
+
+def read_loinc_csv(path: Path) -> Iterator[Tuple[str, str, str, int]]:
+    """
+    Read records from the LOINC table CSV (Loinc.csv) of a LOINC release.
+
+    Deprecated and discouraged codes are skipped. COMMON_TEST_RANK is used to
+    prefer frequently ordered tests, mirroring the Clinical Tables API ordering.
+
+    Yields:
+        Tuple[str, str, str, int]: (code, display, searchable text, rank).
+    """
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        for row in csv.DictReader(fh):
+            if row.get("STATUS", "ACTIVE") in ("DEPRECATED", "DISCOURAGED"):
+                continue
+            display = row.get("LONG_COMMON_NAME") or row.get("SHORTNAME") or row.get("COMPONENT")
+            if not display:
+                continue
+            text = " ".join(filter(None, (display, row.get("SHORTNAME"), row.get("COMPONENT"))))
+            rank = int(row.get("COMMON_TEST_RANK") or 0)
+            yield row["LOINC_NUM"], display, text, rank
+
+
+def read_snomed_descriptions(path: Path) -> Iterator[Tuple[str, str, str, int]]:
+    """
+    Read active synonyms from a SNOMED CT RF2 description file
+    (sct2_Description_Snapshot-en_*.txt).
+
+    Yields:
+        Tuple[str, str, str, int]: (concept id, term, searchable text, rank).
+    """
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        reader = csv.reader(fh, delimiter="\t", quoting=csv.QUOTE_NONE)
+        header = next(reader)
+        col = {name: idx for idx, name in enumerate(header)}
+        for row in reader:
+            if row[col["active"]] != "1" or row[col["typeId"]] != SNOMED_SYNONYM_TYPE:
+                continue
+            term = row[col["term"]]
+            yield row[col["conceptId"]], term, term, 0
+
+
+def build_index(records: Iterable[Tuple[str, str, str, int]], output: Path) -> int:
+    """
+    Build a compact token index and write it to `output`.
+
+    Records are ordered by preference (rank, then display length), so the posting
+    lists are sorted in preference order and the first match of an intersection
+    is the best one.
+
+    Args:
+        records: Iterable of (code, display, searchable text, rank); rank 0 means unranked.
+        output (Path): Destination file.
+    Returns:
+        int: Number of indexed records.
+    """
+    unique = {(code, display): (text, rank) for code, display, text, rank in records}
+    ordered = sorted(
+        unique.items(),
+        key=lambda item: (item[1][1] or sys.maxsize, len(item[0][1]), item[0][1])
+    )
+
+    rec_offsets, rec_blob = array("I", [0]), bytearray()
+    postings_by_token: Dict[bytes, List[int]] = {}
+    for rec_id, ((code, display), (text, _)) in enumerate(ordered):
+        rec_blob += f"{code}{_SEPARATOR}{display}".encode("utf-8")
+        rec_offsets.append(len(rec_blob))
+        for tok in set(tokenize(text)):
+            postings_by_token.setdefault(tok.encode("utf-8"), []).append(rec_id)
+
+    tok_offsets, tok_blob = array("I", [0]), bytearray()
+    post_offsets, postings = array("I", [0]), array("I")
+    for tok in sorted(postings_by_token):
+        tok_blob += tok
+        tok_offsets.append(len(tok_blob))
+        postings.extend(postings_by_token[tok])
+        post_offsets.append(len(postings))
+
+    sections = [rec_offsets, rec_blob, tok_offsets, tok_blob, post_offsets, postings]
+    if sys.byteorder != "little":
+        for section in sections:
+            if isinstance(section, array):
+                section.byteswap()
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    layout, position = [], len(_MAGIC) + _HEADER.size
+    for section in sections:
+        raw = section.tobytes() if isinstance(section, array) else bytes(section)
+        position += -position % 4
+        layout.append((position, raw))
+        position += len(raw)
+
+    with open(output, "wb") as fh:
+        fh.write(_MAGIC)
+        fh.write(_HEADER.pack(len(ordered), len(postings_by_token),
+                              *[value for offset, raw in layout for value in (offset, len(raw))]))
+        for offset, raw in layout:
+            fh.write(b"\0" * (offset - fh.tell()))
+            fh.write(raw)
+
+    logger.info("Indexed %d records and %d tokens into %s", len(ordered), len(postings_by_token), output)
+    return len(ordered)
+
+
+class TerminologyIndex:
+    """
+    Read-only, memory-mapped terminology index produced by `build_index`.
+
+    Opening an index only maps the file, so startup cost does not depend on its size.
+    Lookups intersect the posting lists of the query tokens (the last token may be
+    a prefix) and answer with the same (code, display) contract as the remote APIs.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{self.path} is not a terminology index")
+
+        header = _HEADER.unpack_from(self._mm, len(_MAGIC))
+        self.n_records, self.n_tokens = header[0], header[1]
+        view = memoryview(self._mm)
+        sections = [view[offset:offset + length] for offset, length in zip(header[2::2], header[3::2])]
+        self._rec_offsets = sections[0].cast("I")
+        self._rec_blob = sections[1]
+        self._tok_offsets = sections[2].cast("I")
+        self._tok_blob = sections[3]
+        self._post_offsets = sections[4].cast("I")
+        self._postings = sections[5].cast("I")
+        self._tokens = _TokenView(self._tok_offsets, self._tok_blob, self.n_tokens)
+
+    def record(self, rec_id: int) -> Tuple[str, str]:
+        raw = bytes(self._rec_blob[self._rec_offsets[rec_id]:self._rec_offsets[rec_id + 1]])
+        code, display = raw.decode("utf-8").split(_SEPARATOR, 1)
+        return code, display
+
+    def _token_postings(self, tok_idx: int) -> memoryview:
+        return self._postings[self._post_offsets[tok_idx]:self._post_offsets[tok_idx + 1]]
+
+    def _postings_for(self, token: str, prefix: bool) -> Optional[Iterable[int]]:
+        key = token.encode("utf-8")
+        idx = bisect_left(self._tokens, key)
+        if idx < self.n_tokens and self._tokens[idx] == key:
+            return self._token_postings(idx)
+        if not prefix:
+            return None
+
+        end = min(bisect_left(self._tokens, key + b"\xff"), idx + MAX_PREFIX_TOKENS)
+        if end <= idx:
+            return None
+        merged = set()
+        for tok_idx in range(idx, end):
+            merged.update(self._token_postings(tok_idx))
+        return sorted(merged)
+
+    def lookup(self, term: str) -> Optional[Tuple[str, str]]:
+        """
+        Return the best (code, display) for `term`, or None if nothing matches.
+        Every token of the term must occur in the display (the last one as a prefix);
+        an exact (normalized) display match wins over the highest-ranked partial match.
+        """
+        tokens = tokenize(term)
+        if not tokens:
+            return None
+
+        lists = []
+        for pos, token in enumerate(tokens):
+            ids = self._postings_for(token, prefix=pos == len(tokens) - 1)
+            if ids is None:
+                # A token no display contains: a miss, so that the next backend is asked
+                # rather than matching on the other tokens only
+                return None
+            lists.append(ids)
+
+        lists.sort(key=len)
+        smallest, others = lists[0], lists[1:]
+        wanted = normalize_term(term)
+        first = None
+        seen = 0
+        for rec_id in smallest:
+            if not all(_contains(ids, rec_id) for ids in others):
+                continue
+            code, display = self.record(rec_id)
+            if normalize_term(display) == wanted:
+                return code, display
+            if first is None:
+                first = (code, display)
+            seen += 1
+            if seen >= MAX_CANDIDATES:
+                break
+        return first
+
+    def close(self) -> None:
+        for name in ("_rec_offsets", "_tok_offsets", "_post_offsets", "_postings",
+                     "_rec_blob", "_tok_blob"):
+            getattr(self, name).release()
+        self._tokens = None
+        self._mm.close()
+
+
+class _TokenView:
+    """Sequence view over the sorted token blob, usable with `bisect`."""
+
+    def __init__(self, offsets: memoryview, blob: memoryview, count: int):
+        self._offsets = offsets
+        self._blob = blob
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, idx: int) -> bytes:
+        return bytes(self._blob[self._offsets[idx]:self._offsets[idx + 1]])
+
+
+def _contains(ids, rec_id: int) -> bool:
+    pos = bisect_left(ids, rec_id)
+    return pos < len(ids) and ids[pos] == rec_id
+
+
+READERS = {
+    "loinc": read_loinc_csv,
+    "snomed": read_snomed_descriptions,
+}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build a local terminology index from release files")
+    parser.add_argument("system", choices=sorted(READERS), help="Code system of the source file")
+    parser.add_argument("source", type=Path,
+                        help="Loinc.csv for LOINC, sct2_Description_Snapshot file for SNOMED CT")
+    parser.add_argument("output", type=Path, help="Path of the index file to write")
+    args = parser.parse_args()
+
+    build_index(READERS[args.system](args.source), args.output)
@@ -0,0 +1,72 @@
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def case_input_hash(case_text: str, **params: Any) -> str:
+    """
+    SHA-256 of a case's input: its text plus the parameters the output depends on
+    (model ID, extraction mode, converter fingerprint, ...).
+    """
+    canonical = json.dumps({"text": case_text, **params}, sort_keys=True, ensure_ascii=False,
+                           separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ConversionManifest:
+    """
+    Record of converted cases, used to skip unchanged ones on re-runs.
+
+    Each conversion appends one JSON line {"case", "input_hash", "output"} to
+    `<output_dir>/manifest.jsonl`; when a case appears several times the last line
+    wins. Appending keeps every finished conversion on disk even if the run is
+    interrupted. A case is current when its input hash is unchanged and its output
+    file still exists.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, str]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                for line_no, line in enumerate(fh, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        self._entries[entry["case"]] = entry
+                    except (ValueError, KeyError) as e:
+                        logger.warning("Ignoring manifest line %d of %s: %s", line_no, self.path, e)
+        except FileNotFoundError:
+            return
+        logger.info("Loaded %d converted cases from %s", len(self._entries), self.path)
+
+    def is_current(self, case_key: str, input_hash: str) -> bool:
+        entry = self._entries.get(case_key)
+        return entry is not None and entry["input_hash"] == input_hash and Path(entry["output"]).exists()
+
+    def record(self, case_key: str, input_hash: str, output: Path) -> None:
+        """
+        Record the conversion of a case. A previous output of the case under another
+        name (the patient ID changed with the content) is removed.
+        """
+        entry = {"case": case_key, "input_hash": input_hash, "output": str(output)}
+        with self._lock:
+            previous: Optional[Dict[str, str]] = self._entries.get(case_key)
+            if previous and previous["output"] != entry["output"] and Path(previous["output"]).is_file():
+                Path(previous["output"]).unlink()
+            self._entries[case_key] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
@@ -0,0 +1,365 @@
+import io
+import os
+import gzip
+import json
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic_core import from_json, to_json
+
+logger = logging.getLogger(__name__)
+
+NDJSON_SUFFIX = ".ndjson"
+GZIP_SUFFIX = ".gz"
+DEFAULT_BUFFER_BYTES = 1 << 20
+# Case -> patient ID of the cases written with `write_case`, one JSON line per write
+CASE_INDEX_NAME = "cases.jsonl"
+# Replacements of re-converted cases not yet applied to the files
+PENDING_NAME = "pending.json"
+
+
+class NDJSONBulkWriter:
+    """
+    FHIR Bulk Data style output: one compact resource per line, one
+    `<resourceType>.ndjson` file (`.ndjson.gz` with `compress`) per resource type.
+
+    Lines are buffered and appended to their files once the buffer holds
+    `buffer_bytes`, and on `flush` / `close`. Files are opened in append mode, so
+    successive runs add to the same export; gzip files hold one member per flush,
+    which gzip readers concatenate transparently. Thread safe.
+
+    Cases written with `write_case` are indexed in `cases.jsonl` once their lines
+    are flushed, and their `on_flushed` callback (e.g. recording the case in the
+    conversion manifest) is called then. Writing a case again (re-conversion, or
+    retry after an interrupted run) replaces its earlier lines: those from earlier
+    runs are dropped in one rewrite of the files at `close`. Until then the drops
+    are kept in `pending.json`, so an interrupted run completes them on the next
+    start.
+
+    Example:
+        with NDJSONBulkWriter(Path("data/output/ndjson"), compress=True) as writer:
+            writer.write(resource)
+    """
+
+    def __init__(self, directory: Path, compress: bool = False, buffer_bytes: int = DEFAULT_BUFFER_BYTES):
+        self.directory = Path(directory)
+        self.compress = compress
+        self.buffer_bytes = buffer_bytes
+
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, List[bytes]] = {}
+        self._buffered = 0
+        self._files: Dict[str, IO[bytes]] = {}
+        # Case -> patient ID of the flushed cases (loaded from cases.jsonl on first use)
+        self._cases: Optional[Dict[str, Optional[str]]] = None
+        # Buffered cases: (case key, patient ID, on_flushed)
+        self._pending: List[Tuple[str, Optional[str], Optional[Callable[[], None]]]] = []
+        self._written: Set[str] = set()
+        # Patients whose lines written before this run are dropped at close, and the
+        # size of each file before this run appended to it
+        self._stale: Set[str] = set()
+        self._base_sizes: Dict[str, int] = {}
+
+    def path(self, resource_type: str) -> Path:
+        suffix = NDJSON_SUFFIX + (GZIP_SUFFIX if self.compress else "")
+        return self.directory / f"{resource_type}{suffix}"
+
+    def write(self, resource: Dict[str, Any]) -> None:
+        """Append a resource (JSON form, without None values) to its resource type's file."""
+        with self._lock:
+            self._case_index()
+            self._buffer(resource)
+            if self._buffered >= self.buffer_bytes:
+                self._flush_all()
+
+    def write_case(
+            self,
+            case_key: str,
+            resources: Iterable[Dict[str, Any]],
+            on_flushed: Optional[Callable[[], None]] = None
+    ) -> None:
+        """
+        Write the resources of a case, replacing those of an earlier write of the same case.
+
+        Args:
+            case_key (str): Case identifier, e.g. "<disease>/<case_id>".
+            resources (Iterable[Dict[str, Any]]): Resources of the case.
+            on_flushed (Optional[Callable[[], None]]): Called once the resources are flushed.
+        """
+        resources = list(resources)
+        patient_id = next((r.get("id") for r in resources if r.get("resourceType") == "Patient"), None)
+        with self._lock:
+            cases = self._case_index()
+            if case_key in self._written:
+                # Already written in this run (rare): drop those lines right away
+                self._flush_all()
+                self._compact({cases[case_key], patient_id} - {None})
+            elif case_key in cases:
+                self._stale |= {cases[case_key], patient_id} - {None}
+
+            for resource in resources:
+                self._buffer(resource)
+            self._pending.append((case_key, patient_id, on_flushed))
+            self._written.add(case_key)
+            if self._buffered >= self.buffer_bytes:
+                self._flush_all()
+
+    def load(self) -> None:
+        """Load the case index, completing the replacements left by an interrupted run."""
+        with self._lock:
+            self._case_index()
+
+    def _buffer(self, resource: Dict[str, Any]) -> None:
+        line = to_json(resource) + b"\n"
+        self._buffers.setdefault(resource["resourceType"], []).append(line)
+        self._buffered += len(line)
+
+    def _case_index(self) -> Dict[str, Optional[str]]:
+        if self._cases is None:
+            self._cases = {}
+            try:
+                with open(self.directory / CASE_INDEX_NAME, "r", encoding="utf-8") as fh:
+                    for line in fh:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._cases[entry["case"]] = entry["patient_id"]
+            except FileNotFoundError:
+                pass
+            self._recover()
+        return self._cases
+
+    def _recover(self) -> None:
+        """Complete the drops of an interrupted run (see `_save_pending`)."""
+        try:
+            with open(self.directory / PENDING_NAME, "r", encoding="utf-8") as fh:
+                pending = json.load(fh)
+        except FileNotFoundError:
+            return
+        # Cases whose lines may have been flushed without being indexed
+        self._cases.update(pending["cases"])
+        self._stale = set(pending["stale"])
+        self._base_sizes = pending["base_sizes"]
+        logger.info(f"Completing the replacement of re-converted cases in {self.directory}")
+        self._compact()
+
+    def _save_pending(self) -> None:
+        """
+        Before lines are flushed, record what `close` still has to do: the patients to
+        drop, the file sizes before this run, and the cases about to be flushed.
+        """
+        pending = {
+            "stale": sorted(self._stale),
+            "base_sizes": self._base_sizes,
+            "cases": {case_key: patient_id for case_key, patient_id, _ in self._pending},
+        }
+        _replace_file(self.directory / PENDING_NAME, json.dumps(pending).encode("utf-8"))
+
+    def _compact(self, drop: Set[str] = frozenset()) -> None:
+        """
+        Rewrite the export files without the lines of stale patients written before this
+        run, and of `drop` anywhere; then rewrite the index with one line per case.
+        """
+        for fh in self._files.values():
+            fh.close()
+        self._files.clear()
+
+        dropped = 0
+        if self._stale or drop:
+            for path in ndjson_files(self.directory):
+                base = self._base_sizes.get(path.name, path.stat().st_size)
+                dropped += _rewrite_without(path, base, self._stale | drop, drop)
+        index = "".join(json.dumps({"case": case_key, "patient_id": patient_id}) + "\n"
+                        for case_key, patient_id in self._cases.items())
+        _replace_file(self.directory / CASE_INDEX_NAME, index.encode("utf-8"))
+        (self.directory / PENDING_NAME).unlink(missing_ok=True)
+        logger.info(f"Replaced {dropped} resource(s) of re-converted cases in {self.directory}")
+
+        # Every line now counts as written before the next drops
+        self._stale = set()
+        self._base_sizes = {}
+
+    def _open(self, resource_type: str) -> IO[bytes]:
+        fh = self._files.get(resource_type)
+        if fh is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.path(resource_type)
+            self._base_sizes.setdefault(path.name, path.stat().st_size if path.exists() else 0)
+            fh = open(path, "ab")
+            self._files[resource_type] = fh
+        return fh
+
+    def _flush_all(self) -> None:
+        for resource_type in self._buffers:
+            self._open(resource_type)
+        if self._pending or self._stale:
+            self._save_pending()
+
+        for resource_type, lines in self._buffers.items():
+            data = b"".join(lines)
+            # One complete gzip member per flush, so flushed lines stay readable if the process dies
+            self._files[resource_type].write(gzip.compress(data) if self.compress else data)
+        for fh in self._files.values():
+            fh.flush()
+        self._buffers.clear()
+        self._buffered = 0
+
+        pending, self._pending = self._pending, []
+        if pending:
+            with open(self.directory / CASE_INDEX_NAME, "a", encoding="utf-8") as fh:
+                for case_key, patient_id, _ in pending:
+                    fh.write(json.dumps({"case": case_key, "patient_id": patient_id}) + "\n")
+                    self._cases[case_key] = patient_id
+        for _, _, on_flushed in pending:
+            if on_flushed is not None:
+                on_flushed()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_all()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._cases is None:
+                return
+            self._flush_all()
+            if self._stale:
+                self._compact()
+            else:
+                for fh in self._files.values():
+                    fh.close()
+                self._files.clear()
+                (self.directory / PENDING_NAME).unlink(missing_ok=True)
+
+    def __enter__(self) -> "NDJSONBulkWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class NDJSONWriterPool:
+    """
+    One NDJSONBulkWriter per output directory (e.g. per disease), created on first use.
+    """
+
+    def __init__(self, compress: bool = False, buffer_bytes: int = DEFAULT_BUFFER_BYTES):
+        self.compress = compress
+        self.buffer_bytes = buffer_bytes
+        self._lock = threading.Lock()
+        self._writers: Dict[Path, NDJSONBulkWriter] = {}
+
+    def writer(self, directory: Path) -> NDJSONBulkWriter:
+        directory = Path(directory)
+        with self._lock:
+            writer = self._writers.get(directory)
+            if writer is None:
+                writer = NDJSONBulkWriter(directory, compress=self.compress, buffer_bytes=self.buffer_bytes)
+                self._writers[directory] = writer
+            return writer
+
+    def recover(self, output_dir: Path) -> None:
+        """
+        Complete the replacements left by an interrupted run in the exports under
+        `output_dir` (`<output_dir>/<disease>/`), including those no case is written to.
+        """
+        for pending in sorted(Path(output_dir).glob(f"*/{PENDING_NAME}")):
+            self.writer(pending.parent).load()
+
+    def close(self) -> None:
+        with self._lock:
+            for writer in self._writers.values():
+                writer.close()
+            logger.info(f"Closed {len(self._writers)} NDJSON export(s)")
+            self._writers.clear()
+
+    def __enter__(self) -> "NDJSONWriterPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def resource_patient_id(resource: Dict[str, Any]) -> Optional[str]:
+    """ID of the patient a resource belongs to."""
+    if resource.get("resourceType") == "Patient":
+        return resource.get("id")
+    subject = resource.get("subject") or resource.get("patient")
+    if isinstance(subject, list):
+        subject = subject[0] if subject else None
+    if not subject or not subject.get("reference"):
+        return None
+    return subject["reference"].split("/")[-1]
+
+
+def open_ndjson(path: Path) -> IO[str]:
+    """Open an NDJSON file for reading, gzip-compressed or not."""
+    path = Path(path)
+    if path.suffix == GZIP_SUFFIX:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def ndjson_files(directory: Path) -> List[Path]:
+    """`<resourceType>.ndjson[.gz]` files of an export directory, sorted by name."""
+    directory = Path(directory)
+    return sorted(list(directory.glob(f"*{NDJSON_SUFFIX}")) + list(directory.glob(f"*{NDJSON_SUFFIX}{GZIP_SUFFIX}")))
+
+
+def is_ndjson_export(path: Optional[Path]) -> bool:
+    return path is not None and Path(path).is_dir() and bool(ndjson_files(path))
+
+
+class _Head(io.RawIOBase):
+    """Raw reader over the next `size` bytes of a file."""
+
+    def __init__(self, fh: IO[bytes], size: int):
+        self._fh = fh
+        self._left = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._fh.read(min(len(buffer), self._left))
+        buffer[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+
+def _rewrite_without(path: Path, base: int, old_drop: Set[str], drop: Set[str]) -> int:
+    """
+    Rewrite an NDJSON file without the lines of `old_drop` patients in its first `base`
+    bytes and of `drop` patients after them. Returns the number of dropped lines.
+    """
+    compressed = path.suffix == GZIP_SUFFIX
+    tmp_path = path.with_name(path.name + ".tmp")
+    dropped = 0
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        for size, patient_ids in ((base, old_drop), (path.stat().st_size - base, drop)):
+            head = _Head(src, size)
+            if not patient_ids or not size:
+                shutil.copyfileobj(head, dst)
+                continue
+            reader = gzip.GzipFile(fileobj=head) if compressed else io.BufferedReader(head)
+            writer = gzip.GzipFile(fileobj=dst, mode="wb", mtime=0) if compressed else dst
+            for line in reader:
+                if line.strip() and resource_patient_id(from_json(line)) in patient_ids:
+                    dropped += 1
+                    continue
+                writer.write(line)
+            if compressed:
+                writer.close()
+    os.replace(tmp_path, path)
+    return dropped
+
+
+def _replace_file(path: Path, data: bytes) -> None:
+    """Write a file atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
@@ -26,6 +26,54 @@ Input text:
 Output ONLY the JSON structure following the schema exactly, without explanations or commentary.
 """
 
+TOOL_EXTRACTION_PROMPT = """You are a clinical data extraction model that converts free-text patient records into structured data compatible with FHIR.
+
+Extract entities from the input text and record them by calling the `{tool_name}` tool. If any entity or field is not mentioned in the text, set its value to null.
+
+Important rules:
+
+1. The "encounters" field is an array. Extract **all encounters** mentioned in the text.
+   - Each encounter must include its date (`encounter_date`) if mentioned; if not, estimate the year from context or set to null.
+   - Each observation and medication must belong to the encounter in which it occurred.
+
+2. All list fields must be arrays, even if there is only one element (e.g., laboratory tests, medications, family members).
+
+3. Do not add extra fields or commentary.
+
+Input text:
+{patient_record_text}
+"""
+
+SEGMENT_EXTRACTION_PROMPT = """You are a clinical data extraction model that converts free-text patient records into structured JSON compatible with FHIR.
+
+The input text is one segment of a longer patient record and contains {section}.
+Extract entities according to the provided schema. If any entity or field is not mentioned in the segment, set its value to None.
+
+Important rules for this schema:
+
+1. All list fields must be arrays, even if there is only one element.
+
+2. Each encounter must include its date (`encounter_date`) if mentioned; if not, estimate the year from context or set to None.
+
+3. Follow the schema exactly. Do not add extra fields or commentary.
+
+Schema:
+{schema}
+
+Input text:
+{patient_record_text}
+
+Output ONLY the JSON structure following the schema exactly, without explanations or commentary.
+"""
+
+PRE_EXTRACTED_PROMPT = """
+
+The following measurements were already extracted from the input text:
+{items}
+
+Do NOT repeat them in `laboratory` or `vital_sign`. Instead, add a "prefilled" array to each encounter listing the ids of the measurements taken in that encounter (e.g., "prefilled": ["V1", "L2"]). Only add laboratory tests and vital signs that are missing from this list.
+"""
+
 CASE_GENERATION_PROMPT = """
     You are a clinical case generation agent with medical and scientific accuracy.
     Your task is to create realistic clinical cases of patients with early-stage {disease}, written as plain text (no tables, no bullet points).
@@ -76,6 +124,14 @@ CASE_GENERATION_PROMPT = """
 
     """
 
+MULTI_CASE_GENERATION_PROMPT = """
+    *MULTIPLE CASES*
+
+    Generate {count} distinct cases following the rules above. Vary the patients' demographics, presentations and findings between cases.
+    Write each case on its own, and separate consecutive cases with a line containing only {delimiter}.
+    Do not number the cases or add any text before the first case or after the last one.
+    """
+
 PATIENT_INFO_PROMPT = """
     You are a medical information summarization specialist. Your task is to analyze the following FHIR Bundle and generate a **structured clinical summary** in JSON format. 
     
@@ -72,3 +72,40 @@ OUTPUT_SCHEMA = {
         "note": "string | None - optional general note about family history (e.g., 'Both parents and siblings are alive.')"
     }
 }
+
+
+_JSON_TYPES = {
+    "string": "string",
+    "float": "number",
+    "integer": "integer",
+    "boolean": "boolean",
+    "None": "null",
+}
+
+
+def build_json_schema(schema):
+    """
+    Convert the descriptive schema used in prompts (e.g. OUTPUT_SCHEMA) into JSON Schema.
+
+    Leaf descriptions of the form "<type> | None - <description>" become typed
+    properties, dicts become objects with all keys required, and single-element
+    lists become arrays of that element.
+    """
+    if isinstance(schema, dict):
+        return {
+            "type": "object",
+            "properties": {key: build_json_schema(value) for key, value in schema.items()},
+            "required": list(schema),
+        }
+    if isinstance(schema, list):
+        return {"type": "array", "items": build_json_schema(schema[0])}
+
+    type_part, _, description = schema.partition(" - ")
+    types = [_JSON_TYPES[t.strip()] for t in type_part.split("|")]
+    return {
+        "type": types[0] if len(types) == 1 else types,
+        "description": description.strip(),
+    }
+
+
+OUTPUT_JSON_SCHEMA = build_json_schema(OUTPUT_SCHEMA)
@@ -0,0 +1,197 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Sentinel returned by TerminologyCache.get when a term has never been resolved
+MISS = object()
+
+# Seconds between updates of an entry's access time on cache hits
+ACCESS_TIME_RESOLUTION = 3600
+# Fraction of max_entries kept by an eviction, so evictions (and row counts) stay rare
+EVICTION_TARGET = 0.9
+
+
+def normalize_term(term: str) -> str:
+    """
+    Normalize a lookup term so that trivially different spellings
+    ("Hemoglobin", " hemoglobin ", "HEMOGLOBIN") share a single cache entry.
+    """
+    return _WHITESPACE_RE.sub(" ", str(term)).strip().lower()
+
+
+class TerminologyCache:
+    """
+    Persistent SQLite-backed cache for terminology lookups (LOINC, SNOMED CT).
+
+    Entries are keyed on (code system, normalized term) and store the resolved
+    (code, display) pair. Lookups that returned no result are cached as well
+    (negative caching) with their own TTL, so a re-run over the same corpus
+    makes no network calls. The number of rows is bounded; when the limit is
+    exceeded, the least recently used entries are evicted. Access times are
+    only refreshed every ACCESS_TIME_RESOLUTION seconds, so hits are read-only.
+
+    The connection is opened lazily and re-opened after a fork, so a single
+    module-level instance can be shared by threads and worker processes.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            ttl: float = 30 * 24 * 3600,
+            negative_ttl: float = 24 * 3600,
+            max_entries: int = 100_000,
+            enabled: bool = True
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        # Upper bound on the number of rows: counted once, then incremented on every insert
+        self._rows: Optional[int] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS terms (
+                system TEXT NOT NULL,
+                term TEXT NOT NULL,
+                code TEXT,
+                display TEXT,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (system, term)
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS terms_accessed_at ON terms (accessed_at)")
+
+        self._conn = conn
+        self._pid = os.getpid()
+        self._rows = None
+        return conn
+
+    def get(self, system: str, term: str) -> Any:
+        """
+        Return the cached (code, display) pair, None for a cached negative result,
+        or MISS if the term is not cached or its entry has expired.
+        """
+        if not self.enabled:
+            return MISS
+
+        key = normalize_term(term)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT code, display, created_at, accessed_at FROM terms WHERE system = ? AND term = ?",
+                (system, key)
+            ).fetchone()
+            if row is None:
+                return MISS
+
+            code, display, created_at, accessed_at = row
+            ttl = self.ttl if code is not None else self.negative_ttl
+            if now - created_at > ttl:
+                conn.execute("DELETE FROM terms WHERE system = ? AND term = ?", (system, key))
+                return MISS
+
+            if now - accessed_at > ACCESS_TIME_RESOLUTION:
+                conn.execute(
+                    "UPDATE terms SET accessed_at = ? WHERE system = ? AND term = ?",
+                    (now, system, key)
+                )
+
+        if code is None:
+            return None
+        return code, display
+
+    def set(self, system: str, term: str, value: Optional[Tuple[str, str]]) -> None:
+        """
+        Store a lookup result. `None` (or a (None, None) pair) is stored as a negative entry.
+        """
+        if not self.enabled:
+            return
+
+        code, display = value if value else (None, None)
+        if code is None:
+            display = None
+
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO terms (system, term, code, display, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (system, normalize_term(term), code, display, now, now)
+            )
+            if self._rows is None:
+                (self._rows,) = conn.execute("SELECT COUNT(*) FROM terms").fetchone()
+            else:
+                # Also counts replaced entries and misses other processes' inserts: `_evict` recounts
+                self._rows += 1
+            if self._rows > self.max_entries:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        (count,) = conn.execute("SELECT COUNT(*) FROM terms").fetchone()
+        self._rows = count
+        if count <= self.max_entries:
+            return
+        overflow = count - int(self.max_entries * EVICTION_TARGET)
+        conn.execute(
+            "DELETE FROM terms WHERE rowid IN "
+            "(SELECT rowid FROM terms ORDER BY accessed_at LIMIT ?)",
+            (overflow,)
+        )
+        self._rows = count - overflow
+        logger.debug("Evicted %d terminology cache entries", overflow)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM terms")
+            self._rows = 0
+
+    def cached(self, system: str, miss: Any = None) -> Callable:
+        """
+        Decorator caching a lookup function `fn(term, ...) -> Optional[(code, display)]`.
+
+        Args:
+            system (str): Code system name used as part of the cache key.
+            miss (Any): Value the wrapped function returns when nothing was found;
+                it is also returned on a negative cache hit.
+        """
+        def decorator(fn: Callable) -> Callable:
+            @wraps(fn)
+            def wrapper(term: str, *args, **kwargs):
+                cached = self.get(system, term)
+                if cached is not MISS:
+                    return cached if cached is not None else miss
+
+                result = fn(term, *args, **kwargs)
+                found = result is not None and result != miss and result[0] is not None
+                self.set(system, term, result if found else None)
+                return result
+            return wrapper
+        return decorator